@@ -634,6 +634,10 @@ def run_marker_pdf_comparison(old_file, new_file):
             
             st.success("✅ Marker comparison complete!")
             
+            if result.get("failed_pages"):
+                failed = ", ".join(str(page_num) for page_num in result["failed_pages"])
+                st.warning(f"⚠️ Pages {failed} could not be compared completely; some of their changes may be missing.")
+            
             # Display summary
             changes = result["changes"]
             added = len(changes.get("added", []))
@@ -684,6 +688,14 @@ def run_marker_pdf_comparison(old_file, new_file):
                 st.code(traceback.format_exc())
 
 
+# Patterns shared by the highlighting helpers, compiled once at import
+_WATERMARK_RE = re.compile(r'\b[TFARD]\b')
+_WHITESPACE_RE = re.compile(r'\s+')
+_NUMBER_CHARS_RE = re.compile(r'[\d,()]+')
+_VALUE_RE = re.compile(r'[\(]?[\d,]+[\)]?')
+_WORD_RE = re.compile(r'\b\w{3,}\b')
+
+
 def clean_text_for_highlighting(text: str) -> list:
     """
     Clean text and extract multiple search candidates for highlighting.
@@ -700,27 +712,27 @@ def clean_text_for_highlighting(text: str) -> list:
         candidates.append(text)
     
     # 2. Remove watermark artifacts (T, F, A, R, D as standalone letters)
-    cleaned = re.sub(r'\b[TFARD]\b', '', text)
-    cleaned = re.sub(r'\s+', ' ', cleaned).strip()
+    cleaned = _WATERMARK_RE.sub('', text)
+    cleaned = _WHITESPACE_RE.sub(' ', cleaned).strip()
     if cleaned and cleaned != text and len(cleaned) > 2:
         candidates.append(cleaned)
     
     # 3. Extract numbers (for financial values)
-    numbers = re.findall(r'[\d,()]+', text)
+    numbers = _NUMBER_CHARS_RE.findall(text)
     for num in numbers:
         if len(num) > 1:  # At least 2 chars (like "1" or "-")
             candidates.append(num)
     
     # 4. Extract first significant number/value
     # Pattern: (370,308) or 370,308 or -370,308
-    value_match = re.search(r'[\(]?[\d,]+[\)]?', text)
+    value_match = _VALUE_RE.search(text)
     if value_match:
         value = value_match.group(0)
         if value not in candidates:
             candidates.append(value)
     
     # 5. Extract key words (for text changes)
-    words = re.findall(r'\b\w{3,}\b', text)  # Words 3+ chars
+    words = _WORD_RE.findall(text)  # Words 3+ chars
     if words and len(' '.join(words[:3])) > 5:
         candidates.append(' '.join(words[:3]))
     
@@ -856,15 +868,15 @@ def extract_changed_values(old_text: str, new_text: str) -> list:
         return []
     
     # Normalize: remove watermark artifacts and normalize whitespace
-    old_clean = re.sub(r'\b[TFARD]\b', '', old_text)
-    old_clean = re.sub(r'\s+', ' ', old_clean).strip()
-    new_clean = re.sub(r'\b[TFARD]\b', '', new_text)
-    new_clean = re.sub(r'\s+', ' ', new_clean).strip()
+    old_clean = _WATERMARK_RE.sub('', old_text)
+    old_clean = _WHITESPACE_RE.sub(' ', old_clean).strip()
+    new_clean = _WATERMARK_RE.sub('', new_text)
+    new_clean = _WHITESPACE_RE.sub(' ', new_clean).strip()
     
     # Extract all numeric values with their positions
     # Pattern: matches numbers like 137,260, (111,125), -370,308, etc.
-    old_matches = list(re.finditer(r'[\(]?[\d,]+[\)]?', old_clean))
-    new_matches = list(re.finditer(r'[\(]?[\d,]+[\)]?', new_clean))
+    old_matches = list(_VALUE_RE.finditer(old_clean))
+    new_matches = list(_VALUE_RE.finditer(new_clean))
     
     old_values = [m.group(0) for m in old_matches]
     new_values = [m.group(0) for m in new_matches]
@@ -890,13 +902,13 @@ def extract_changed_values(old_text: str, new_text: str) -> list:
     # Strategy 3: For text changes (non-numeric), find new words
     # Extract meaningful words (3+ chars, not common words)
     common_words = {'the', 'and', 'for', 'account', 'current', 'at', 'to', 'of', 'in', 'on'}
-    old_words = set(w.lower() for w in re.findall(r'\b\w{3,}\b', old_clean.lower()) if w not in common_words)
-    new_words = set(w.lower() for w in re.findall(r'\b\w{3,}\b', new_clean.lower()) if w not in common_words)
+    old_words = set(w.lower() for w in _WORD_RE.findall(old_clean.lower()) if w not in common_words)
+    new_words = set(w.lower() for w in _WORD_RE.findall(new_clean.lower()) if w not in common_words)
     
     added_words = new_words - old_words
     if added_words:
         # Get actual words from new_text (with original case)
-        for word in re.findall(r'\b\w{3,}\b', new_clean):
+        for word in _WORD_RE.findall(new_clean):
             if word.lower() in added_words:
                 changed.append(word)
     
@@ -1047,7 +1059,7 @@ def _find_text_block_by_extraction(page, search_text, context_before="", context
         return None
     
     # Normalize search text (remove newlines, normalize spaces)
-    search_normalized = re.sub(r'\s+', ' ', search_text.replace('\n', ' ').replace('\r', ' ')).strip()
+    search_normalized = _WHITESPACE_RE.sub(' ', search_text.replace('\n', ' ').replace('\r', ' ')).strip()
     search_words = search_normalized.split()
     
     if len(search_words) < 5:
@@ -1124,7 +1136,7 @@ def _find_complete_text_block(page, full_text, context_before="", context_after=
     # This is the key fix - page.search_for() doesn't handle \n well
     text_for_search = full_text.replace('\n', ' ').replace('\r', ' ')
     # Normalize multiple spaces
-    text_for_search = re.sub(r'\s+', ' ', text_for_search).strip()
+    text_for_search = _WHITESPACE_RE.sub(' ', text_for_search).strip()
     
     # Build comprehensive list of search variants (longer snippets first for better matching)
     search_variants = []
@@ -1901,7 +1913,7 @@ def create_highlighted_pdf_page_by_page(old_pdf_bytes: bytes, new_pdf_bytes: byt
                 if not instances:
                     # Try direct search
                     text_no_newlines = search_text.replace('\n', ' ').replace('\r', ' ')
-                    text_no_newlines = re.sub(r'\s+', ' ', text_no_newlines).strip()
+                    text_no_newlines = _WHITESPACE_RE.sub(' ', text_no_newlines).strip()
                     if len(text_no_newlines) <= 1000:
                         instances = page.search_for(text_no_newlines, quads=True)
             else:
@@ -2147,7 +2159,7 @@ def create_highlighted_pdf_page_by_page(old_pdf_bytes: bytes, new_pdf_bytes: byt
                     try:
                         # Clean and limit search text
                         clean_search = search_text.replace('\n', ' ').replace('\r', ' ')
-                        clean_search = re.sub(r'\s+', ' ', clean_search).strip()
+                        clean_search = _WHITESPACE_RE.sub(' ', clean_search).strip()
                         if len(clean_search) > 100:
                             clean_search = clean_search[:100]
                         
@@ -2207,8 +2219,8 @@ def create_highlighted_pdf_from_llm_changes(pdf_bytes: bytes, changes: dict) ->
             # Highlight each changed value individually
             for value in changed_values:
                 # Clean the value (remove watermark artifacts)
-                clean_value = re.sub(r'\b[TFARD]\b', '', str(value)).strip()
-                clean_value = re.sub(r'\s+', ' ', clean_value)
+                clean_value = _WATERMARK_RE.sub('', str(value)).strip()
+                clean_value = _WHITESPACE_RE.sub(' ', clean_value)
                 
                 if clean_value and len(clean_value) >= 2:
                     # Try highlighting with context
@@ -2216,7 +2228,7 @@ def create_highlighted_pdf_from_llm_changes(pdf_bytes: bytes, changes: dict) ->
                     
                     # If that failed, try just the numeric part
                     if not highlighted:
-                        numeric = re.search(r'[\d,()]+', clean_value)
+                        numeric = _NUMBER_CHARS_RE.search(clean_value)
                         if numeric:
                             highlight_with_context(doc, numeric.group(0), field, COLOR_MODIFIED)
         else:
@@ -2298,8 +2310,8 @@ def create_highlighted_pdf_from_llm_changes(pdf_bytes: bytes, changes: dict) ->
             # Highlight each changed value individually
             for value in changed_values:
                 # Clean the value (remove watermark artifacts)
-                clean_value = re.sub(r'\b[TFARD]\b', '', str(value)).strip()
-                clean_value = re.sub(r'\s+', ' ', clean_value)
+                clean_value = _WATERMARK_RE.sub('', str(value)).strip()
+                clean_value = _WHITESPACE_RE.sub(' ', clean_value)
                 
                 if clean_value and len(clean_value) >= 2:
                     # Try highlighting with context
@@ -2307,7 +2319,7 @@ def create_highlighted_pdf_from_llm_changes(pdf_bytes: bytes, changes: dict) ->
                     
                     # If that failed, try just the numeric part
                     if not highlighted:
-                        numeric = re.search(r'[\d,()]+', clean_value)
+                        numeric = _NUMBER_CHARS_RE.search(clean_value)
                         if numeric:
                             highlight_with_context(doc, numeric.group(0), field, COLOR_MODIFIED)
         else:
@@ -15,7 +15,33 @@ class Config:
     AZURE_OPENAI_API_KEY = os.getenv("AZURE_OPENAI_API_KEY")
     AZURE_OPENAI_ENDPOINT = os.getenv("AZURE_OPENAI_ENDPOINT")
     AZURE_OPENAI_DEPLOYMENT = os.getenv("AZURE_OPENAI_DEPLOYMENT")
-    AZURE_OPENAI_API_VERSION = os.getenv("AZURE_OPENAI_API_VERSION", "2024-02-15-preview")
+    AZURE_OPENAI_API_VERSION = os.getenv("AZURE_OPENAI_API_VERSION", "2024-10-21")
+    
+    # Optional directory for a persistent LLM result cache (requires diskcache)
+    LLM_CACHE_DIR = os.getenv("LLM_CACHE_DIR")
+    # Seconds before persisted LLM results expire (unset = never)
+    LLM_CACHE_TTL = int(os.getenv("LLM_CACHE_TTL", "0")) or None
+    
+    # Optional directory for persisting PDF-to-Markdown conversions across runs
+    PDF2MD_CACHE_DIR = os.getenv("PDF2MD_CACHE_DIR")
+    
+    # Send bulk async LLM traffic through aiohttp instead of the SDK's httpx transport
+    HIGH_CONCURRENCY_MODE = os.getenv("HIGH_CONCURRENCY_MODE", "false").lower() in ("1", "true", "yes")
+    
+    # Print diagnostics such as LLM changes dropped as unchanged
+    DEBUG = os.getenv("DEBUG", "false").lower() in ("1", "true", "yes")
+    
+    # Find PDF page changes with a classical diff; the LLM only judges and locates them
+    PDF_DIFF_PREFILTER = os.getenv("PDF_DIFF_PREFILTER", "false").lower() in ("1", "true", "yes")
+    
+    # find_tables strategy tried first in the standard PDF comparison; pages where it
+    # finds no tables are retried with PyMuPDF's default "lines" strategy
+    PDF_TABLE_STRATEGY = os.getenv("PDF_TABLE_STRATEGY", "lines_strict")
+    
+    # Deployment quotas for async requests (unset = unlimited)
+    AZURE_MAX_INFLIGHT = int(os.getenv("AZURE_MAX_INFLIGHT", "0")) or None
+    AZURE_RPM = int(os.getenv("AZURE_RPM", "0")) or None
+    AZURE_TPM = int(os.getenv("AZURE_TPM", "0")) or None
     
     # File size limit (20 MB)
     MAX_FILE_SIZE_MB = 20
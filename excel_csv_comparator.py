@@ -4,10 +4,14 @@ Handles simple row-by-row comparison using LLM and generates Change table.
 """
 import pandas as pd
 import io
-import json
 import re
 
 
+# Build the output workbook in memory: results are returned as bytes, so there is
+# no need for xlsxwriter to stage worksheet XML in temporary files.
+XLSX_ENGINE_KWARGS = {"options": {"in_memory": True}}
+
+
 class ExcelCSVComparator:
     """Handles Excel and CSV version comparison with simple row-by-row approach using LLM."""
     
@@ -124,6 +128,8 @@ Return a JSON object with an array of change objects, each containing the index
 - The index must match exactly the index from the input row pair
 - Return ONLY valid JSON."""
 
+        from llm_client import parse_response_json, to_prompt_json
+        
         # Prepare data for LLM - simple index-based matching
         rows_data = []
         for i in range(len(old_rows)):
@@ -145,7 +151,7 @@ Return a JSON object with an array of change objects, each containing the index
 **CRITICAL: Return an array of objects with "index" and "change". Include ALL {len(rows_data)} row pairs with their exact index numbers.**
 
 Row pairs (index, old, new):
-{json.dumps(rows_data, indent=2)}
+{to_prompt_json(rows_data)}
 
 Return JSON: {{"changes": [{{"index": 0, "change": ""}}, {{"index": 1, "change": "ColumnName: old → new (diff)"}}, ...]}} with exactly {len(rows_data)} objects, each with the correct index."""
 
@@ -177,7 +183,7 @@ Return JSON: {{"changes": [{{"index": 0, "change": ""}}, {{"index": 1, "change":
             if json_start and json_end:
                 content = "\n".join(lines[json_start:json_end])
         
-        result = json.loads(content)
+        result = parse_response_json(content)
         changes_list = result.get("changes", [])
         # import pdb; pdb.set_trace()
 
@@ -453,55 +459,48 @@ Return JSON: {{"changes": [{{"index": 0, "change": ""}}, {{"index": 1, "change":
                 break
         
         # Write data rows (starting from row 2)
-        max_rows = max(len(aligned_old_df), len(aligned_new_df), len(change_df))
+        # Each table segment is written with a single write_row() call per row;
+        # ROW ADDED / ROW REMOVED rows pass the row format for the whole Change table.
+        old_values = aligned_old_df.values.tolist()
+        new_values = aligned_new_df.values.tolist()
+        change_values = change_df.values.tolist()
+        max_rows = max(len(old_values), len(new_values), len(change_values))
         
         for row_idx in range(max_rows):
+            excel_row = row_idx + 2
+            
             # Write v0.5 data
-            if row_idx < len(aligned_old_df):
-                for col_idx, col_name in enumerate(aligned_old_df.columns):
-                    val = aligned_old_df.iloc[row_idx, col_idx]
-                    worksheet.write(row_idx + 2, v05_start_col + col_idx, val)
+            if row_idx < len(old_values):
+                worksheet.write_row(excel_row, v05_start_col, old_values[row_idx])
             
             # Write v1 data
-            if row_idx < len(aligned_new_df):
-                for col_idx, col_name in enumerate(aligned_new_df.columns):
-                    val = aligned_new_df.iloc[row_idx, col_idx]
-                    worksheet.write(row_idx + 2, v1_start_col + col_idx, val)
+            if row_idx < len(new_values):
+                worksheet.write_row(excel_row, v1_start_col, new_values[row_idx])
             
             # Write Change data with color formatting
-            if row_idx < len(change_df):
-                change_val = change_df.iloc[row_idx]['Change']
+            if row_idx < len(change_values):
+                row_values = change_values[row_idx]
+                change_val = row_values[change_col_idx] if change_col_idx is not None else ""
                 has_change = change_val and str(change_val).strip()
                 
-                if has_change:
-                    change_str = str(change_val).strip().upper()
-                    
-                    # Determine format based on change type
-                    if 'ROW REMOVED' in change_str:
-                        # Format entire row in red
-                        for col_idx, col_name in enumerate(change_df.columns):
-                            val = change_df.iloc[row_idx, col_idx]
-                            worksheet.write(row_idx + 2, change_start_col + col_idx, val, row_removed_format)
-                    elif 'ROW ADDED' in change_str:
-                        # Format entire row in green
-                        for col_idx, col_name in enumerate(change_df.columns):
-                            val = change_df.iloc[row_idx, col_idx]
-                            worksheet.write(row_idx + 2, change_start_col + col_idx, val, row_added_format)
-                    else:
-                        # Value changed - format only the Change column cell in yellow
-                        for col_idx, col_name in enumerate(change_df.columns):
-                            val = change_df.iloc[row_idx, col_idx]
-                            if col_idx == change_col_idx:
-                                # Highlight only the Change column cell
-                                worksheet.write(row_idx + 2, change_start_col + col_idx, val, value_changed_format)
-                            else:
-                                # Other columns without formatting
-                                worksheet.write(row_idx + 2, change_start_col + col_idx, val)
-                else:
+                if not has_change:
                     # No change - write all columns without formatting
-                    for col_idx, col_name in enumerate(change_df.columns):
-                        val = change_df.iloc[row_idx, col_idx]
-                        worksheet.write(row_idx + 2, change_start_col + col_idx, val)
+                    worksheet.write_row(excel_row, change_start_col, row_values)
+                    continue
+                
+                change_str = str(change_val).strip().upper()
+                
+                # Determine format based on change type
+                if 'ROW REMOVED' in change_str:
+                    # Format entire row in red
+                    worksheet.write_row(excel_row, change_start_col, row_values, row_removed_format)
+                elif 'ROW ADDED' in change_str:
+                    # Format entire row in green
+                    worksheet.write_row(excel_row, change_start_col, row_values, row_added_format)
+                else:
+                    # Value changed - plain row, then highlight only the Change column cell in yellow
+                    worksheet.write_row(excel_row, change_start_col, row_values)
+                    worksheet.write(excel_row, change_start_col + change_col_idx, change_val, value_changed_format)
     
     def compare_csv_files(self, old_csv_bytes: bytes, new_csv_bytes: bytes) -> dict:
         """
@@ -522,7 +521,7 @@ Return JSON: {{"changes": [{{"index": 0, "change": ""}}, {{"index": 1, "change":
         
         # Generate output Excel with single sheet containing 3 tables side-by-side
         output = io.BytesIO()
-        with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
+        with pd.ExcelWriter(output, engine='xlsxwriter', engine_kwargs=XLSX_ENGINE_KWARGS) as writer:
             workbook = writer.book
             worksheet = workbook.add_worksheet('Comparison')
             
@@ -570,7 +569,7 @@ Return JSON: {{"changes": [{{"index": 0, "change": ""}}, {{"index": 1, "change":
         
         # Generate output Excel
         output = io.BytesIO()
-        with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
+        with pd.ExcelWriter(output, engine='xlsxwriter', engine_kwargs=XLSX_ENGINE_KWARGS) as writer:
             workbook = writer.book
             
             # Process each sheet (use max number of sheets)
@@ -2,6 +2,7 @@
 Optimized LLM prompt for Excel/CSV file comparison.
 This prompt is designed to detect all types of changes between file versions.
 """
+import sys
 
 EXCEL_CSV_COMPARISON_PROMPT = """You are an expert data comparison assistant specializing in Excel and CSV file version comparison. Your task is to systematically compare two versions of tabular data and identify EVERY change with precision.
 
@@ -13,6 +14,11 @@ Compare the OLD and NEW versions of the file(s) and detect ALL differences, incl
 4. **Sheet changes** (Excel only) - Entire sheets added or removed
 5. **Data type changes** - When a value changes type (e.g., text to number)
 
+## INPUT FORMAT
+Each sheet lists its shape and columns, followed by its data in one of two encodings:
+- **CSV**: a header line, then one line per row; the first column `row_index` is the 0-based row_index to use in your response
+- **JSON array**: one object per row; its `row_index` field is the 0-based row_index to use in your response
+
 ## COMPARISON METHODOLOGY
 
 ### Step 1: Sheet-Level Analysis (Excel Only)
@@ -30,126 +36,26 @@ For each sheet/dataframe, compare column structure:
 
 ### Step 3: Row Matching and Analysis (CRITICAL - FOLLOW THIS EXACT PROCESS)
 
-**THIS IS THE MOST IMPORTANT STEP. You MUST follow this exact two-phase process:**
-
-#### PHASE 1: Content-Based Matching (Primary Strategy - DO THIS FIRST)
-**Process each row in NEW file ONE BY ONE, in order (row 0, then row 1, then row 2, etc.):**
-
-**For EACH NEW row, follow this exact step-by-step process:**
-
-1. **Extract COMPLETE row content:**
-   - Take ALL column values from the NEW row
-   - Convert each value to string (handle null/empty as empty string "")
-   - Note: You need the COMPLETE row, not just one column
-
-2. **Search OLD file for matching row (compare ENTIRE row content):**
-   - Compare this NEW row's COMPLETE content with EACH row in OLD file (one by one)
-   - **Matching Rules (CRITICAL - Character-by-Character):**
-     - **EXACT MATCH**: ALL columns have IDENTICAL values (compare every character)
-       - Example: NEW: ["Team1", "GPU1", "Leader1"] vs OLD: ["Team1", "GPU1", "Leader1"] → EXACT MATCH
-     - **NEAR-EXACT MATCH**: MOST columns match (at least 2/3 or more), only 1-2 columns differ
-       - Example: NEW: ["Team1", "GPU2", "Leader1"] vs OLD: ["Team1", "GPU1", "Leader1"] → NEAR-EXACT (2 out of 3 match)
-     - **NO MATCH**: Row content is completely different or only partial values match
-       - ❌ WRONG: Matching just because "43" appears in both rows → This is NOT a match
-       - ❌ WRONG: Matching just because one column value matches → Need MOST columns to match
-       - ✅ CORRECT: Only match if MOST or ALL columns have matching values
-
-3. **Character-by-Character Comparison (MANDATORY):**
-   - When comparing values, compare EVERY SINGLE CHARACTER
-   - "ssh -p 20000 user@213.180.0.45" ≠ "ssh -p 20000 user@213.180.0.46" (different IP - last digit differs)
-   - "Team1" ≠ "team1" (case-sensitive)
-   - Empty string "" ≠ null ≠ " " (whitespace)
-   - **Be precise - a single character difference means the values don't match**
-
-4. **If EXACT MATCH found (all columns identical):**
-   - **Mark this NEW row as "MATCHED"** and record which OLD row it matched with
-   - **Mark the matched OLD row as "USED"** so it's not matched again
-   - **Position doesn't matter** - if content matches exactly, it's the same row (just moved)
-   - **Report NO changes** (or "-") - the row is identical, just at a different position
-   - **Use row_index = NEW row's position (0-based)**
-   - **Use row_identifier = value from first column of NEW row (for context only)**
-
-5. **If NEAR-EXACT MATCH found (most columns match, 1-2 differ):**
-   - **Mark this NEW row as "MATCHED"** and record which OLD row it matched with
-   - **Mark the matched OLD row as "USED"** so it's not matched again
-   - **Position doesn't matter** - if content mostly matches, it's the same row (possibly moved and modified)
-   - **Compare cell-by-cell** between the matched OLD row and NEW row
-   - **Report ONLY the cells that actually changed** (character-by-character comparison)
-   - **Do NOT report unchanged columns** - only report what changed
-   - **Use row_index = NEW row's position (0-based)**
-   - **Use row_identifier = value from first column of NEW row (for context only)**
-   - **Example:**
-     ```
-     NEW Row 11 (index 10): Team="thevisualarchitects", GPU="ssh -p 20430 user@8.34.124.122", Leader=""
-     OLD Row 11 (index 10): Team="thevisualarchitects", GPU="ssh -p 20430 user@8.34.124.122", Leader="Muhid Qaiser"
-     → NEAR-EXACT MATCH (2 out of 3 columns match)
-     → Only Leader changed (removed)
-     → Report: row_index=10, column_name="Leader", old_value="Muhid Qaiser", new_value="", change_type="value_removed"
-     → Do NOT report Team or GPU (they didn't change)
-     ```
-
-6. **If NO MATCH found:**
-
-7. **If NO MATCH found:**
-   - **Mark this NEW row as "UNMATCHED"**
-   - **Do NOT report any changes yet** - wait for Phase 2
-   - Continue to next NEW row
-
-**Critical Rules for Content Matching:**
-- **DO NOT rely on any single column (like first column or ID) for matching**
-- **Compare the ENTIRE row content, not just one column**
-- **A row matches only if MOST or ALL of its content matches another row**
-- **Partial matches (like a number appearing in both) are NOT valid matches**
-- **If content matches (exact or near-exact), position doesn't matter - it's the same row**
-- **For EXACT matches: Report NO changes (even if position differs)**
-- **For NEAR-EXACT matches: Report ONLY the columns that changed (do NOT report unchanged columns)**
-- **Process rows ONE AT A TIME, step by step**
-
-#### PHASE 2: Position-Based Matching for Unmatched Rows
-**For rows that were UNMATCHED in Phase 1:**
-
-1. **Match by row position (row number):**
-   - Take the NEW row's position (row_index in NEW file)
-   - Check if OLD file has a row at the SAME position (same row_index)
-   - **If position matches:**
-     - This means the row at this position was COMPLETELY CHANGED
-     - Compare the OLD row at this position with the NEW row at this position
-     - **Report ALL columns as changed** (even if some values are the same, report them all)
-     - Use change_type: "value_changed" for each column
-     - **Example:**
-       ```
-       NEW Row 10 (index 9): Team="thenextvisionrdinterns", GPU="ssh -p 20427 user@8.34.124.122", Leader="Muhid Qaiser"
-       OLD Row 10 (index 9): Team="oldteam", GPU="oldgpu", Leader="Mohammad Anas Siddiqui"
-       → Position matches (both at index 9)
-       → Report ALL columns as changed:
-         - row_index=9, column_name="Team", old_value="oldteam", new_value="thenextvisionrdinterns"
-         - row_index=9, column_name="GPU", old_value="oldgpu", new_value="ssh -p 20427 user@8.34.124.122"
-         - row_index=9, column_name="Leader", old_value="Mohammad Anas Siddiqui", new_value="Muhid Qaiser"
-       ```
-
-2. **If position does NOT match:**
-   - Check if OLD file has fewer rows than NEW file at this position
-   - **If NEW row position > OLD file length:**
-     - This is a **NEW ROW ADDED**
-     - Report in row_changes.added with full row_data
-     - Use the NEW row's position (row_index) - 0-based
-     - **Example:**
-       ```
-       NEW file has 16 rows, OLD file has 15 rows
-       NEW Row 16 (index 15): Team="visionx", GPU="ssh -p 10904 user@38.29.145.16"
-       → Position 15 doesn't exist in OLD (OLD only has 0-14)
-       → Report: row_index=15, row_data={...}, "ROW ADDED"
-       ```
-   - **If OLD row position > NEW file length:**
-     - This row was **REMOVED** from OLD
-     - Report in row_changes.removed with full row_data from OLD
-
-#### Summary of Matching Strategy:
-1. **First**: Match by content (search all OLD rows for matching content)
-2. **For matched rows**: Report only changed cells
-3. **For unmatched rows**: Match by position
-4. **If position matches**: Report all columns as changed (completely changed row)
-5. **If position doesn't match**: Determine if added (NEW longer) or removed (OLD longer)
+**THIS IS THE MOST IMPORTANT STEP. Process each NEW row ONE AT A TIME, in order (row 0, then row 1, ...), through two phases. Never use the first column or any single column as a primary key.**
+
+#### PHASE 1: Content-Based Matching (DO THIS FIRST)
+For each NEW row, compare its COMPLETE content (all columns, null/empty as "") with EACH OLD row not yet marked "USED":
+- **EXACT MATCH**: ALL columns identical → mark NEW row MATCHED and the OLD row USED. Position doesn't matter (the row just moved): report NO changes
+- **NEAR-EXACT MATCH**: MOST columns match (at least 2/3), only 1-2 differ → mark MATCHED/USED, compare cell-by-cell and report ONLY the cells that changed, never the unchanged ones
+- **NO MATCH**: otherwise → mark UNMATCHED, report nothing yet, continue with the next NEW row
+- ❌ Never match because one value (like "43") or one column appears in both rows; MOST or ALL columns must match
+
+**Compare character-by-character**: a single character difference means the values differ
+- "ssh -p 20000 user@213.180.0.45" ≠ "ssh -p 20000 user@213.180.0.46"
+- "Team1" ≠ "team1" (case-sensitive)
+- Empty string "" ≠ null ≠ " " (whitespace)
+
+#### PHASE 2: Position-Based Matching (ONLY for UNMATCHED rows)
+1. **If OLD has a row at the SAME row_index**: the row was COMPLETELY CHANGED. Report ALL columns as changed (change_type "value_changed"), even values that happen to be equal
+2. **If NEW row_index >= OLD row count**: ROW ADDED, report in row_changes.added with full row_data
+3. **If an OLD row_index >= NEW row count**: ROW REMOVED, report in row_changes.removed with full row_data from OLD
+
+For every change: row_index = NEW row's 0-based position; row_identifier = first column value of the NEW row (context only)
 
 ### Step 4: Cell-by-Cell Value Comparison
 For matched rows, compare each cell systematically:
@@ -247,55 +153,8 @@ For matched rows, compare each cell systematically:
 - If sheet names match, compare cell-by-cell
 - If sheet name changed but content is similar, mark as renamed (in column_changes.renamed)
 
-`### Row Matching Strategy (MANDATORY - FOLLOW EXACTLY, STEP BY STEP)
-
-**YOU MUST FOLLOW THIS TWO-STEP PROCESS SEQUENTIALLY:**
-
-#### STEP 1: Content Matching (Do This FIRST - One Row at a Time)
-**Process each NEW row individually, in order:**
-
-For NEW row at index 0:
-1. Extract ALL column values from this row
-2. Compare the COMPLETE row content (all columns together) with EACH row in OLD file
-3. **Match Criteria:**
-   - Compare character-by-character for each column value
-   - A row matches if MOST or ALL columns have identical values
-   - ❌ DO NOT match just because one value (like "43") appears in both rows
-   - ❌ DO NOT match just because first column matches - compare ALL columns
-   - ✅ Match only if the ENTIRE row content is similar (most columns match)
-4. If match found:
-   - Mark as MATCHED
-   - Compare cell-by-cell, report only changed cells
-   - Use NEW row's position for row_index (0-based)
-   - Mark matched OLD row as "USED"
-5. If no match found:
-   - Mark as UNMATCHED
-   - Move to next NEW row
-
-Repeat for NEW row at index 1, then index 2, etc. (one at a time)
-
-#### STEP 2: Position Matching (Do This SECOND - Only for Unmatched Rows)
-**ONLY process rows marked as UNMATCHED from Step 1:**
-
-For each UNMATCHED NEW row:
-1. Check if OLD file has a row at the SAME position (same row_index)
-2. **If position matches:**
-   - Row was COMPLETELY CHANGED at this position
-   - Report ALL columns as changed (every single column)
-   - Use change_type: "value_changed" for each column
-3. **If position doesn't match:**
-   - If NEW position >= OLD file length → ROW ADDED (report in row_changes.added)
-   - If OLD position >= NEW file length → ROW REMOVED (report in row_changes.removed)
-
-#### Critical Rules:
-- **DO NOT use first column or any single column as primary key for matching**
-- **Compare ENTIRE row content, character-by-character**
-- **Process rows ONE AT A TIME, not all at once**
-- **row_index is ALWAYS 0-based** (first data row = 0, Excel row 2 = index 0)
-- **row_index refers to position in NEW file**
-- **row_identifier is the first column value of the NEW row (for context only)**
-- **For completely changed rows, report ALL columns, not just some**
-- **For added rows, use the actual position in NEW file (last row = highest row_index)**
+### Row Matching Strategy
+Follow the two-phase process in Step 3 exactly: content first, then position for unmatched rows.
 
 ### Column Matching Strategy
 1. **Exact Name Match**: Match columns by exact name
@@ -339,116 +198,37 @@ For each UNMATCHED NEW row:
 
 ## EXAMPLES
 
-### Example 1: Content-Matched Row with Change (Step 3.1)
-**Processing NEW row at index 4:**
-NEW Row 5 (index 4): Team="knearestsiraiki", GPU="ssh -p 20000 user@213.180.0.46", Leader="Ahad Hassan"
-
-**Step 3.1: Content Matching**
-- Compare with OLD Row 1 (index 0): Team="733c" → NO MATCH (Team differs)
-- Compare with OLD Row 2 (index 1): Team="asa" → NO MATCH (Team differs)
-- ... (continue comparing with all OLD rows)
-- Compare with OLD Row 6 (index 5): Team="knearestsiraiki", GPU="ssh -p 20000 user@213.180.0.45", Leader="Ahad Hassan"
-  → Team matches ✓, Leader matches ✓, GPU differs ✗
-  → MOST columns match (2 out of 3) → NEAR-EXACT MATCH FOUND!
-  → Mark as MATCHED (position doesn't matter - content matches)
-
-**Compare cell-by-cell:**
-- Team: "knearestsiraiki" == "knearestsiraiki" → No change (do NOT report)
-- GPU: "ssh -p 20000 user@213.180.0.46" ≠ "ssh -p 20000 user@213.180.0.45" → Changed (character-by-character: ".46" ≠ ".45")
-- Leader: "Ahad Hassan" == "Ahad Hassan" → No change (do NOT report)
-
-**Report:** {"row_index": 4, "column_name": "GPU", "old_value": "ssh -p 20000 user@213.180.0.45", "new_value": "ssh -p 20000 user@213.180.0.46", "change_type": "value_changed", "row_identifier": "knearestsiraiki"}
-→ Note: Only GPU is reported, Team and Leader are NOT reported (they didn't change)
-
-### Example 1b: Content-Matched Row with No Changes (Moved Row)
-**Processing NEW row at index 9:**
-NEW Row 10 (index 9): Team="thenextvisionrdinterns", GPU="ssh -p 20427 user@8.34.124.122", Leader="Muhid Qaiser"
-
-**Step 3.1: Content Matching**
-- Compare with ALL OLD rows
-- OLD Row 10 (index 9): Team="thenextvisionrdinterns", GPU="ssh -p 20427 user@8.34.124.122", Leader="Muhid Qaiser"
-  → Team matches ✓, GPU matches ✓, Leader matches ✓
-  → ALL columns match → EXACT MATCH FOUND!
-  → Mark as MATCHED
-  → Position may differ, but content is identical → Report NO changes
-
-**Compare cell-by-cell:**
-- Team: "thenextvisionrdinterns" == "thenextvisionrdinterns" → No change
-- GPU: "ssh -p 20427 user@8.34.124.122" == "ssh -p 20427 user@8.34.124.122" → No change
-- Leader: "Muhid Qaiser" == "Muhid Qaiser" → No change
-
-**Report:** "-" (no changes) or empty
-→ Note: Even though position might differ, content is identical, so no changes reported
-
-### Example 2: Partially Matched Row (Step 3.1)
-**Processing NEW row at index 10:**
-NEW Row 11 (index 10): Team="thevisualarchitects", GPU="ssh -p 20430 user@8.34.124.122", Leader=""
-
-**Step 3.1: Content Matching**
-- Compare with ALL OLD rows (one by one)
-- OLD Row 11 (index 10): Team="thevisualarchitects", GPU="ssh -p 20430 user@8.34.124.122", Leader="Muhid Qaiser"
-  → Team matches ✓, GPU matches ✓, Leader differs ✗ (empty vs "Muhid Qaiser")
-  → MOST columns match (2 out of 3) → NEAR-EXACT MATCH FOUND!
-  → Mark as MATCHED (position doesn't matter - content mostly matches)
-
-**Compare cell-by-cell:**
-- Team: "thevisualarchitects" == "thevisualarchitects" → No change (do NOT report)
-- GPU: "ssh -p 20430 user@8.34.124.122" == "ssh -p 20430 user@8.34.124.122" → No change (do NOT report)
-- Leader: "" ≠ "Muhid Qaiser" → Changed (removed)
-
-**Report:** {"row_index": 10, "column_name": "Leader", "old_value": "Muhid Qaiser", "new_value": "", "change_type": "value_removed", "row_identifier": "thevisualarchitects"}
-→ Note: Only Leader is reported, Team and GPU are NOT reported (they didn't change)
-
-### Example 2b: Completely Changed Row (Step 3.1 → Step 3.2)
-**Processing NEW row at index 9:**
-NEW Row 10 (index 9): Team="completelynew", GPU="completelynewgpu", Leader="Completely New Leader"
-
-**Step 3.1: Content Matching**
-- Compare with ALL OLD rows (one by one)
-- OLD Row 10 (index 9): Team="oldteam", GPU="oldgpu", Leader="Old Leader"
-  → Team differs ✗, GPU differs ✗, Leader differs ✗
-  → NO columns match → NO MATCH
-- Compare with other OLD rows → NO MATCH found anywhere
-- Mark as UNMATCHED
-
-**Step 3.2: Position Matching**
-- Check position: NEW index 9, does OLD have row at index 9? → YES
-- Position matches → Row was COMPLETELY CHANGED at this position
-- Report ALL columns as changed:
+### Example 1: Row Matching (Step 3)
+OLD rows include:
+- index 5: Team="knearestsiraiki", GPU="ssh -p 20000 user@213.180.0.45", Leader="Ahad Hassan"
+- index 9: Team="oldteam", GPU="oldgpu", Leader="Old Leader"
+- index 10: Team="thevisualarchitects", GPU="ssh -p 20430 user@8.34.124.122", Leader="Muhid Qaiser"
+- index 12: Team="thenextvisionrdinterns", GPU="ssh -p 20427 user@8.34.124.122", Leader="Muhid Qaiser"
+
+NEW rows:
+- index 4: Team="knearestsiraiki", GPU="ssh -p 20000 user@213.180.0.46", Leader="Ahad Hassan"
+  → NEAR-EXACT match with OLD index 5 (GPU differs: ".46" ≠ ".45"); position doesn't matter
+  → Report only GPU: {"row_index": 4, "column_name": "GPU", "old_value": "ssh -p 20000 user@213.180.0.45", "new_value": "ssh -p 20000 user@213.180.0.46", "change_type": "value_changed", "row_identifier": "knearestsiraiki"}
+- index 8: Team="thenextvisionrdinterns", GPU="ssh -p 20427 user@8.34.124.122", Leader="Muhid Qaiser"
+  → EXACT match with OLD index 12 (moved row) → report NO changes
+- index 10: Team="thevisualarchitects", GPU="ssh -p 20430 user@8.34.124.122", Leader=""
+  → NEAR-EXACT match with OLD index 10 (Leader differs)
+  → Report only Leader: {"row_index": 10, "column_name": "Leader", "old_value": "Muhid Qaiser", "new_value": "", "change_type": "value_removed", "row_identifier": "thevisualarchitects"}
+- index 9: Team="completelynew", GPU="completelynewgpu", Leader="Completely New Leader"
+  → NO content match → PHASE 2: OLD has index 9 → completely changed, report ALL columns:
   - {"row_index": 9, "column_name": "Team", "old_value": "oldteam", "new_value": "completelynew", "change_type": "value_changed", "row_identifier": "completelynew"}
   - {"row_index": 9, "column_name": "GPU", "old_value": "oldgpu", "new_value": "completelynewgpu", "change_type": "value_changed", "row_identifier": "completelynew"}
   - {"row_index": 9, "column_name": "Leader", "old_value": "Old Leader", "new_value": "Completely New Leader", "change_type": "value_changed", "row_identifier": "completelynew"}
+- index 15 (OLD has 15 rows, indices 0-14): Team="visionx", GPU="ssh -p 10904 user@38.29.145.16", Leader="Muhammad Awaiz"
+  → NO content match → PHASE 2: no OLD row at index 15 → ROW ADDED
+  → Report: {"row_index": 15, "row_data": {"Team": "visionx", "GPU": "ssh -p 10904 user@38.29.145.16", "Leader": "Muhammad Awaiz"}, "insertion_point": "At end of file"}
 
-### Example 3: Row Added (Step 3.1 → Step 3.2)
-**Processing NEW row at index 15:**
-NEW Row 16 (index 15): Team="visionx", GPU="ssh -p 10904 user@38.29.145.16", Leader="Muhammad Awaiz"
-
-**Step 3.1: Content Matching**
-- Compare with ALL OLD rows (one by one)
-- No matching row found in OLD (entire row content doesn't match any OLD row)
-- Mark as UNMATCHED
-
-**Step 3.2: Position Matching**
-- Check position: NEW index 15, does OLD have row at index 15?
-- OLD file has 15 rows (indices 0-14) → NO row at index 15
-- Position doesn't match → NEW file is longer → This is a ROW ADDED
-- Report: {"row_index": 15, "row_data": {"Team": "visionx", "GPU": "ssh -p 10904 user@38.29.145.16", "Leader": "Muhammad Awaiz"}, "insertion_point": "At end of file"}
-- Note: row_index=15 is the LAST row (0-based, so 16th row in Excel)
-
-### Example 4: What NOT to Do (False Match)
-**❌ WRONG:**
-NEW Row: Team="team1", GPU="ssh -p 20000 user@213.180.0.43", Leader="John"
-OLD Row: Team="team2", GPU="ssh -p 30000 user@213.180.0.44", Leader="Jane"
-→ Matching just because "43" appears in GPU of NEW and "44" appears in GPU of OLD → NO! This is NOT a match
-→ Matching just because "213.180.0" appears in both → NO! This is NOT a match
-→ Only 0 columns match → NO MATCH
-
-**✅ CORRECT:**
-NEW Row: Team="team1", GPU="ssh -p 20000 user@213.180.0.43", Leader="John"
-OLD Row: Team="team1", GPU="ssh -p 20000 user@213.180.0.44", Leader="John"
-→ Team matches ✓, Leader matches ✓, GPU differs slightly ✗
-→ MOST columns match (2 out of 3) → NEAR-EXACT MATCH → Report GPU change only
-
+### Example 2: What NOT to Do (False Match)
+NEW: Team="team1", GPU="ssh -p 20000 user@213.180.0.43", Leader="John"
+OLD: Team="team2", GPU="ssh -p 30000 user@213.180.0.44", Leader="Jane"
+→ ❌ "213.180.0" appearing in both is NOT a match: 0 columns match → NO MATCH
+If OLD were Team="team1", GPU="ssh -p 20000 user@213.180.0.44", Leader="John"
+→ ✅ 2 out of 3 columns match → NEAR-EXACT MATCH → report the GPU change only
 
 ### Example 3: Column Added
 NEW has a new column "Discount" that doesn't exist in OLD
@@ -464,59 +244,175 @@ Row 3 has changes in columns "Price" (100→150) and "Status" (null→"Active")
 
 ## FINAL CHECKLIST
 Before submitting your response, verify:
-- [ ] PHASE 1 completed: All rows matched by CONTENT first
-- [ ] PHASE 2 completed: Unmatched rows processed by POSITION
-- [ ] row_index is 0-based and refers to NEW file position
-- [ ] row_identifier is included for EVERY change (value from first column of NEW row)
-- [ ] Changes are reported on the CORRECT row (verify by row_identifier)
-- [ ] Completely changed rows (position match, content doesn't) have ALL columns reported
-- [ ] Added rows use the correct row_index (last row should have highest index)
+- [ ] Step 3 followed: CONTENT matching first, POSITION only for unmatched rows
+- [ ] row_index is 0-based (Excel row 2 = index 0) and refers to the NEW file position
+- [ ] row_identifier is included for EVERY change and the change sits on the CORRECT row
+- [ ] Completely changed rows have ALL columns reported; moved identical rows have none
 - [ ] All sheets compared (added, removed, modified)
-- [ ] All columns compared (added, removed, renamed)
-- [ ] All rows compared (added, removed, reordered)
-- [ ] All cell values compared (changed, added, removed)
-- [ ] Summary statistics are accurate
-- [ ] JSON format is valid and complete
-- [ ] No identical values marked as changed
-- [ ] All changes have proper context (row_identifier)
-
-## ROW INDEXING REMINDER
-- Excel Row 1 = Header (ignore)
-- Excel Row 2 = First data row = row_index 0
-- Excel Row 3 = Second data row = row_index 1
-- Excel Row 6 = Fifth data row = row_index 4
-- Excel Row 10 = Ninth data row = row_index 9
-- Excel Row 16 = Fifteenth data row = row_index 15 (if this is the last row)
-- Always use 0-based indexing for row_index in your response
-
-## QUICK REFERENCE: Two-Phase Matching Strategy
-
-**PHASE 1: Content Matching (DO THIS FIRST - Step by Step)**
-- For each NEW row (one at a time), search ALL OLD rows for matching content
-- Compare ENTIRE row content (all columns), character-by-character
-- **EXACT MATCH** (all columns identical):
-  - Report NO changes (even if position differs - it's the same row, just moved)
-- **NEAR-EXACT MATCH** (most columns match, 1-2 differ):
-  - Report ONLY the columns that changed (do NOT report unchanged columns)
-- **NO MATCH**: Mark as UNMATCHED, go to Phase 2
-
-**PHASE 2: Position Matching (for unmatched rows only)**
-- Only process rows that had NO content match in Phase 1
-- Check if OLD has row at same position (same row_index)
-- If position matches → Row completely changed, report ALL columns
-- If position doesn't match:
-  - NEW longer → Row ADDED (use actual NEW row_index - last row = highest index)
-  - OLD longer → Row REMOVED
+- [ ] All columns, rows and cell values compared; no identical values marked as changed
+- [ ] Summary statistics are accurate and the JSON is valid
 
 Remember: Your goal is to detect EVERY change between the two file versions. Follow the two-phase process exactly: content first, then position for unmatched rows."""
 
+# Intern the prompt so cache layers keyed on it compare by identity instead of by content
+EXCEL_CSV_COMPARISON_PROMPT = sys.intern(EXCEL_CSV_COMPARISON_PROMPT)
+
+
+# Prompt passages that only apply to one file type, as (passage, replacement) pairs
+_EXCEL_ONLY_PASSAGES = (
+    ("4. **Sheet changes** (Excel only) - Entire sheets added or removed\n5. **Data type changes**",
+     "4. **Data type changes**"),
+    ("### Step 1: Sheet-Level Analysis (Excel Only)\n"
+     "First, compare sheet names:\n"
+     "- **Sheets Added**: List all sheet names that exist in NEW but not in OLD\n"
+     "- **Sheets Removed**: List all sheet names that exist in OLD but not in NEW\n"
+     "- **Sheets Modified**: List all sheet names that exist in both (these need cell-by-cell comparison)\n\n",
+     ""),
+    ("### For Excel Files (Multiple Sheets)\n"
+     "- Compare each sheet independently\n"
+     "- If sheet names match, compare cell-by-cell\n"
+     "- If sheet name changed but content is similar, mark as renamed (in column_changes.renamed)\n\n",
+     ""),
+    ("### Example 4: Sheet Removed\n"
+     "OLD has sheet \"Archive\" that doesn't exist in NEW\n"
+     "→ Report: {\"removed\": [\"Archive\"]}\n\n",
+     ""),
+    ("- [ ] All sheets compared (added, removed, modified)\n", ""),
+)
+
+_CSV_ONLY_PASSAGES = (
+    ("### For CSV Files (Single Sheet)\n"
+     "- Treat as a single \"sheet\" with name \"CSV Data\"\n"
+     "- Follow same column/row/cell comparison rules\n\n",
+     ""),
+)
+
+
+def _build_prompt(file_type: str) -> str:
+    """
+    Specialize the comparison prompt for one file type by dropping the
+    instructions that only apply to the other.
+
+    Args:
+        file_type: "excel" or "csv"
+
+    Returns:
+        The trimmed prompt text
+    """
+    passages = _EXCEL_ONLY_PASSAGES if file_type == "csv" else _CSV_ONLY_PASSAGES
+    prompt = EXCEL_CSV_COMPARISON_PROMPT
+
+    for passage, replacement in passages:
+        if passage not in prompt:
+            raise ValueError(f"Prompt passage not found while building {file_type} prompt: {passage[:40]!r}")
+        prompt = prompt.replace(passage, replacement, 1)
+
+    return sys.intern(prompt)
+
+
+# File-type specific prompts, built once at import
+EXCEL_CSV_COMPARISON_PROMPT_CSV = _build_prompt("csv")
+EXCEL_CSV_COMPARISON_PROMPT_XLSX = _build_prompt("excel")
+
 
-def get_excel_csv_comparison_prompt() -> str:
-    """Get the optimized prompt for Excel/CSV comparison."""
+def get_excel_csv_comparison_prompt(file_type: str = None) -> str:
+    """
+    Get the optimized prompt for Excel/CSV comparison.
+
+    Args:
+        file_type: "excel" or "csv" for the trimmed variant of that file type,
+                   or None for the full prompt covering both
+    """
+    if file_type == "csv":
+        return EXCEL_CSV_COMPARISON_PROMPT_CSV
+    if file_type == "excel":
+        return EXCEL_CSV_COMPARISON_PROMPT_XLSX
     return EXCEL_CSV_COMPARISON_PROMPT
 
 
-def format_data_for_llm(data: dict, file_type: str = "excel") -> str:
+def _limit_dataframe_for_prompt(df, max_rows: int, max_cell_chars: int):
+    """
+    Bound the size of a DataFrame before it is embedded in the prompt.
+    
+    Keeps the first and last max_rows // 2 rows of oversized frames and clips
+    long text cells to max_cell_chars.
+    
+    Returns:
+        Tuple of (limited_df, truncation_note) where the note is "" when no rows were dropped
+    """
+    import pandas as pd
+    
+    df_out = df.reset_index(drop=True)
+    
+    # Stringify object/datetime/timedelta columns with one vectorized cast each,
+    # instead of a per-cell str() callback during serialization
+    for pos, dtype in enumerate(df_out.dtypes):
+        if dtype.kind in "mMO":
+            column = df_out.iloc[:, pos]
+            df_out.isetitem(pos, column.astype(str).where(column.notna(), ""))
+    
+    df_out = df_out.fillna("")
+    note = ""
+    
+    if max_rows and len(df_out) > max_rows:
+        half = max(max_rows // 2, 1)
+        df_out = pd.concat([df_out.head(half), df_out.tail(half)])
+        note = (
+            f"NOTE: Truncated from {len(df)} to {len(df_out)} rows "
+            f"(showing row_index 0-{half - 1} and {len(df) - half}-{len(df) - 1})\n"
+        )
+    
+    if max_cell_chars:
+        for pos, dtype in enumerate(df_out.dtypes):
+            if dtype.kind == "O":
+                column = df_out.iloc[:, pos]
+                clipped = column.str.slice(0, max_cell_chars)
+                df_out.isetitem(pos, clipped.where(clipped.notna(), column))
+    
+    return df_out, note
+
+
+def _serialize_dataframe(df, data_format: str = "csv") -> str:
+    """Serialize a DataFrame for the prompt, including its data label line."""
+    if data_format == "json":
+        if df.empty:
+            return "Data (as JSON array):\n[]"
+        # Each record carries its row_index, since truncation breaks the array position
+        return "Data (as JSON array, row_index field is 0-based):\n" + df.reset_index(names="row_index").to_json(
+            orient="records", indent=2, date_format="iso", default_handler=str, force_ascii=False
+        )
+    if data_format == "csv":
+        # CSV states each column name once instead of once per row, roughly a third of the JSON size
+        return "Data (as CSV, first column is 0-based row_index):\n" + df.to_csv(
+            index=True, index_label="row_index", lineterminator="\n"
+        ).rstrip("\n")
+    raise ValueError(f"Unknown data format: {data_format}")
+
+
+def _format_sheet(sheet_name: str, df, max_rows: int, max_cell_chars: int, data_format: str) -> str:
+    """Format one sheet's header and serialized rows for the prompt."""
+    parts = [
+        f"--- Sheet: {sheet_name} ---\n"
+        f"Shape: {df.shape[0]} rows × {df.shape[1]} columns\n"
+        f"Columns: {', '.join(map(str, df.columns))}\n\n"
+    ]
+    
+    # Serialize the rows (empty sheets skip the size limits)
+    if df.empty:
+        parts.append(_serialize_dataframe(df, data_format))
+    else:
+        df_out, note = _limit_dataframe_for_prompt(df, max_rows, max_cell_chars)
+        if note:
+            parts.append(note)
+        parts.append(_serialize_dataframe(df_out, data_format))
+    parts.append("\n\n")
+    
+    return "".join(parts)
+
+
+def format_data_for_llm(data: dict, file_type: str = "excel",
+                        max_rows: int = 5000, max_cell_chars: int = 2000,
+                        data_format: str = "csv") -> str:
     """
     Format Excel/CSV data for LLM comparison.
     
@@ -524,43 +420,39 @@ def format_data_for_llm(data: dict, file_type: str = "excel") -> str:
         data: For Excel: dict of {sheet_name: DataFrame}
               For CSV: single DataFrame
         file_type: "excel" or "csv"
+        max_rows: Maximum rows embedded per sheet; larger sheets keep their first and last rows
+        max_cell_chars: Maximum characters kept per text cell
+        data_format: "csv" (default, fewest tokens) or "json"
     
     Returns:
         Formatted string representation of the data
     """
-    import pandas as pd
-    import json
-    
     if file_type == "csv":
         # Single DataFrame - format as "CSV Data" sheet
-        df = data
-        formatted = f"=== EXCEL FILE (CSV treated as single sheet) ===\n"
-        formatted += f"Total Sheets: 1\n"
-        formatted += f"Sheet Names: CSV Data\n\n"
-        formatted += f"--- Sheet: CSV Data ---\n"
-        formatted += f"Shape: {df.shape[0]} rows × {df.shape[1]} columns\n"
-        formatted += f"Columns: {', '.join(df.columns.tolist())}\n\n"
-        
-        # Convert to JSON for better structure
-        formatted += "Data (as JSON array):\n"
-        formatted += json.dumps(df.fillna("").to_dict('records'), indent=2, default=str)
-        formatted += "\n\n"
-        
+        parts = [
+            "=== EXCEL FILE (CSV treated as single sheet) ===\n",
+            "Total Sheets: 1\n",
+            "Sheet Names: CSV Data\n\n",
+            _format_sheet("CSV Data", data, max_rows, max_cell_chars, data_format)
+        ]
     else:
         # Multiple sheets
-        formatted = f"=== EXCEL FILE ===\n"
-        formatted += f"Total Sheets: {len(data)}\n"
-        formatted += f"Sheet Names: {', '.join(data.keys())}\n\n"
+        parts = [
+            "=== EXCEL FILE ===\n",
+            f"Total Sheets: {len(data)}\n",
+            f"Sheet Names: {', '.join(data.keys())}\n\n"
+        ]
+        
+        def _format_item(item):
+            sheet_name, df = item
+            return _format_sheet(sheet_name, df, max_rows, max_cell_chars, data_format)
         
-        for sheet_name, df in data.items():
-            formatted += f"--- Sheet: {sheet_name} ---\n"
-            formatted += f"Shape: {df.shape[0]} rows × {df.shape[1]} columns\n"
-            formatted += f"Columns: {', '.join(df.columns.tolist())}\n\n"
-            
-            # Convert to JSON
-            formatted += "Data (as JSON array):\n"
-            formatted += json.dumps(df.fillna("").to_dict('records'), indent=2, default=str)
-            formatted += "\n\n"
+        if len(data) < 2:
+            parts.extend(_format_item(item) for item in data.items())
+        else:
+            # pandas releases the GIL in its C serializers, so sheets can be formatted in parallel
+            from concurrent.futures import ThreadPoolExecutor
+            with ThreadPoolExecutor(max_workers=min(8, len(data))) as executor:
+                parts.extend(executor.map(_format_item, data.items()))
     
-    return formatted
-
+    return "".join(parts)
@@ -1,37 +1,703 @@
 """
 Azure OpenAI LLM client for the Version Comparison Agent.
 """
+import asyncio
+import base64
+import contextlib
+import csv
+import functools
+import hashlib
+import io
+import itertools
 import json
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import AsyncIterator
 import httpx
-from openai import AzureOpenAI
+import openai
+from openai import AzureOpenAI, AsyncAzureOpenAI
+from pydantic import BaseModel, ConfigDict, ValidationError
+from tenacity import retry, retry_if_exception_type, stop_after_attempt, wait_exponential_jitter
 from config import Config
 
+# Optional: orjson encodes prompt data in C, including NumPy scalars and datetimes
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
 
-class LLMClient:
-    """Client for Azure OpenAI interactions."""
+# Optional: aiohttp transport for high-fanout paths (Config.HIGH_CONCURRENCY_MODE)
+try:
+    import aiohttp
+    AIOHTTP_AVAILABLE = True
+except ImportError:
+    AIOHTTP_AVAILABLE = False
+
+# Optional: tiktoken gives exact token counts for batching and rate limiting
+try:
+    import tiktoken
+    _ENC = tiktoken.get_encoding("o200k_base")
+    TIKTOKEN_AVAILABLE = True
+except Exception:
+    TIKTOKEN_AVAILABLE = False
+
+
+def count_tokens(text: str) -> int:
+    """Count the tokens in text, or estimate them (~4 characters per token) without tiktoken."""
+    if TIKTOKEN_AVAILABLE:
+        return len(_ENC.encode(text, disallowed_special=()))
+    return len(text) // 4
+
+
+def to_prompt_json(data) -> str:
+    """
+    Serialize row data as indented JSON for embedding in a prompt.
     
-    def __init__(self):
-        # Create httpx client without proxies to avoid compatibility issues
-        http_client = httpx.Client()
-        
-        self.client = AzureOpenAI(
-            api_key=Config.AZURE_OPENAI_API_KEY,
-            api_version=Config.AZURE_OPENAI_API_VERSION,
-            azure_endpoint=Config.AZURE_OPENAI_ENDPOINT,
-            http_client=http_client
+    Uses orjson when installed and falls back to the standard library.
+    Values JSON cannot represent natively are written as their str().
+    """
+    if ORJSON_AVAILABLE:
+        return orjson.dumps(
+            data,
+            option=orjson.OPT_INDENT_2 | orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS,
+            default=str
+        ).decode("utf-8")
+    return json.dumps(data, indent=2, default=str)
+
+
+def parse_response_json(content: str):
+    """
+    Parse a JSON response body, with orjson when installed.
+    
+    orjson's decode errors subclass json.JSONDecodeError, so callers can catch
+    the same exception either way.
+    """
+    if ORJSON_AVAILABLE:
+        return orjson.loads(content)
+    return json.loads(content)
+
+
+def dumps_compact(data, sort_keys: bool = False) -> str:
+    """Serialize data as compact JSON, with orjson when installed."""
+    if ORJSON_AVAILABLE:
+        return orjson.dumps(data, option=orjson.OPT_SORT_KEYS if sort_keys else 0).decode("utf-8")
+    return json.dumps(data, sort_keys=sort_keys, ensure_ascii=False, separators=(",", ":"))
+
+
+class TransientHTTPError(Exception):
+    """A 429 or 5xx response received through the aiohttp transport."""
+    
+    def __init__(self, response, message: str):
+        super().__init__(f"HTTP {response.status}: {message}")
+        self.response = response
+
+
+class LLMComparisonError(Exception):
+    """An LLM request made by LLMClient failed."""
+
+
+class LLMRateLimitError(LLMComparisonError):
+    """The deployment rejected the request for exceeding its rate limit, even after retries."""
+
+
+class LLMParseError(LLMComparisonError):
+    """The model's response was not valid JSON or did not match the expected schema."""
+
+
+class LLMTruncatedError(LLMComparisonError):
+    """The response reached its max_tokens budget before the model finished it."""
+
+
+def _llm_error(message: str, error: Exception) -> LLMComparisonError:
+    """
+    Wrap a failure in the LLMComparisonError subclass matching its cause.
+    
+    Callers raise the result "from error" so the original exception and its
+    traceback stay attached.
+    """
+    if isinstance(error, openai.RateLimitError) or (
+            isinstance(error, TransientHTTPError) and error.response.status == 429):
+        error_class = LLMRateLimitError
+    elif isinstance(error, (json.JSONDecodeError, ValidationError)):
+        error_class = LLMParseError
+    else:
+        error_class = LLMComparisonError
+    return error_class(f"{message}: {str(error)}")
+
+
+# Transient API failures worth retrying: rate limits, timeouts/connection drops and 5xx
+RETRYABLE_ERRORS = (
+    openai.RateLimitError,
+    openai.APIConnectionError,
+    openai.APITimeoutError,
+    openai.InternalServerError,
+    TransientHTTPError,
+    asyncio.TimeoutError
+)
+if AIOHTTP_AVAILABLE:
+    RETRYABLE_ERRORS += (aiohttp.ClientConnectionError,)
+
+_backoff = wait_exponential_jitter(initial=1, max=30)
+
+
+def _wait_for_retry(retry_state) -> float:
+    """Wait as long as the service's Retry-After header asks, else back off exponentially with jitter."""
+    error = retry_state.outcome.exception()
+    response = getattr(error, "response", None)
+    retry_after = response.headers.get("retry-after") if response is not None else None
+    try:
+        return min(float(retry_after), 60.0)
+    except (TypeError, ValueError):
+        return _backoff(retry_state)
+
+
+_retry_transient = retry(
+    stop=stop_after_attempt(5),
+    wait=_wait_for_retry,
+    retry=retry_if_exception_type(RETRYABLE_ERRORS),
+    reraise=True
+)
+
+# Target prompt tokens of row data per tabular batch
+TABULAR_BATCH_TOKENS = 6000
+
+# Number of batches from which submit_tabular_batch_job beats live calls
+BATCH_API_MIN_BATCHES = 20
+
+# Base64 PDFs larger than this are uploaded through the files API and referenced by
+# file_id instead of being inlined into the request as a data URI; the upload is
+# deleted again once the request completes
+PDF_UPLOAD_THRESHOLD = 256 * 1024
+
+
+def _pdf_upload_args(base64_pdf: str) -> dict:
+    """files.create arguments for a PDF over PDF_UPLOAD_THRESHOLD, or None to inline it."""
+    if len(base64_pdf) <= PDF_UPLOAD_THRESHOLD:
+        return None
+    return {
+        "file": ("document.pdf", base64.b64decode(base64_pdf), "application/pdf"),
+        "purpose": "assistants"
+    }
+
+
+def _check_pdf_size(base64_pdf: str):
+    """Reject PDFs over Config.MAX_FILE_SIZE_BYTES before any network call."""
+    decoded_size = len(base64_pdf) * 3 // 4
+    if decoded_size > Config.MAX_FILE_SIZE_BYTES:
+        raise ValueError(
+            f"PDF is about {decoded_size / (1024 * 1024):.1f} MB; "
+            f"the limit is {Config.MAX_FILE_SIZE_MB} MB"
         )
-        self.deployment = Config.AZURE_OPENAI_DEPLOYMENT
+
+# Completions for identical requests are reused from an in-process LRU cache (and
+# from Config.LLM_CACHE_DIR when set). Bump PROMPT_VERSION whenever a prompt or
+# the way responses are used changes, so stale results are not served.
+PROMPT_VERSION = "3"
+RESULT_CACHE_SIZE = 2048
+_result_cache: "OrderedDict[str, str]" = OrderedDict()
+# Shared by worker threads and Streamlit sessions, so reads and evictions are serialized
+_RESULT_CACHE_LOCK = threading.Lock()
+
+
+def _result_cache_key(messages: list[dict], kwargs: dict) -> str:
+    """Hash a chat request (prompt version, messages and options) into a cache key."""
+    payload = json.dumps([PROMPT_VERSION, messages, kwargs], ensure_ascii=False, sort_keys=True)
+    return hashlib.blake2b(payload.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def _to_tsv(rows: list[list]) -> str:
+    """Serialize rows as compact TSV (quoting cells that contain tabs, quotes or newlines)."""
+    buffer = io.StringIO()
+    csv.writer(buffer, delimiter="\t", lineterminator="\n").writerows(rows)
+    return buffer.getvalue().removesuffix("\n")
+
+
+def _token_packed_batches(old_data: list[list], new_data: list[list],
+                          budget: int = TABULAR_BATCH_TOKENS) -> list[tuple[int, int]]:
+    """
+    Split two tables into row windows whose OLD + NEW rows fit a token budget.
     
-    def compare_text_content(self, old_text: str, new_text: str) -> dict:
-        """
-        Compare two text contents and identify changes.
+    Narrow rows are packed many to a batch and wide rows few, instead of a
+    fixed row count. A single row over the budget still gets its own window.
+    
+    Returns:
+        (start, end) row ranges covering both tables
+    """
+    windows = []
+    start = used = 0
+    max_rows = max(len(old_data), len(new_data))
+    
+    for i in range(max_rows):
+        rows = [data[i] for data in (old_data, new_data) if i < len(data)]
+        cost = count_tokens(_to_tsv(rows))
+        if used and used + cost > budget:
+            windows.append((start, i))
+            start, used = i, 0
+        used += cost
+    
+    if start < max_rows:
+        windows.append((start, max_rows))
+    return windows
+
+
+# Response schemas, enforced by the API through structured outputs (strict json_schema)
+# and validated again when parsing, so results always carry every key
+
+class _StrictModel(BaseModel):
+    model_config = ConfigDict(extra="forbid")
+
+
+class TextModification(_StrictModel):
+    old: str
+    new: str
+
+
+class TextDiff(_StrictModel):
+    removed: list[str]
+    added: list[str]
+    modified: list[TextModification]
+
+
+class TabularDiff(_StrictModel):
+    changes: list[list[str]]
+
+
+class PdfModification(_StrictModel):
+    field: str
+    old: str
+    new: str
+    page: int
+
+
+class PdfSegment(_StrictModel):
+    text: str
+    page: int
+
+
+class PdfDiff(_StrictModel):
+    modified: list[PdfModification]
+    added: list[PdfSegment]
+    removed: list[PdfSegment]
+
+
+def _response_format(model: type[BaseModel]) -> dict:
+    """Build the structured-output response_format for a response schema."""
+    return {
+        "type": "json_schema",
+        "json_schema": {
+            "name": model.__name__,
+            "strict": True,
+            "schema": model.model_json_schema()
+        }
+    }
+
+
+_TEXT_DIFF_FORMAT = _response_format(TextDiff)
+_TABULAR_DIFF_FORMAT = _response_format(TabularDiff)
+_PDF_DIFF_FORMAT = _response_format(PdfDiff)
+
+
+def _empty_excel_csv_result() -> dict:
+    """Return the compare_excel_csv_files result for two identical files."""
+    return {
+        "sheet_changes": {"added": [], "removed": [], "modified": []},
+        "changes_by_sheet": {},
+        "summary": {
+            "total_sheets_added": 0,
+            "total_sheets_removed": 0,
+            "total_sheets_modified": 0,
+            "total_rows_added": 0,
+            "total_rows_removed": 0,
+            "total_cells_changed": 0,
+            "total_columns_added": 0,
+            "total_columns_removed": 0
+        }
+    }
+
+
+def _changed_row_indices(old_data: list[list], new_data: list[list]) -> list[int]:
+    """Indices of NEW rows that differ from the OLD row at the same position."""
+    return [i for i, row in enumerate(new_data) if i >= len(old_data) or old_data[i] != row]
+
+
+def _expand_row_changes(changes: list[list], changed_idx: list[int], new_data: list[list]) -> list[list]:
+    """Place the changes returned for the changed rows back into a full-size change matrix."""
+    full = [["-"] * len(row) for row in new_data]
+    for row_changes, row_idx in zip(changes, changed_idx):
+        full[row_idx] = row_changes
+    return full
+
+
+def _changed_paragraphs(text: str, other_text: str, context: int = 1) -> str:
+    """
+    Reduce a document to the paragraphs that do not appear verbatim in the other
+    version, plus context neighbours on each side and all PAGE markers.
+    
+    Runs of omitted paragraphs are replaced with a single marker line.
+    """
+    paragraphs = text.split("\n\n")
+    other_paragraphs = {p.strip() for p in other_text.split("\n\n")}
+    
+    keep = set()
+    for i, paragraph in enumerate(paragraphs):
+        stripped = paragraph.strip()
+        if stripped.startswith("══════ PAGE"):
+            keep.add(i)
+        elif stripped and stripped not in other_paragraphs:
+            keep.update(range(max(0, i - context), min(len(paragraphs), i + context + 1)))
+    
+    parts = []
+    omitted = 0
+    for i, paragraph in enumerate(paragraphs):
+        if i in keep:
+            if omitted:
+                parts.append(f"[... {omitted} unchanged paragraphs omitted ...]")
+                omitted = 0
+            parts.append(paragraph)
+        elif paragraph.strip():
+            omitted += 1
+    if omitted:
+        parts.append(f"[... {omitted} unchanged paragraphs omitted ...]")
+    
+    return "\n\n".join(parts)
+
+
+# Page marker written by PDFComparator.format_content_for_comparison
+_PAGE_MARKER = re.compile(r"\n?══════ PAGE (\d+) ══════\n")
+
+
+def _split_pages(text: str) -> dict[int, str]:
+    """Split formatted PDF content into {page_number: text}; text before the first marker is page 0."""
+    pieces = _PAGE_MARKER.split(text)
+    pages = {0: pieces[0]} if pieces[0].strip() else {}
+    for page_num, page_text in zip(pieces[1::2], pieces[2::2]):
+        pages[int(page_num)] = f"\n══════ PAGE {page_num} ══════\n{page_text}"
+    return pages
+
+
+def _page_aligned_chunks(old_content: str, new_content: str, chunk_tokens: int,
+                         overlap: int) -> list[tuple[str, str]]:
+    """
+    Group the pages of both versions into aligned (old_chunk, new_chunk) pairs that
+    cover the same page range and stay within about chunk_tokens tokens per side.
+    
+    Each chunk after the first is prefixed with the last ~overlap tokens of the
+    previous chunk, so changes spanning a boundary keep their context.
+    """
+    # Rough token estimate, ~4 characters per token
+    chunk_chars = chunk_tokens * 4
+    overlap_chars = overlap * 4
+    old_pages = _split_pages(old_content)
+    new_pages = _split_pages(new_content)
+    
+    chunks = []
+    old_parts, new_parts = [], []
+    for page_num in sorted(old_pages.keys() | new_pages.keys()):
+        old_page = old_pages.get(page_num, "")
+        new_page = new_pages.get(page_num, "")
+        size = max(sum(map(len, old_parts)) + len(old_page), sum(map(len, new_parts)) + len(new_page))
+        if (old_parts or new_parts) and size > chunk_chars:
+            chunks.append(("".join(old_parts), "".join(new_parts)))
+            old_parts, new_parts = [], []
+        old_parts.append(old_page)
+        new_parts.append(new_page)
+    if old_parts or new_parts:
+        chunks.append(("".join(old_parts), "".join(new_parts)))
+    
+    if overlap_chars:
+        chunks = [chunks[0]] + [
+            (prev_old[-overlap_chars:] + old_chunk, prev_new[-overlap_chars:] + new_chunk)
+            for (prev_old, prev_new), (old_chunk, new_chunk) in zip(chunks, chunks[1:])
+        ]
+    return chunks
+
+
+@functools.lru_cache(maxsize=1)
+def _get_client() -> AzureOpenAI:
+    """Get the process-wide Azure OpenAI client, creating it on first use."""
+    # Create httpx client without proxies to avoid compatibility issues; keep-alive
+    # connections for every thread of the page fan-out, so calls skip the TLS handshake
+    http_client = httpx.Client(
+        limits=httpx.Limits(max_connections=32, max_keepalive_connections=32)
+    )
+    
+    return AzureOpenAI(
+        api_key=Config.AZURE_OPENAI_API_KEY,
+        api_version=Config.AZURE_OPENAI_API_VERSION,
+        azure_endpoint=Config.AZURE_OPENAI_ENDPOINT,
+        http_client=http_client
+    )
+
+
+# Async client and the event loop it was created in; its httpx pool cannot be
+# reused from another loop (e.g. a later asyncio.run), so it is recreated then.
+# Callers that own the loop close it with _aclose_async_clients before it ends
+_async_client = None
+_async_client_loop = None
+
+
+def _get_async_client() -> AsyncAzureOpenAI:
+    """Get the async Azure OpenAI client for the running event loop, creating it on first use."""
+    global _async_client, _async_client_loop
+    
+    loop = asyncio.get_running_loop()
+    if _async_client is not None and _async_client_loop is loop:
+        return _async_client
+    
+    # One connection pool shared by all concurrent requests
+    async_http_client = httpx.AsyncClient(
+        limits=httpx.Limits(max_connections=200, max_keepalive_connections=100)
+    )
+    
+    _async_client = AsyncAzureOpenAI(
+        api_key=Config.AZURE_OPENAI_API_KEY,
+        api_version=Config.AZURE_OPENAI_API_VERSION,
+        azure_endpoint=Config.AZURE_OPENAI_ENDPOINT,
+        http_client=async_http_client,
+        # Fail fast on unreachable hosts; long completions keep the SDK's 600s budget
+        timeout=httpx.Timeout(600.0, connect=5.0),
+        max_retries=0  # retries are handled by LLMClient._achat
+    )
+    _async_client_loop = loop
+    return _async_client
+
+
+# aiohttp session for the high-concurrency transport; a session belongs to the
+# event loop it was created in, so it is recreated when the loop changes
+_aiohttp_session = None
+_aiohttp_session_loop = None
+
+
+def _get_aiohttp_session():
+    """Get the aiohttp session for the running event loop, creating it on first use."""
+    global _aiohttp_session, _aiohttp_session_loop
+    
+    if not AIOHTTP_AVAILABLE:
+        raise ImportError("HIGH_CONCURRENCY_MODE requires aiohttp. Install: pip install aiohttp")
+    
+    loop = asyncio.get_running_loop()
+    if _aiohttp_session is None or _aiohttp_session.closed or _aiohttp_session_loop is not loop:
+        _aiohttp_session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=200, limit_per_host=200),
+            timeout=aiohttp.ClientTimeout(total=600, connect=5)
+        )
+        _aiohttp_session_loop = loop
+    return _aiohttp_session
+
+
+async def _aclose_async_clients():
+    """Close the async client and aiohttp session of the running event loop, if any."""
+    global _async_client, _async_client_loop, _aiohttp_session, _aiohttp_session_loop
+    
+    loop = asyncio.get_running_loop()
+    if _async_client is not None and _async_client_loop is loop:
+        client, _async_client, _async_client_loop = _async_client, None, None
+        await client.close()
+    if _aiohttp_session is not None and _aiohttp_session_loop is loop:
+        session, _aiohttp_session, _aiohttp_session_loop = _aiohttp_session, None, None
+        await session.close()
+
+
+def _estimate_tokens(messages: list[dict]) -> int:
+    """
+    Estimate a request's prompt tokens.
+    
+    System prompts are counted once and memoized in _SYS_PROMPT_TOKENS, so only
+    the per-call user content is tokenized on the hot path.
+    """
+    total = 0
+    for message in messages:
+        content = message["content"]
+        if message["role"] == "system":
+            if content not in _SYS_PROMPT_TOKENS:
+                _SYS_PROMPT_TOKENS[content] = count_tokens(content)
+            total += _SYS_PROMPT_TOKENS[content]
+        elif isinstance(content, str):
+            total += count_tokens(content)
+        else:
+            for part in content:
+                total += count_tokens(part["text"] if part.get("type") == "text" else json.dumps(part))
+    return total
+
+
+class AzureRateLimiter:
+    """
+    Throttle async requests to a deployment's quotas: at most max_inflight
+    requests at once, rpm requests per minute and tpm prompt tokens per minute.
+    
+    Both per-minute limits are token buckets that refill continuously; a limit
+    of 0/None disables it.
+    """
+    
+    def __init__(self, max_inflight: int = None, rpm: int = None, tpm: int = None):
+        self.max_inflight = max_inflight
+        self.rpm = rpm
+        self.tpm = tpm
+        self.request_budget = float(rpm or 0)
+        self.token_budget = float(tpm or 0)
+        self.updated = time.monotonic()
+        self.loop = None
+    
+    def _bind_loop(self):
+        """Create the asyncio primitives for the running loop (they cannot be shared across loops)."""
+        loop = asyncio.get_running_loop()
+        if self.loop is not loop:
+            self.loop = loop
+            self.semaphore = asyncio.Semaphore(self.max_inflight) if self.max_inflight else None
+            self.lock = asyncio.Lock()
+    
+    def _refill(self):
+        """Top up both budgets for the time elapsed since the last refill."""
+        now = time.monotonic()
+        elapsed = now - self.updated
+        self.updated = now
+        if self.rpm:
+            self.request_budget = min(self.rpm, self.request_budget + elapsed * self.rpm / 60)
+        if self.tpm:
+            self.token_budget = min(self.tpm, self.token_budget + elapsed * self.tpm / 60)
+    
+    async def _acquire(self, estimated_tokens: int):
+        """Wait until the budgets allow one more request of estimated_tokens."""
+        # A request larger than the whole per-minute budget waits for a full bucket
+        tokens = min(estimated_tokens, self.tpm) if self.tpm else 0
+        async with self.lock:
+            while True:
+                self._refill()
+                wait = 0.0
+                if self.rpm and self.request_budget < 1:
+                    wait = max(wait, (1 - self.request_budget) * 60 / self.rpm)
+                if self.tpm and self.token_budget < tokens:
+                    wait = max(wait, (tokens - self.token_budget) * 60 / self.tpm)
+                if not wait:
+                    break
+                await asyncio.sleep(wait)
+            if self.rpm:
+                self.request_budget -= 1
+            if self.tpm:
+                self.token_budget -= tokens
+    
+    @contextlib.asynccontextmanager
+    async def request(self, estimated_tokens: int = 0):
+        """Hold a request slot for the duration of an API call."""
+        self._bind_loop()
+        if self.semaphore is None:
+            await self._acquire(estimated_tokens)
+            yield
+            return
+        async with self.semaphore:
+            await self._acquire(estimated_tokens)
+            yield
+
+
+@functools.lru_cache(maxsize=1)
+def _get_rate_limiter() -> AzureRateLimiter:
+    """Get the process-wide rate limiter for the configured deployment."""
+    return AzureRateLimiter(
+        max_inflight=Config.AZURE_MAX_INFLIGHT,
+        rpm=Config.AZURE_RPM,
+        tpm=Config.AZURE_TPM
+    )
+
+
+class _JSONArrayItemParser:
+    """
+    Incrementally parse a streamed JSON object of the form {"key": [item, ...], ...}.
+    
+    feed() accepts text chunks and returns (key, item) pairs for every array item
+    completed so far, so callers can act on items before the object is finished.
+    """
+    
+    def __init__(self):
+        self.buffer = ""  # response text from buffer_start on; consumed text is dropped
+        self.buffer_start = 0
+        self.stack = []  # open containers, "{" or "["
+        self.in_string = False
+        self.escape = False
+        self.key = None
+        self.last_string = None
+        self.string_start = None
+        self.item_start = None
+        self.position = 0
+    
+    def _in_item_array(self) -> bool:
+        """Whether the parser is directly inside a top-level object's array value."""
+        return len(self.stack) == 2 and self.stack[0] == "{" and self.stack[1] == "["
+    
+    def feed(self, text: str) -> list[tuple]:
+        """Consume a chunk of the response and return the newly completed items."""
+        items = []
+        self.buffer += text
         
-        Returns a structured response with:
-        - removed: List of text segments removed from old version
-        - added: List of text segments added in new version
-        - modified: List of {old: str, new: str} for modified segments
-        """
-        system_prompt = """You are a precise document comparison assistant. Your task is to compare two versions of a document and identify all changes.
+        for char in text:
+            if self.in_string:
+                if self.escape:
+                    self.escape = False
+                elif char == "\\":
+                    self.escape = True
+                elif char == '"':
+                    self.in_string = False
+                    if len(self.stack) == 1:
+                        self.last_string = self._text(self.string_start + 1, self.position)
+            elif char == '"':
+                self.in_string = True
+                self.string_start = self.position
+                if self._in_item_array() and self.item_start is None:
+                    self.item_start = self.position
+            elif char == ":" and len(self.stack) == 1:
+                self.key = json.loads(f'"{self.last_string}"')
+            elif char in "[{":
+                if self._in_item_array() and self.item_start is None:
+                    self.item_start = self.position
+                self.stack.append(char)
+            elif char in "]}":
+                if self._in_item_array():
+                    # End of the array: finish a trailing bare item
+                    items.extend(self._finish_item(self.position))
+                self.stack.pop()
+                if self._in_item_array():
+                    # End of an object/array item
+                    items.extend(self._finish_item(self.position + 1))
+            elif char == "," and self._in_item_array():
+                items.extend(self._finish_item(self.position))
+            elif self._in_item_array() and self.item_start is None and not char.isspace():
+                # Start of a bare number/true/false/null item
+                self.item_start = self.position
+            self.position += 1
+        
+        # Keep only the text an unfinished item or string may still need
+        keep = self.position
+        if self.item_start is not None:
+            keep = min(keep, self.item_start)
+        if self.in_string:
+            keep = min(keep, self.string_start)
+        if keep > self.buffer_start:
+            self.buffer = self.buffer[keep - self.buffer_start:]
+            self.buffer_start = keep
+        
+        return items
+    
+    def _text(self, start: int, end: int) -> str:
+        """Return buffered response text between two absolute positions."""
+        return self.buffer[start - self.buffer_start:end - self.buffer_start]
+    
+    def _finish_item(self, end: int) -> list[tuple]:
+        """Decode the item that started at item_start and ends before end, if any."""
+        if self.item_start is None:
+            return []
+        raw = self._text(self.item_start, end).strip()
+        self.item_start = None
+        return [(self.key, parse_response_json(raw))] if raw else []
+
+
+# System prompts. Azure OpenAI caches identical prompt prefixes of 1024+ tokens,
+# so every request sends one of these byte-for-byte unchanged as its first message,
+# and user prompts put their fixed instructions before the per-call data. Keep
+# dynamic values out of these strings, or the cached prefix stops matching.
+
+_TEXT_SYS_PROMPT = """You are a precise document comparison assistant. Your task is to compare two versions of a document and identify all changes.
 
 Analyze the OLD and NEW document texts and return a JSON object with:
 1. "removed": Array of text segments that exist in OLD but not in NEW
@@ -45,46 +711,7 @@ Rules:
 - Return valid JSON only, no additional text
 - Group contiguous changes together when possible"""
 
-        user_prompt = f"""Compare these two document versions:
-
-=== OLD VERSION ===
-{old_text}
-
-=== NEW VERSION ===
-{new_text}
-
-Return the comparison as JSON with "removed", "added", and "modified" arrays."""
-
-        try:
-            response = self.client.chat.completions.create(
-                model=self.deployment,
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_prompt}
-                ],
-                temperature=0,
-                response_format={"type": "json_object"}
-            )
-            
-            result = json.loads(response.choices[0].message.content)
-            return {
-                "removed": result.get("removed", []),
-                "added": result.get("added", []),
-                "modified": result.get("modified", [])
-            }
-        except Exception as e:
-            raise Exception(f"LLM comparison failed: {str(e)}")
-    
-    def compare_tabular_data(self, old_data: list[list], new_data: list[list], 
-                             headers: list[str] = None) -> list[list]:
-        """
-        Compare two tabular datasets row by row.
-        
-        Returns a change matrix where:
-        - "-" means no change
-        - Value means the difference/change description
-        """
-        system_prompt = """You are a precise data comparison assistant. Compare two tabular datasets row by row and cell by cell.
+_TABULAR_SYS_PROMPT = """You are a precise data comparison assistant. Compare two tabular datasets row by row and cell by cell.
 
 For each cell, determine if there's a change between the old and new version:
 - If no change: output "-"
@@ -92,70 +719,11 @@ For each cell, determine if there's a change between the old and new version:
 
 Return a JSON object with:
 - "changes": A 2D array (list of rows, each row is a list of cells) containing the change indicators
-- Each cell should be "-" for no change or the change value/description for changes"""
-
-        user_prompt = f"""Compare these datasets row by row:
-
-=== OLD DATA ===
-{json.dumps(old_data, indent=2)}
-
-=== NEW DATA ===
-{json.dumps(new_data, indent=2)}
-
-{f"Headers: {headers}" if headers else ""}
+- Each cell should be "-" for no change or the change value/description for changes
 
-Return JSON with "changes" as a 2D array matching the structure of the new data."""
+The data is presented as TSV: one row per line, cells separated by tabs."""
 
-        try:
-            response = self.client.chat.completions.create(
-                model=self.deployment,
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_prompt}
-                ],
-                temperature=0,
-                response_format={"type": "json_object"}
-            )
-            
-            result = json.loads(response.choices[0].message.content)
-            return result.get("changes", [])
-        except Exception as e:
-            raise Exception(f"LLM comparison failed: {str(e)}")
-    
-    def compare_tabular_batch(self, old_data: list[list], new_data: list[list],
-                               headers: list[str] = None, batch_size: int = 50) -> list[list]:
-        """
-        Compare tabular data in batches to handle large datasets.
-        """
-        all_changes = []
-        
-        # Determine the max rows to process
-        max_rows = max(len(old_data), len(new_data))
-        
-        for i in range(0, max_rows, batch_size):
-            old_batch = old_data[i:i + batch_size] if i < len(old_data) else []
-            new_batch = new_data[i:i + batch_size] if i < len(new_data) else []
-            
-            # Handle case where one dataset is shorter
-            if not old_batch:
-                old_batch = [[""] * len(new_batch[0])] * len(new_batch) if new_batch else []
-            if not new_batch:
-                new_batch = [[""] * len(old_batch[0])] * len(old_batch) if old_batch else []
-            
-            batch_changes = self.compare_tabular_data(
-                old_batch, new_batch, 
-                headers if i == 0 else None
-            )
-            all_changes.extend(batch_changes)
-        
-        return all_changes
-    
-    def compare_pdf_content(self, old_content: str, new_content: str) -> dict:
-        """
-        Compare two PDF document contents that may include text and tables.
-        Returns structured changes for highlighting.
-        """
-        system_prompt = """You are a document comparison expert. Compare OLD and NEW versions of the SAME document.
+_PDF_SYS_PROMPT = """You are a document comparison expert. Compare OLD and NEW versions of the SAME document.
 
 ## DOCUMENT STRUCTURE
 Documents contain:
@@ -172,16 +740,19 @@ Documents contain:
 
 {
   "modified": [
-    {"field": "context/label", "old": "old value only", "new": "new value only"}
+    {"field": "context/label", "old": "old value only", "new": "new value only", "page": 3}
   ],
   "added": [
-    {"text": "new content with no equivalent in OLD"}
+    {"text": "new content with no equivalent in OLD", "page": 4}
   ],
   "removed": [
-    {"text": "deleted content with no equivalent in NEW"}
+    {"text": "deleted content with no equivalent in NEW", "page": 2}
   ]
 }
 
+"page" is the number from the nearest "══════ PAGE N ══════" marker above the item
+(in NEW for modified/added, in OLD for removed); use 0 if there is none.
+
 ## CLASSIFICATION RULES
 
 ### MODIFIED (most common)
@@ -245,49 +816,291 @@ Before including ANY item:
 3. For ADDED: Does OLD truly have NOTHING similar? If OLD has it → probably MODIFIED
 4. For REMOVED: Does NEW truly have NOTHING similar? If NEW has it → probably MODIFIED"""
 
-        user_prompt = f"""Compare these two document versions line by line:
+# Token counts of the system prompts, counted once at import. Prompts shorter than
+# 1024 tokens are below the prefix cache's minimum and are always billed in full.
+_SYS_PROMPT_TOKENS = {
+    prompt: count_tokens(prompt)
+    for prompt in (_TEXT_SYS_PROMPT, _TABULAR_SYS_PROMPT, _PDF_SYS_PROMPT)
+}
 
-=== OLD VERSION ===
-{old_content}
 
-=== NEW VERSION ===
-{new_content}
+def _json_mode_kwargs(max_tokens: int = None) -> dict:
+    """Request options for a JSON-mode completion, optionally capped at max_tokens."""
+    kwargs = {"response_format": {"type": "json_object"}}
+    if max_tokens:
+        kwargs["max_tokens"] = max_tokens
+    return kwargs
 
-Find ALL differences. For each:
-1. Identify what changed
-2. Extract ONLY the specific value that changed (not whole lines)
-3. Classify correctly (modified/added/removed)
-4. Skip identical content and watermarks
 
-Return JSON with "modified", "added", "removed" arrays."""
+def _user_message(*parts: str) -> dict:
+    """
+    Build a user message from text parts sent as separate content parts.
+    
+    Large document texts are passed through as-is, so a multi-MB prompt is
+    never concatenated into one more Python string before serialization.
+    """
+    return {"role": "user", "content": [{"type": "text", "text": part} for part in parts if part]}
 
-        try:
-            response = self.client.chat.completions.create(
+
+class LLMClient:
+    """Client for Azure OpenAI interactions."""
+    
+    def __init__(self):
+        # Clients are shared by all LLMClient instances so their connection pools are reused
+        self.client = _get_client()
+        self.rate_limiter = _get_rate_limiter()
+        self.deployment = Config.AZURE_OPENAI_DEPLOYMENT
+        
+        # Optional persistent result cache shared across runs
+        self.disk_cache = None
+        if Config.LLM_CACHE_DIR:
+            try:
+                import diskcache
+            except ImportError:
+                raise ImportError("LLM_CACHE_DIR requires diskcache. Install: pip install diskcache")
+            self.disk_cache = diskcache.Cache(Config.LLM_CACHE_DIR)
+    
+    @property
+    def async_client(self) -> AsyncAzureOpenAI:
+        """The shared async client for the running event loop."""
+        return _get_async_client()
+    
+    async def aclose(self):
+        """Close the async connection pools of the running event loop; they are recreated on next use."""
+        await _aclose_async_clients()
+    
+    @_retry_transient
+    def _chat(self, messages: list[dict], **kwargs):
+        """Create a chat completion, retrying transient failures with backoff."""
+        # The SDK's own retries are disabled here so they don't multiply with ours
+        return self.client.with_options(max_retries=0).chat.completions.create(
+            model=self.deployment,
+            messages=messages,
+            temperature=0,
+            seed=0,
+            **kwargs
+        )
+    
+    @_retry_transient
+    async def _achat(self, messages: list[dict], **kwargs):
+        """Async variant of _chat, throttled by the shared rate limiter."""
+        async with self.rate_limiter.request(_estimate_tokens(messages)):
+            return await self.async_client.chat.completions.create(
                 model=self.deployment,
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_prompt}
-                ],
+                messages=messages,
                 temperature=0,
-                response_format={"type": "json_object"}
+                seed=0,
+                **kwargs
             )
+    
+    @_retry_transient
+    async def _raw_chat_aiohttp(self, messages: list[dict], **kwargs) -> str:
+        """
+        Create a chat completion by POSTing to the Azure OpenAI REST endpoint
+        with aiohttp, which holds up better than the SDK's httpx transport at
+        high concurrency.
+        
+        Returns:
+            The completion text
+        """
+        url = (
+            f"{Config.AZURE_OPENAI_ENDPOINT.rstrip('/')}/openai/deployments/{self.deployment}"
+            f"/chat/completions?api-version={Config.AZURE_OPENAI_API_VERSION}"
+        )
+        body = {"messages": messages, "temperature": 0, "seed": 0, **kwargs}
+        
+        session = _get_aiohttp_session()
+        async with self.rate_limiter.request(_estimate_tokens(messages)):
+            async with session.post(url, json=body, headers={"api-key": Config.AZURE_OPENAI_API_KEY}) as response:
+                if response.status == 429 or response.status >= 500:
+                    raise TransientHTTPError(response, await response.text())
+                if response.status != 200:
+                    raise LLMComparisonError(f"HTTP {response.status}: {await response.text()}")
+                result = await response.json()
+        
+        return result["choices"][0]["message"]["content"]
+    
+    def _cache_get(self, key: str):
+        """Look up a cached completion, in memory first and then on disk."""
+        with _RESULT_CACHE_LOCK:
+            content = _result_cache.get(key)
+            if content is not None:
+                _result_cache.move_to_end(key)
+                return content
+        if self.disk_cache is not None:
+            content = self.disk_cache.get(key)
+            if content is not None:
+                self._cache_put(key, content, persist=False)
+            return content
+        return None
+    
+    def _cache_put(self, key: str, content: str, persist: bool = True):
+        """Store a completion, evicting the least recently used entry when full."""
+        with _RESULT_CACHE_LOCK:
+            _result_cache[key] = content
+            _result_cache.move_to_end(key)
+            if len(_result_cache) > RESULT_CACHE_SIZE:
+                _result_cache.popitem(last=False)
+        if persist and self.disk_cache is not None:
+            self.disk_cache.set(key, content, expire=Config.LLM_CACHE_TTL)
+    
+    def _complete(self, messages: list[dict], use_cache: bool = True, **kwargs) -> str:
+        """
+        Get the completion text for a request, reusing cached results for identical requests.
+        
+        use_cache=False skips the lookup and always calls the model; the fresh
+        result still replaces the cached one.
+        """
+        key = _result_cache_key(messages, kwargs)
+        content = self._cache_get(key) if use_cache else None
+        if content is None:
+            content = self._chat(messages, **kwargs).choices[0].message.content
+            self._cache_put(key, content)
+        return content
+    
+    def complete_json(self, messages: list[dict], max_tokens: int = None) -> dict:
+        """
+        Run a JSON-mode chat request and parse the response.
+        
+        For callers that build their own prompts; identical requests are served
+        from the result cache like every other LLMClient call. max_tokens bounds
+        the response length (a truncated response fails to parse).
+        """
+        return parse_response_json(self._complete(messages, **_json_mode_kwargs(max_tokens)))
+    
+    async def acomplete_json(self, messages: list[dict], bulk: bool = False, max_tokens: int = None) -> dict:
+        """Async variant of complete_json (bulk as in _acomplete)."""
+        return parse_response_json(await self._acomplete(messages, bulk=bulk, **_json_mode_kwargs(max_tokens)))
+    
+    async def _acomplete(self, messages: list[dict], bulk: bool = False, **kwargs) -> str:
+        """
+        Async variant of _complete.
+        
+        Bulk (high-fanout) requests use the aiohttp transport when
+        Config.HIGH_CONCURRENCY_MODE is enabled.
+        """
+        key = _result_cache_key(messages, kwargs)
+        content = self._cache_get(key)
+        if content is None:
+            if bulk and Config.HIGH_CONCURRENCY_MODE:
+                content = await self._raw_chat_aiohttp(messages, **kwargs)
+            else:
+                content = (await self._achat(messages, **kwargs)).choices[0].message.content
+            self._cache_put(key, content)
+        return content
+    
+    def compare_text_content(self, old_text: str, new_text: str) -> dict:
+        """
+        Compare two text contents and identify changes.
+        
+        Returns a structured response with:
+        - removed: List of text segments removed from old version
+        - added: List of text segments added in new version
+        - modified: List of {old: str, new: str} for modified segments
+        """
+        # Identical inputs have no changes; skip the round-trip
+        if old_text == new_text:
+            return {"removed": [], "added": [], "modified": []}
+        
+        messages = self._text_content_messages(old_text, new_text)
+        
+        try:
+            content = self._complete(messages, response_format=_TEXT_DIFF_FORMAT)
             
-            result = json.loads(response.choices[0].message.content)
-            return {
-                "removed": result.get("removed", []),
-                "added": result.get("added", []),
-                "modified": result.get("modified", [])
-            }
+            return TextDiff.model_validate_json(content).model_dump()
+        except Exception as e:
+            raise _llm_error("LLM comparison failed", e) from e
+    
+    def compare_tabular_data(self, old_data: list[list], new_data: list[list], 
+                             headers: list[str] = None, row_offset: int = 0) -> list[list]:
+        """
+        Compare two tabular datasets row by row.
+        
+        Returns a change matrix where:
+        - "-" means no change
+        - Value means the difference/change description
+        
+        Only rows that differ are sent to the LLM; identical rows are filled with "-".
+        row_offset is the index of the first row in the full table, when comparing one batch of it.
+        """
+        # Identical tables (no changed rows) skip the round-trip
+        changed_idx = _changed_row_indices(old_data, new_data)
+        if not changed_idx:
+            return _expand_row_changes([], changed_idx, new_data)
+        
+        messages = self._tabular_data_messages(
+            [old_data[i] if i < len(old_data) else [] for i in changed_idx],
+            [new_data[i] for i in changed_idx],
+            headers,
+            [row_offset + i for i in changed_idx]
+        )
+        
+        try:
+            content = self._complete(messages, response_format=_TABULAR_DIFF_FORMAT)
+            
+            changes = TabularDiff.model_validate_json(content).changes
+            return _expand_row_changes(changes, changed_idx, new_data)
+        except Exception as e:
+            raise _llm_error("LLM comparison failed", e) from e
+    
+    def compare_tabular_batch(self, old_data: list[list], new_data: list[list],
+                               headers: list[str] = None, batch_size: int = None,
+                               max_concurrent: int = 10,
+                               token_budget: int = TABULAR_BATCH_TOKENS) -> list[list]:
+        """
+        Compare tabular data in batches to handle large datasets.
+        
+        Rows are packed into batches of about token_budget tokens, or into
+        fixed windows of batch_size rows when batch_size is given. Batches are
+        sent concurrently (at most max_concurrent in flight) and their changes
+        are reassembled in row order.
+        """
+        from concurrent.futures import ThreadPoolExecutor
+        
+        batches = self._tabular_batches(old_data, new_data, headers, batch_size, token_budget)
+        if not batches:
+            return []
+        
+        with ThreadPoolExecutor(max_workers=min(max_concurrent, len(batches))) as executor:
+            results = executor.map(lambda batch: self.compare_tabular_data(*batch), batches)
+            return list(itertools.chain.from_iterable(results))
+    
+    def compare_pdf_content(self, old_content: str, new_content: str, use_cache: bool = True) -> dict:
+        """
+        Compare two PDF document contents that may include text and tables.
+        Returns structured changes for highlighting.
+        
+        Identical requests are answered from the result cache (and
+        Config.LLM_CACHE_DIR when set) unless use_cache is False.
+        """
+        # Identical inputs have no changes; skip the round-trip
+        if old_content == new_content:
+            return {"removed": [], "added": [], "modified": []}
+        
+        # Only send paragraphs that differ between versions (with one neighbour each side)
+        old_delta = _changed_paragraphs(old_content, new_content)
+        new_delta = _changed_paragraphs(new_content, old_content)
+        if old_delta == new_delta:
+            return {"removed": [], "added": [], "modified": []}
+        
+        messages = self._pdf_content_messages(old_delta, new_delta)
+        
+        try:
+            content = self._complete(messages, use_cache=use_cache, response_format=_PDF_DIFF_FORMAT)
+            
+            return PdfDiff.model_validate_json(content).model_dump()
         except Exception as e:
-            raise Exception(f"LLM comparison failed: {str(e)}")
+            raise _llm_error("LLM comparison failed", e) from e
     
-    def compare_excel_csv_files(self, old_data_formatted: str, new_data_formatted: str) -> dict:
+    def compare_excel_csv_files(self, old_data_formatted: str, new_data_formatted: str,
+                                file_type: str = None) -> dict:
         """
         Compare Excel/CSV files using the optimized comparison prompt.
         
         Args:
             old_data_formatted: Formatted string representation of old file data
             new_data_formatted: Formatted string representation of new file data
+            file_type: "excel" or "csv" to use the prompt trimmed for that file type
         
         Returns:
             Dictionary with structured changes including:
@@ -295,40 +1108,19 @@ Return JSON with "modified", "added", "removed" arrays."""
             - changes_by_sheet: Detailed changes per sheet
             - summary: Summary statistics
         """
-        from excel_csv_llm_prompt import get_excel_csv_comparison_prompt
+        # Identical inputs have no changes; skip the round-trip
+        if old_data_formatted == new_data_formatted:
+            return _empty_excel_csv_result()
         
-        system_prompt = get_excel_csv_comparison_prompt()
+        messages = self._excel_csv_messages(old_data_formatted, new_data_formatted, file_type)
         
-        user_prompt = f"""Compare these two file versions and identify ALL changes.
-
-{old_data_formatted}
-
-{new_data_formatted}
-
-Follow the comparison methodology systematically:
-1. First, identify sheet-level changes (if Excel)
-2. Then, analyze column structure changes
-3. Next, analyze row structure changes
-4. Finally, perform cell-by-cell value comparison
-5. Generate comprehensive summary statistics
-
-Return the complete JSON response with all detected changes."""
-
         try:
-            response = self.client.chat.completions.create(
-                model=self.deployment,
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_prompt}
-                ],
-                temperature=0,
-                response_format={"type": "json_object"}
-            )
+            content = self._complete(messages, response_format={"type": "json_object"})
             
-            result = json.loads(response.choices[0].message.content)
+            result = parse_response_json(content)
             return result
         except Exception as e:
-            raise Exception(f"LLM Excel/CSV comparison failed: {str(e)}")
+            raise _llm_error("LLM Excel/CSV comparison failed", e) from e
     
     def process_pdf_base64(self, base64_pdf: str, prompt: str = None) -> str:
         """
@@ -341,33 +1133,492 @@ Return the complete JSON response with all detected changes."""
         Returns:
             The LLM's response as a string
         """
+        _check_pdf_size(base64_pdf)
+        
+        try:
+            with self._uploaded_pdf(base64_pdf) as file_id:
+                messages = self._pdf_base64_messages(base64_pdf, prompt, file_id)
+                return self._complete(messages)
+        except Exception as e:
+            raise _llm_error("LLM PDF processing failed", e) from e
+    
+    @contextlib.contextmanager
+    def _uploaded_pdf(self, base64_pdf: str):
+        """Upload a large PDF for the duration of one request, yielding its file_id (None if inlined)."""
+        upload_args = _pdf_upload_args(base64_pdf)
+        if upload_args is None:
+            yield None
+            return
+        file_id = self.client.files.create(**upload_args).id
+        try:
+            yield file_id
+        finally:
+            try:
+                self.client.files.delete(file_id)
+            except Exception as e:
+                print(f"[LLM] Could not delete uploaded PDF {file_id}: {e}")
+    
+    # Batch API: offline, half-price processing for large tabular jobs. Worth it from
+    # about BATCH_API_MIN_BATCHES batches up; smaller inputs should use the live path.
+    # Requires a Global Batch deployment in Azure OpenAI.
+    
+    def submit_tabular_batch_job(self, old_data: list[list], new_data: list[list],
+                                 headers: list[str] = None, batch_size: int = None,
+                                 token_budget: int = TABULAR_BATCH_TOKENS) -> str:
+        """
+        Submit a tabular comparison as an Azure OpenAI Batch API job.
+        
+        Builds the same requests compare_tabular_batch would send, one per
+        batch, and uploads them as a JSONL input file.
+        
+        Returns:
+            The batch job ID, for poll_batch and collect_batch_results
+        """
+        lines = []
+        for idx, batch in enumerate(self._tabular_batches(old_data, new_data, headers, batch_size, token_budget)):
+            lines.append(dumps_compact({
+                "custom_id": f"tabular-{idx}",
+                "method": "POST",
+                "url": "/chat/completions",
+                "body": {
+                    "model": self.deployment,
+                    "messages": self._tabular_data_messages(*batch[:3]),
+                    "temperature": 0,
+                    "seed": 0,
+                    "response_format": _TABULAR_DIFF_FORMAT
+                }
+            }))
+        
+        try:
+            input_file = self.client.files.create(
+                file=("tabular_comparison.jsonl", "\n".join(lines).encode("utf-8")),
+                purpose="batch"
+            )
+            job = self.client.batches.create(
+                input_file_id=input_file.id,
+                endpoint="/chat/completions",
+                completion_window="24h"
+            )
+            return job.id
+        except Exception as e:
+            raise _llm_error("LLM batch job submission failed", e) from e
+    
+    def poll_batch(self, job_id: str) -> str:
+        """
+        Get the status of a Batch API job.
+        
+        Returns:
+            The job status, e.g. "validating", "in_progress", "completed", "failed"
+        """
+        return self.client.batches.retrieve(job_id).status
+    
+    def collect_batch_results(self, job_id: str) -> list[list]:
+        """
+        Download a completed tabular Batch API job and reassemble its change matrix.
+        
+        Returns:
+            The change matrix in row order, as compare_tabular_batch returns it
+        """
+        job = self.client.batches.retrieve(job_id)
+        if job.status != "completed":
+            raise LLMComparisonError(f"LLM batch job {job_id} is not completed (status: {job.status})")
+        
+        try:
+            output = self.client.files.content(job.output_file_id).text
+        except Exception as e:
+            raise _llm_error("LLM batch result download failed", e) from e
+        
+        # Output lines come back in any order; custom_id carries the batch number
+        results = {}
+        for line in output.splitlines():
+            if not line.strip():
+                continue
+            item = parse_response_json(line)
+            response = item.get("response") or {}
+            if item.get("error") or response.get("status_code") != 200:
+                raise LLMComparisonError(f"LLM batch request {item.get('custom_id')} failed: {item.get('error') or response}")
+            content = response["body"]["choices"][0]["message"]["content"]
+            results[int(item["custom_id"].rsplit("-", 1)[1])] = TabularDiff.model_validate_json(content).changes
+        
+        return list(itertools.chain.from_iterable(results[idx] for idx in sorted(results)))
+    
+    # Async variants: same prompts and results, but awaitable so callers can run
+    # many comparisons concurrently (e.g. with asyncio.gather)
+    
+    async def acompare_text_content(self, old_text: str, new_text: str) -> dict:
+        """Async variant of compare_text_content."""
+        # Identical inputs have no changes; skip the round-trip
+        if old_text == new_text:
+            return {"removed": [], "added": [], "modified": []}
+        
+        messages = self._text_content_messages(old_text, new_text)
+        
+        try:
+            content = await self._acomplete(messages, response_format=_TEXT_DIFF_FORMAT)
+            
+            return TextDiff.model_validate_json(content).model_dump()
+        except Exception as e:
+            raise _llm_error("LLM comparison failed", e) from e
+    
+    async def acompare_tabular_data(self, old_data: list[list], new_data: list[list],
+                                    headers: list[str] = None, row_offset: int = 0,
+                                    bulk: bool = False) -> list[list]:
+        """
+        Async variant of compare_tabular_data.
+        
+        bulk marks calls made as part of a large fan-out (see _acomplete).
+        """
+        # Identical tables (no changed rows) skip the round-trip
+        changed_idx = _changed_row_indices(old_data, new_data)
+        if not changed_idx:
+            return _expand_row_changes([], changed_idx, new_data)
+        
+        messages = self._tabular_data_messages(
+            [old_data[i] if i < len(old_data) else [] for i in changed_idx],
+            [new_data[i] for i in changed_idx],
+            headers,
+            [row_offset + i for i in changed_idx]
+        )
+        
+        try:
+            content = await self._acomplete(messages, bulk=bulk, response_format=_TABULAR_DIFF_FORMAT)
+            
+            changes = TabularDiff.model_validate_json(content).changes
+            return _expand_row_changes(changes, changed_idx, new_data)
+        except Exception as e:
+            raise _llm_error("LLM comparison failed", e) from e
+    
+    async def acompare_tabular_batch(self, old_data: list[list], new_data: list[list],
+                                     headers: list[str] = None, batch_size: int = None,
+                                     max_concurrent: int = 10,
+                                     token_budget: int = TABULAR_BATCH_TOKENS) -> list[list]:
+        """Async variant of compare_tabular_batch."""
+        batches = self._tabular_batches(old_data, new_data, headers, batch_size, token_budget)
+        
+        # Bound the requests in flight to stay within the deployment's rate limits
+        semaphore = asyncio.Semaphore(max_concurrent)
+        
+        async def _compare(batch):
+            async with semaphore:
+                return await self.acompare_tabular_data(*batch, bulk=True)
+        
+        results = await asyncio.gather(*[_compare(batch) for batch in batches])
+        return list(itertools.chain.from_iterable(results))
+    
+    async def acompare_pdf_content(self, old_content: str, new_content: str) -> dict:
+        """Async variant of compare_pdf_content."""
+        # Identical inputs have no changes; skip the round-trip
+        if old_content == new_content:
+            return {"removed": [], "added": [], "modified": []}
+        
+        # Only send paragraphs that differ between versions (with one neighbour each side)
+        old_delta = _changed_paragraphs(old_content, new_content)
+        new_delta = _changed_paragraphs(new_content, old_content)
+        if old_delta == new_delta:
+            return {"removed": [], "added": [], "modified": []}
+        
+        messages = self._pdf_content_messages(old_delta, new_delta)
+        
+        try:
+            content = await self._acomplete(messages, response_format=_PDF_DIFF_FORMAT)
+            
+            return PdfDiff.model_validate_json(content).model_dump()
+        except Exception as e:
+            raise _llm_error("LLM comparison failed", e) from e
+    
+    async def compare_pdf_content_chunked(self, old_content: str, new_content: str,
+                                          chunk_tokens: int = 4000, overlap: int = 200,
+                                          max_concurrent: int = 10) -> dict:
+        """
+        Compare large PDF contents as page-aligned chunks sent concurrently.
+        
+        Both versions are split on their PAGE markers into chunks covering the
+        same pages, each compared with acompare_pdf_content (at most
+        max_concurrent in flight). Items reported by more than one chunk, e.g.
+        from the overlap, are kept once.
+        
+        Returns:
+            Same structure as compare_pdf_content
+        """
+        chunks = _page_aligned_chunks(old_content, new_content, chunk_tokens, overlap)
+        if len(chunks) < 2:
+            return await self.acompare_pdf_content(old_content, new_content)
+        
+        semaphore = asyncio.Semaphore(max_concurrent)
+        
+        async def _compare(chunk):
+            async with semaphore:
+                return await self.acompare_pdf_content(*chunk)
+        
+        results = await asyncio.gather(*[_compare(chunk) for chunk in chunks])
+        
+        merged = {"removed": [], "added": [], "modified": []}
+        for change_type, items in merged.items():
+            seen = set()
+            for result in results:
+                for item in result[change_type]:
+                    key = dumps_compact(item, sort_keys=True)
+                    if key not in seen:
+                        seen.add(key)
+                        items.append(item)
+        return merged
+    
+    async def stream_compare_pdf_content(self, old_content: str,
+                                         new_content: str) -> AsyncIterator[dict]:
+        """
+        Streaming variant of compare_pdf_content.
+        
+        Yields each change as soon as the model has finished writing it, as
+        {"type": "removed" | "added" | "modified", "item": {...}}, instead of
+        waiting for the whole response.
+        """
+        old_delta = _changed_paragraphs(old_content, new_content)
+        new_delta = _changed_paragraphs(new_content, old_content)
+        if old_delta == new_delta:
+            return
+        
+        messages = self._pdf_content_messages(old_delta, new_delta)
+        async for change_type, item in self.astream_json_items(messages, response_format=_PDF_DIFF_FORMAT):
+            if change_type in ("removed", "added", "modified"):
+                yield {"type": change_type, "item": item}
+    
+    async def astream_json_items(self, messages: list[dict], response_format: dict = None,
+                                 max_tokens: int = None) -> AsyncIterator[tuple]:
+        """
+        Stream a JSON-mode chat request, yielding (key, item) for each item of the
+        response's top-level arrays as soon as the model has finished writing it.
+        
+        Cached responses are replayed instead of streamed again, and a completed
+        stream is cached like any other result. A response cut off at max_tokens
+        raises LLMTruncatedError once the items written so far have been yielded,
+        and is not cached.
+        """
+        kwargs = _json_mode_kwargs(max_tokens)
+        if response_format:
+            kwargs["response_format"] = response_format
+        key = _result_cache_key(messages, kwargs)
+        
+        # Replay a cached response instead of streaming it again
+        cached = self._cache_get(key)
+        if cached is not None:
+            for entry in _JSONArrayItemParser().feed(cached):
+                yield entry
+            return
+        
+        parser = _JSONArrayItemParser()
+        parts = []
+        try:
+            stream = await self._achat(messages, stream=True, **kwargs)
+            async for chunk in stream:
+                # Azure sends a first chunk with no choices (content filter results)
+                if not chunk.choices:
+                    continue
+                text = chunk.choices[0].delta.content
+                if text:
+                    parts.append(text)
+                    for entry in parser.feed(text):
+                        yield entry
+                if chunk.choices[0].finish_reason == "length":
+                    raise LLMTruncatedError("response truncated at max_tokens")
+        except LLMTruncatedError:
+            raise
+        except Exception as e:
+            raise _llm_error("LLM comparison failed", e) from e
+        
+        self._cache_put(key, "".join(parts))
+    
+    async def acompare_excel_csv_files(self, old_data_formatted: str, new_data_formatted: str,
+                                       file_type: str = None) -> dict:
+        """Async variant of compare_excel_csv_files."""
+        # Identical inputs have no changes; skip the round-trip
+        if old_data_formatted == new_data_formatted:
+            return _empty_excel_csv_result()
+        
+        messages = self._excel_csv_messages(old_data_formatted, new_data_formatted, file_type)
+        
+        try:
+            content = await self._acomplete(messages, response_format={"type": "json_object"})
+            
+            result = parse_response_json(content)
+            return result
+        except Exception as e:
+            raise _llm_error("LLM Excel/CSV comparison failed", e) from e
+    
+    async def aprocess_pdf_base64(self, base64_pdf: str, prompt: str = None) -> str:
+        """Async variant of process_pdf_base64."""
+        _check_pdf_size(base64_pdf)
+        
+        try:
+            async with self._auploaded_pdf(base64_pdf) as file_id:
+                messages = self._pdf_base64_messages(base64_pdf, prompt, file_id)
+                return await self._acomplete(messages)
+        except Exception as e:
+            raise _llm_error("LLM PDF processing failed", e) from e
+    
+    @contextlib.asynccontextmanager
+    async def _auploaded_pdf(self, base64_pdf: str):
+        """Async variant of _uploaded_pdf."""
+        upload_args = _pdf_upload_args(base64_pdf)
+        if upload_args is None:
+            yield None
+            return
+        file_id = (await self.async_client.files.create(**upload_args)).id
+        try:
+            yield file_id
+        finally:
+            try:
+                await self.async_client.files.delete(file_id)
+            except Exception as e:
+                print(f"[LLM] Could not delete uploaded PDF {file_id}: {e}")
+    
+    # Prompt builders shared by the sync and async variants
+    
+    def _text_content_messages(self, old_text: str, new_text: str) -> list[dict]:
+        """Build the chat messages for compare_text_content."""
+        system_prompt = _TEXT_SYS_PROMPT
+
+        user_prompt = """Compare these two document versions.
+Return the comparison as JSON with "removed", "added", and "modified" arrays.
+
+=== OLD VERSION ===
+"""
+
+        return [
+            {"role": "system", "content": system_prompt},
+            _user_message(user_prompt, old_text, "\n\n=== NEW VERSION ===\n", new_text)
+        ]
+    
+    def _tabular_data_messages(self, old_data: list[list], new_data: list[list],
+                               headers: list[str] = None, row_indices: list[int] = None) -> list[dict]:
+        """Build the chat messages for compare_tabular_data."""
+        system_prompt = _TABULAR_SYS_PROMPT
+
+        user_prompt = f"""Compare these datasets row by row.
+Return JSON with "changes" as a 2D array matching the structure of the new data.
+
+{f"Only rows that differ are shown; they are rows {row_indices} (0-based) of the full table." if row_indices is not None else ""}
+{f"Headers: {headers}" if headers else ""}
+
+=== OLD DATA ===
+{_to_tsv(old_data)}
+
+=== NEW DATA ===
+{_to_tsv(new_data)}"""
+
+        return [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_prompt}
+        ]
+    
+    def _tabular_batches(self, old_data: list[list], new_data: list[list],
+                         headers: list[str] = None, batch_size: int = None,
+                         token_budget: int = TABULAR_BATCH_TOKENS) -> list[tuple]:
+        """Split two tables into (old_batch, new_batch, headers, row_offset) argument tuples."""
+        batches = []
+        
+        # Determine the row windows to process
+        if batch_size:
+            max_rows = max(len(old_data), len(new_data))
+            windows = [(i, min(i + batch_size, max_rows)) for i in range(0, max_rows, batch_size)]
+        else:
+            windows = _token_packed_batches(old_data, new_data, token_budget)
+        
+        for i, end in windows:
+            old_batch = old_data[i:end]
+            new_batch = new_data[i:end]
+            
+            # Handle case where one dataset is shorter. Missing OLD rows need no padding:
+            # compare_tabular_data treats them as empty. Missing NEW rows are padded so
+            # the change matrix still has a row for each removed OLD row.
+            if len(new_batch) < len(old_batch):
+                new_batch += [[""] * len(row) for row in old_batch[len(new_batch):]]
+            
+            # Headers are only sent with the first batch
+            batches.append((old_batch, new_batch, headers if i == 0 else None, i))
+        
+        return batches
+    
+    def _pdf_content_messages(self, old_content: str, new_content: str) -> list[dict]:
+        """Build the chat messages for compare_pdf_content."""
+        system_prompt = _PDF_SYS_PROMPT
+
+        user_prompt = """Compare these two document versions line by line.
+
+Find ALL differences. For each:
+1. Identify what changed
+2. Extract ONLY the specific value that changed (not whole lines)
+3. Classify correctly (modified/added/removed)
+4. Skip identical content and watermarks
+
+Paragraphs identical in both versions may be replaced by "[... N unchanged paragraphs omitted ...]" markers.
+
+Return JSON with "modified", "added", "removed" arrays.
+
+=== OLD VERSION ===
+"""
+
+        return [
+            {"role": "system", "content": system_prompt},
+            _user_message(user_prompt, old_content, "\n\n=== NEW VERSION ===\n", new_content)
+        ]
+    
+    def _excel_csv_messages(self, old_data_formatted: str, new_data_formatted: str,
+                            file_type: str = None) -> list[dict]:
+        """Build the chat messages for compare_excel_csv_files."""
+        from excel_csv_llm_prompt import get_excel_csv_comparison_prompt
+        
+        system_prompt = get_excel_csv_comparison_prompt(file_type)
+        
+        user_prompt = """Compare these two file versions and identify ALL changes.
+
+Follow the comparison methodology systematically:
+1. First, identify sheet-level changes (if Excel)
+2. Then, analyze column structure changes
+3. Next, analyze row structure changes
+4. Finally, perform cell-by-cell value comparison
+5. Generate comprehensive summary statistics
+
+Return the complete JSON response with all detected changes.
+
+"""
+
+        return [
+            {"role": "system", "content": system_prompt},
+            _user_message(user_prompt, old_data_formatted, "\n\n", new_data_formatted)
+        ]
+    
+    def _pdf_base64_messages(self, base64_pdf: str, prompt: str = None,
+                             file_id: str = None) -> list[dict]:
+        """Build the chat messages for process_pdf_base64, referencing file_id when the PDF was uploaded."""
         if prompt is None:
             prompt = "Analyze this PDF document and provide a detailed summary of its contents, including any text, tables, and key information."
         
+        if file_id is not None:
+            return [
+                {
+                    "role": "user",
+                    "content": [
+                        {"type": "text", "text": prompt},
+                        {"type": "file", "file": {"file_id": file_id}}
+                    ]
+                }
+            ]
+        
         # Create data URI for the PDF
         data_uri = f"data:application/pdf;base64,{base64_pdf}"
         
-        try:
-            response = self.client.chat.completions.create(
-                model=self.deployment,
-                messages=[
+        return [
+            {
+                "role": "user",
+                "content": [
+                    {"type": "text", "text": prompt},
                     {
-                        "role": "user",
-                        "content": [
-                            {"type": "text", "text": prompt},
-                            {
-                                "type": "image_url",
-                                "image_url": {
-                                    "url": data_uri
-                                }
-                            }
-                        ]
+                        "type": "image_url",
+                        "image_url": {
+                            "url": data_uri
+                        }
                     }
-                ],
-                temperature=0
-            )
-            
-            return response.choices[0].message.content
-        except Exception as e:
-            raise Exception(f"LLM PDF processing failed: {str(e)}")
+                ]
+            }
+        ]
 
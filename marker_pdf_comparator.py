@@ -1,26 +1,28 @@
 """
 PDF Comparison Pipeline with multiple PDF-to-Markdown options.
-Tries libraries in order: pdfplumber > PyMuPDF4LLM
+Tries libraries in order: PyMuPDF4LLM > pdfplumber
 """
+import asyncio
+import difflib
+import hashlib
+import io
+import itertools
+import math
 import os
 import re
-import tempfile
+import threading
+import warnings
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 from config import Config
-from llm_client import LLMClient
+from llm_client import LLMClient, LLMTruncatedError, count_tokens
 
 # Track available libraries
 AVAILABLE_LIBRARIES = []
 ACTIVE_LIBRARY = None
 
-# Try pdfplumber
-try:
-    import pdfplumber
-    AVAILABLE_LIBRARIES.append("pdfplumber")
-    print("[PDF2MD] pdfplumber loaded successfully")
-except ImportError as e:
-    print(f"[PDF2MD] pdfplumber not available: {e}")
-
-# Try PyMuPDF4LLM (fallback)
+# Try PyMuPDF4LLM first: it runs on the PyMuPDF C++ core and converts pages
+# far faster than pdfplumber's pure-Python pdfminer.six parser
 try:
     import pymupdf4llm
     AVAILABLE_LIBRARIES.append("PyMuPDF4LLM")
@@ -28,97 +30,232 @@ try:
 except ImportError as e:
     print(f"[PDF2MD] PyMuPDF4LLM not available: {e}")
 
+# Try pdfplumber (fallback, or explicit opt-in via library="pdfplumber")
+try:
+    import pdfplumber
+    AVAILABLE_LIBRARIES.append("pdfplumber")
+    print("[PDF2MD] pdfplumber loaded successfully")
+except ImportError as e:
+    print(f"[PDF2MD] pdfplumber not available: {e}")
+
 # Set active library (first available)
 if AVAILABLE_LIBRARIES:
     ACTIVE_LIBRARY = AVAILABLE_LIBRARIES[0]
     print(f"[PDF2MD] Using: {ACTIVE_LIBRARY}")
 
+# Optional: rapidfuzz for disambiguating and fuzzy-matching change locations
+try:
+    from rapidfuzz import fuzz
+    from rapidfuzz.distance import Levenshtein
+    RAPIDFUZZ_AVAILABLE = True
+except ImportError:
+    RAPIDFUZZ_AVAILABLE = False
+
+# Optional: diff-match-patch for the classical diff pre-filter (difflib otherwise)
+try:
+    from diff_match_patch import diff_match_patch
+    DMP_AVAILABLE = True
+except ImportError:
+    DMP_AVAILABLE = False
+
+# Shared LLM client, created on first use and reused by every page and thread
+_LLM_CLIENT = None
+_LLM_CLIENT_LOCK = threading.Lock()
+
+
+def _get_llm_client() -> LLMClient:
+    """Get the module's shared LLMClient, creating it once even under concurrent first calls."""
+    global _LLM_CLIENT
+    if _LLM_CLIENT is None:
+        with _LLM_CLIENT_LOCK:
+            if _LLM_CLIENT is None:
+                _LLM_CLIENT = LLMClient()
+    return _LLM_CLIENT
+
+
+# Page count from which pdfplumber conversion is spread across worker processes
+PDFPLUMBER_PARALLEL_MIN_PAGES = 8
+
+# Pages opened at once by pdfplumber, capping memory on long documents
+PDFPLUMBER_PAGE_BATCH = 50
+
 
-def convert_pdf_with_pdfplumber(pdf_path: str) -> str:
-    """Convert PDF using pdfplumber with table extraction."""
+def _markdown_table_row(row: list) -> str:
+    """Format one extracted table row as a markdown row, cleaning empty and padded cells."""
+    return "| " + " | ".join(str(cell).strip() if cell else "" for cell in row) + " |"
+
+
+def _write_pdfplumber_page(page, page_num: int, buf: io.StringIO):
+    """Write one page's markdown (header, tables, then text) into buf."""
+    buf.write(f"\n## Page {page_num}\n")
+    
+    # Extract tables first
+    tables = page.extract_tables()
+    
+    if tables:
+        for table in tables:
+            if table and len(table) > 0:
+                # Convert table to markdown, one row at a time
+                buf.write("\n\n")
+                buf.write(_markdown_table_row(table[0]))
+                # Add header separator
+                buf.write("\n|" + "|".join(["---"] * len(table[0])) + "|")
+                for row in itertools.islice(table, 1, None):
+                    buf.write("\n")
+                    buf.write(_markdown_table_row(row))
+                # Blank line after each table
+                buf.write("\n\n")
+    
+    # Extract text
+    text = page.extract_text()
+    if text:
+        buf.write("\n\n")
+        buf.write(text)
+
+
+def _open_pdfplumber(pdf_source, pages: list = None):
+    """Open a PDF given as a file path or as raw bytes (read from memory) with pdfplumber."""
     import pdfplumber
     
-    markdown_parts = []
+    if isinstance(pdf_source, bytes):
+        pdf_source = io.BytesIO(pdf_source)
+    return pdfplumber.open(pdf_source, pages=pages)
+
+
+def _convert_pdfplumber_pages(pdf_source, start: int, end: int) -> str:
+    """
+    Convert pages start..end-1 (0-based) of a PDF; also the worker-process task.
     
-    with pdfplumber.open(pdf_path) as pdf:
-        for page_num, page in enumerate(pdf.pages, 1):
-            markdown_parts.append(f"\n## Page {page_num}\n")
-            
-            # Extract tables first
-            tables = page.extract_tables()
-            table_bboxes = []
-            
-            if tables:
-                for table in tables:
-                    if table and len(table) > 0:
-                        # Convert table to markdown
-                        md_table = []
-                        for i, row in enumerate(table):
-                            # Clean cells
-                            clean_row = [str(cell).strip() if cell else "" for cell in row]
-                            md_table.append("| " + " | ".join(clean_row) + " |")
-                            if i == 0:
-                                # Add header separator
-                                md_table.append("|" + "|".join(["---"] * len(clean_row)) + "|")
-                        markdown_parts.append("\n".join(md_table))
-                        markdown_parts.append("")
-            
-            # Extract text
-            text = page.extract_text()
-            if text:
-                markdown_parts.append(text)
+    The PDF is opened PDFPLUMBER_PAGE_BATCH pages at a time, so pdfminer only
+    holds one batch's parsed state and each batch is released before the next.
+    """
+    # Written straight into one buffer; blocks are separated by blank lines
+    buf = io.StringIO()
+    
+    for batch_start in range(start, end, PDFPLUMBER_PAGE_BATCH):
+        batch_end = min(batch_start + PDFPLUMBER_PAGE_BATCH, end)
+        with _open_pdfplumber(pdf_source, pages=list(range(batch_start + 1, batch_end + 1))) as pdf:
+            for page_num, page in enumerate(pdf.pages, batch_start + 1):
+                if page_num > start + 1:
+                    buf.write("\n\n")
+                _write_pdfplumber_page(page, page_num, buf)
+                page.close()
+    
+    return buf.getvalue()
+
+
+def convert_pdf_with_pdfplumber(pdf_source) -> str:
+    """
+    Convert PDF using pdfplumber with table extraction.
+    
+    Page extraction is CPU-bound pure Python, so larger PDFs are converted in
+    contiguous page blocks across worker processes and reassembled in order.
+    
+    Args:
+        pdf_source: Path to the PDF file, or the PDF's bytes
+    """
+    with _open_pdfplumber(pdf_source) as pdf:
+        total_pages = len(pdf.pages)
+    
+    workers = max(1, (os.cpu_count() or 1) - 1)
+    if total_pages < PDFPLUMBER_PARALLEL_MIN_PAGES or workers == 1:
+        return _convert_pdfplumber_pages(pdf_source, 0, total_pages)
+    
+    # About two blocks per worker: enough to balance uneven pages while each
+    # task still opens the PDF only once
+    block_size = math.ceil(total_pages / (workers * 2))
+    starts = list(range(0, total_pages, block_size))
+    ends = [min(start + block_size, total_pages) for start in starts]
     
-    return "\n\n".join(markdown_parts)
+    with ProcessPoolExecutor(max_workers=min(workers, len(starts))) as executor:
+        blocks = executor.map(_convert_pdfplumber_pages, [pdf_source] * len(starts), starts, ends)
+        return "\n\n".join(blocks)
+
+
+# Page markers written by both converters (## Page N)
+_PAGE_SPLIT_RE = re.compile(r'## Page (\d+)')
+
+
+# Recently split documents, keyed by a hash of their markdown (FIFO, bounded)
+_PAGES_CACHE_SIZE = 8
+_pages_cache: "OrderedDict[bytes, dict]" = OrderedDict()
 
 
 def extract_pages_from_markdown(markdown: str) -> dict:
     """Extract markdown content page by page. Returns dict: {page_num: markdown_content}"""
-    pages = {}
-    
     if not markdown:
-        return pages
+        return {}
     
-    # Split by page markers (## Page N)
-    page_sections = re.split(r'## Page (\d+)', markdown)
+    key = hashlib.blake2b(markdown.encode("utf-8"), digest_size=16).digest()
+    if key in _pages_cache:
+        return dict(_pages_cache[key])
+    
+    pages = _split_markdown_pages(markdown)
+    _pages_cache[key] = pages
+    if len(_pages_cache) > _PAGES_CACHE_SIZE:
+        _pages_cache.popitem(last=False)
+    # Callers get their own dict so the cached split is never modified
+    return dict(pages)
+
+
+def _split_markdown_pages(markdown: str) -> dict:
+    """Split markdown on its page markers into {page_num: markdown_content}."""
+    pages = {}
+    
+    # Walk the page markers (## Page N); each page runs up to the next marker
+    matches = list(_PAGE_SPLIT_RE.finditer(markdown))
     
     # Handle content before first page marker (if any)
-    if page_sections and page_sections[0].strip():
-        pages[1] = page_sections[0].strip()
+    first_start = matches[0].start() if matches else len(markdown)
+    leading = markdown[:first_start].strip()
+    if leading:
+        pages[1] = leading
     
     # Process page markers and their content
-    for i in range(1, len(page_sections), 2):
-        if i + 1 < len(page_sections):
-            try:
-                page_num = int(page_sections[i])
-                page_content = page_sections[i + 1].strip()
-                if page_content:
-                    pages[page_num] = page_content
-            except (ValueError, IndexError):
-                continue
+    for i, match in enumerate(matches):
+        end = matches[i + 1].start() if i + 1 < len(matches) else len(markdown)
+        page_content = markdown[match.end():end].strip()
+        if page_content:
+            pages[int(match.group(1))] = page_content
     
     return pages
 
 
-def convert_pdf_with_pymupdf4llm(pdf_path: str) -> str:
-    """Convert PDF using PyMuPDF4LLM."""
-    return pymupdf4llm.to_markdown(pdf_path)
+def _join_pymupdf4llm_pages(chunks: list) -> str:
+    """Join PyMuPDF4LLM page chunks under the same ## Page N markers pdfplumber output uses."""
+    return "\n\n".join(
+        f"\n## Page {page_num}\n\n{chunk['text']}" for page_num, chunk in enumerate(chunks, 1)
+    )
+
+
+def convert_pdf_with_pymupdf4llm(pdf_source) -> str:
+    """Convert PDF (a file path, or the PDF's bytes opened in memory) using PyMuPDF4LLM."""
+    # page_chunks keeps page boundaries so extract_pages_from_markdown can split the output
+    if isinstance(pdf_source, bytes):
+        import pymupdf
+        with pymupdf.open(stream=pdf_source, filetype="pdf") as doc:
+            return _join_pymupdf4llm_pages(pymupdf4llm.to_markdown(doc, page_chunks=True))
+    return _join_pymupdf4llm_pages(pymupdf4llm.to_markdown(pdf_source, page_chunks=True))
 
 
-def convert_pdf_to_markdown(pdf_path: str, library: str = None) -> str:
+def convert_pdf_to_markdown(pdf_source, library: str = None) -> str:
     """
     Convert PDF to Markdown using specified or default library.
+    
+    pdf_source is a file path or the PDF's bytes.
     """
     lib = library or ACTIVE_LIBRARY
     
     if not lib:
         raise ImportError("No PDF-to-Markdown library available. Install: pip install pdfplumber pymupdf4llm")
     
-    print(f"[PDF2MD] Converting with {lib}: {pdf_path}")
+    source_label = f"<{len(pdf_source)} bytes>" if isinstance(pdf_source, bytes) else pdf_source
+    print(f"[PDF2MD] Converting with {lib}: {source_label}")
     
     if lib == "pdfplumber":
-        markdown = convert_pdf_with_pdfplumber(pdf_path)
+        markdown = convert_pdf_with_pdfplumber(pdf_source)
     elif lib == "PyMuPDF4LLM":
-        markdown = convert_pdf_with_pymupdf4llm(pdf_path)
+        markdown = convert_pdf_with_pymupdf4llm(pdf_source)
     else:
         raise ValueError(f"Unknown library: {lib}")
     
@@ -126,650 +263,164 @@ def convert_pdf_to_markdown(pdf_path: str, library: str = None) -> str:
     return markdown
 
 
+# Recent conversions, keyed by a hash of the PDF bytes plus the library (FIFO, bounded)
+_MARKDOWN_CACHE_SIZE = 16
+_markdown_cache: "OrderedDict[str, str]" = OrderedDict()
+
+
 def convert_pdf_bytes_to_markdown(pdf_bytes: bytes, library: str = None) -> str:
-    """Convert PDF bytes to Markdown."""
-    with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmp:
-        tmp.write(pdf_bytes)
-        tmp_path = tmp.name
+    """
+    Convert PDF bytes to Markdown, reading them from memory rather than a temp file.
     
-    try:
-        markdown = convert_pdf_to_markdown(tmp_path, library)
-    finally:
-        os.unlink(tmp_path)
+    Results are cached by content hash, so comparing one version against several
+    others converts it once. Config.PDF2MD_CACHE_DIR adds a persistent tier.
+    """
+    lib = library or ACTIVE_LIBRARY
+    key = f"{hashlib.blake2b(pdf_bytes, digest_size=16).hexdigest()}.{lib}"
+    if key in _markdown_cache:
+        return _markdown_cache[key]
     
+    cache_path = os.path.join(Config.PDF2MD_CACHE_DIR, f"{key}.md") if Config.PDF2MD_CACHE_DIR else None
+    if cache_path and os.path.exists(cache_path):
+        with open(cache_path, encoding="utf-8") as f:
+            markdown = f.read()
+    else:
+        markdown = convert_pdf_to_markdown(pdf_bytes, lib)
+        if cache_path:
+            # Write then rename, so a concurrent reader never sees a partial file
+            os.makedirs(Config.PDF2MD_CACHE_DIR, exist_ok=True)
+            tmp_path = f"{cache_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(markdown)
+            os.replace(tmp_path, cache_path)
+    
+    _markdown_cache[key] = markdown
+    if len(_markdown_cache) > _MARKDOWN_CACHE_SIZE:
+        _markdown_cache.popitem(last=False)
     return markdown
 
 
+# Patterns used by normalize_markdown, compiled once
+_DRAFT_RE = re.compile(r'\bDRAFT\b', re.IGNORECASE)
+# Lines holding only a page number ("12", "-12-") or a stray watermark letter
+_JUNK_LINE_RE = re.compile(r'^\s*(?:\d+|-\s*\d+\s*-|[TFARD])\s*$', re.MULTILINE)
+_SEP_RE = re.compile(r'-{5,}')
+_BLANK_RE = re.compile(r'\n{4,}')
+# Table spacing pattern only matches whitespace that is not already a single space,
+# so the many well-formed "| cell |" separators are not substituted for themselves
+_PIPE_L_RE = re.compile(r'\|(?! (?!\s))\s+')
+
+
 def normalize_markdown(markdown: str) -> str:
     """Clean up markdown while preserving structure."""
     if not markdown:
         return ""
     
+    # Literal substring checks skip the regex passes when there is nothing to replace
+    
     # Remove DRAFT watermarks
-    markdown = re.sub(r'\bDRAFT\b', '', markdown, flags=re.IGNORECASE)
+    if 'draft' in markdown.lower():
+        markdown = _DRAFT_RE.sub('', markdown)
     
-    # Remove standalone page numbers
-    markdown = re.sub(r'^\s*\d+\s*$', '', markdown, flags=re.MULTILINE)
+    # Remove standalone page numbers and watermark letters
+    markdown = _JUNK_LINE_RE.sub('', markdown)
     
     # Remove excessive separators
-    markdown = re.sub(r'-{5,}', '---', markdown)
+    if '-----' in markdown:
+        markdown = _SEP_RE.sub('---', markdown)
     
     # Normalize excessive whitespace
-    markdown = re.sub(r'\n{4,}', '\n\n\n', markdown)
+    if '\n\n\n\n' in markdown:
+        markdown = _BLANK_RE.sub('\n\n\n', markdown)
     
     # Clean up table formatting
-    markdown = re.sub(r'\|\s+', '| ', markdown)
-    markdown = re.sub(r'\s+\|', ' |', markdown)
+    markdown = _PIPE_L_RE.sub('| ', markdown)
+    # Whitespace before a pipe is the same pattern on the reversed text. Led by the
+    # literal "|", it is only tried at pipes instead of at every whitespace character
+    markdown = _PIPE_L_RE.sub('| ', markdown[::-1])[::-1]
     
     return markdown.strip()
 
 
-def compare_markdown_page_with_llm(old_page_markdown: str, new_page_markdown: str, page_num: int) -> dict:
-    """Compare a single page's markdown content and get old/new value pairs."""
-    llm_client = LLMClient()
-    
-    system_prompt = """You are a document comparison expert. Compare two versions of a SINGLE PAGE and identify ALL changes.
-
-## CHANGE TYPES
-
-### TYPE 1: NUMERICAL CHANGES (tables, financial data)
-- Individual numbers, amounts, percentages, dates
-- Extract ONE value per change
-- Example: "370,308", "(111,125)", "31.59%", "31 March 2025"
-
-### TYPE 2: TEXTUAL CHANGES (paragraphs, sentences, phrases)
-- Added text: Entire paragraph/sentence that appears ONLY in NEW
-- Deleted text: Entire paragraph/sentence that appears ONLY in OLD
-- Modified text: Changed words/phrases within existing text
-- Extract COMPLETE text blocks (entire sentences/paragraphs) for highlighting
-
-## OUTPUT FORMAT (strict JSON)
-{
-  "changes": [
-    {
-      "old": "exact old value or empty string if added",
-      "new": "exact new value or empty string if deleted",
-      "change_type": "numerical|text_added|text_deleted|text_modified",
-      "context": "brief description",
-      "surrounding_text_before": "2-5 words before (for numerical) or paragraph before (for text)",
-      "surrounding_text_after": "2-5 words after (for numerical) or paragraph after (for text)",
-      "section": "section/table name",
-      "row_label": "row label if in table, else empty",
-      "position_hint": "unique identifier for repeated values"
-    }
-  ]
-}
-
-## RULES - NUMERICAL CHANGES
-- Extract ONE numerical value per change (numbers, amounts, percentages, dates)
-- **CRITICAL: Numerical changes contain ONLY numbers - NO text, NO words, NO labels**
-- If a line has multiple values, create separate entries for EACH changed value
-- Return EXACT text as it appears (commas, parentheses, formatting)
-- If same value appears multiple times, return ONE entry per instance with unique position_hint
-- Provide context: surrounding_text_before/after (2-5 words), section, row_label
-- **Example**: If "Debtors 5 2,840,839" changes to "Debtors 6 2,841,188":
-  - ❌ WRONG: {"old": "Debtors 5 2,840,839", "new": "Debtors 6 2,841,188"} (mixes text and numbers)
-  - ✅ CORRECT: Three separate entries (text and numerical must NEVER be mixed):
-    - Entry 1: {"old": "Debtors", "new": "Debtors", "change_type": "text_modified", ...} (text label)
-    - Entry 2: {"old": "5", "new": "6", "change_type": "numerical", ...} (note number)
-    - Entry 3: {"old": "2,840,839", "new": "2,841,188", "change_type": "numerical", ...} (value)
-
-## RULES - TEXTUAL CHANGES
-
-### TEXT ADDED (appears only in NEW):
-- `change_type`: "text_added"
-- `old`: "" (empty string)
-- `new`: COMPLETE added text (entire sentence/paragraph)
-- **CRITICAL: Text changes contain ONLY words/text - NO numbers, NO amounts**
-- Capture the FULL text block for highlighting
-- Example: If a new paragraph was added, include the ENTIRE paragraph
-
-### TEXT DELETED (appears only in OLD):
-- `change_type`: "text_deleted"
-- `old`: COMPLETE deleted text (entire sentence/paragraph)
-- `new`: "" (empty string)
-- **CRITICAL: Text changes contain ONLY words/text - NO numbers, NO amounts**
-- Capture the FULL text block that was removed
-- Example: If a paragraph was deleted, include the ENTIRE paragraph
-
-### TEXT MODIFIED (changed within existing text):
-- `change_type`: "text_modified"
-- `old`: Original text (can be phrase, sentence, or paragraph)
-- `new`: New text (can be phrase, sentence, or paragraph)
-- **CRITICAL: Text changes contain ONLY words/text - NO numbers, NO amounts**
-- If text contains numbers that changed, extract ONLY the text part, create separate numerical entry for numbers
-- Capture COMPLETE changed text blocks, not just individual words
-- Example: If a sentence was rewritten, include the FULL old and new sentences
-- **Example**: If "Tangible assets 4" changes to "Tangible assets 5":
-  - ❌ WRONG: {"old": "Tangible assets 4", "new": "Tangible assets 5", "change_type": "text_modified"} (contains number)
-  - ✅ CORRECT: {"old": "4", "new": "5", "change_type": "numerical", ...} (just the number)
-
-## GENERAL RULES
-- Return changes in ORDER from TOP to BOTTOM
-- Only include actual changes (old ≠ new)
-- Provide MAXIMUM context for unique identification
-- **CRITICAL SEPARATION RULE:**
-  - **Text changes (text_added, text_deleted, text_modified) must contain ONLY words/text - NO numbers**
-  - **Numerical changes must contain ONLY numbers/amounts - NO text, NO words, NO labels**
-  - **If a line has both text and numerical changes, create SEPARATE entries for each**
-  - **Example**: "Debtors 5 2,840,839" → "Debtors 6 2,841,188" should be:
-    - Entry 1: {"old": "Debtors", "new": "Debtors", "change_type": "text_modified", ...} (text label)
-    - Entry 2: {"old": "5", "new": "6", "change_type": "numerical", ...} (note number)
-    - Entry 3: {"old": "2,840,839", "new": "2,841,188", "change_type": "numerical", ...} (value)
-    - NOT: {"old": "Debtors 5 2,840,839", "new": "Debtors 6 2,841,188", ...} (mixed)
-
-## CRITICAL: IGNORE THESE ELEMENTS (DO NOT REPORT AS CHANGES)
-- **Watermarks**: Standalone letters (T, F, A, R, D) scattered in text - remove from values
-- **Page numbers**: "Page 1", "Page 2", "## Page 1", "-1-", "-2-", etc.
-- **Headers/Footers**: Text that repeats on every page (company name, document title, etc.)
-- **DRAFT stamps**: "DRAFT", "CONFIDENTIAL", "FOR REVIEW", etc.
-- **Page markers**: "## Page N", section dividers that are just formatting
-- **Table separators**: "|---|---|", decorative lines
-- **Formatting artifacts**: Extra spaces, line breaks that don't affect meaning
-- **Repeated boilerplate**: Standard disclaimers, legal text that appears in both versions unchanged
-
-**If any of these elements appear to change, IGNORE them - they are not meaningful content changes.**
-
-## EXAMPLES
-
-### NUMERICAL CHANGE (pure number):
-OLD: "D (995,244) (786,436)" → NEW: "D (624,936) (786,436)"
-{
-  "old": "(995,244)",
-  "new": "(624,936)",
-  "change_type": "numerical",
-  "context": "Cost of sales 2025",
-  "surrounding_text_before": "Closing valuation D",
-  "surrounding_text_after": "(786,436)",
-  "section": "Profit and Loss Account",
-  "row_label": "Cost of sales",
-  "position_hint": ""
-}
-
-### MIXED CHANGE - MUST SPLIT (text label + note number + value):
-OLD: "Debtors 5 2,840,839 3,037,014" → NEW: "Debtors 6 2,841,188 3,037,014"
-Return THREE separate entries (text and numerical must NEVER be mixed):
-
-Entry 1 (text label "Debtors"):
-{
-  "old": "Debtors",
-  "new": "Debtors",
-  "change_type": "text_modified",
-  "context": "Debtors label",
-  "surrounding_text_before": "",
-  "surrounding_text_after": "6",
-  "section": "STATEMENT OF FINANCIAL POSITION",
-  "row_label": "Debtors",
-  "position_hint": ""
-}
-(Note: Even if text label didn't change, create a separate entry to show it's part of the line - text and numerical must be separated)
-
-Entry 2 (note number - numerical):
-{
-  "old": "5",
-  "new": "6",
-  "change_type": "numerical",
-  "context": "Note number for Debtors",
-  "surrounding_text_before": "Debtors",
-  "surrounding_text_after": "2,841,188",
-  "section": "STATEMENT OF FINANCIAL POSITION",
-  "row_label": "Debtors",
-  "position_hint": ""
-}
-
-Entry 3 (value - numerical):
-{
-  "old": "2,840,839",
-  "new": "2,841,188",
-  "change_type": "numerical",
-  "context": "Debtors 2024 value",
-  "surrounding_text_before": "Debtors 6",
-  "surrounding_text_after": "3,037,014",
-  "section": "STATEMENT OF FINANCIAL POSITION",
-  "row_label": "Debtors",
-  "position_hint": ""
-}
-
-❌ WRONG (mixed - text and numerical combined):
-{"old": "Debtors 5 2,840,839", "new": "Debtors 6 2,841,188", "change_type": "text_modified"}
-{"old": "5 2,840,839", "new": "6 2,841,188", "change_type": "numerical"}
-
-### TEXT ADDED (new paragraph):
-NEW has: "...previous text. This is a new paragraph that was added. It contains important information about the changes. Next text..."
-{
-  "old": "",
-  "new": "This is a new paragraph that was added. It contains important information about the changes.",
-  "change_type": "text_added",
-  "context": "New paragraph added",
-  "surrounding_text_before": "previous text",
-  "surrounding_text_after": "Next text",
-  "section": "Notes to Accounts",
-  "row_label": "",
-  "position_hint": ""
-}
-
-### TEXT DELETED (removed paragraph):
-OLD had: "...previous text. This paragraph was removed entirely. It contained old information. Next text..."
-NEW has: "...previous text. Next text..."
-{
-  "old": "This paragraph was removed entirely. It contained old information.",
-  "new": "",
-  "change_type": "text_deleted",
-  "context": "Paragraph deleted",
-  "surrounding_text_before": "previous text",
-  "surrounding_text_after": "Next text",
-  "section": "Notes to Accounts",
-  "row_label": "",
-  "position_hint": ""
-}
-
-### TEXT MODIFIED (sentence changed):
-OLD: "The company reported a loss for the year."
-NEW: "The company reported a profit for the year."
-{
-  "old": "The company reported a loss for the year.",
-  "new": "The company reported a profit for the year.",
-  "change_type": "text_modified",
-  "context": "Result description changed",
-  "surrounding_text_before": "previous sentence",
-  "surrounding_text_after": "next sentence",
-  "section": "Notes to Accounts",
-  "row_label": "",
-  "position_hint": ""
-}
-
-### REPEATED NUMERICAL VALUE:
-"195" → "193" appears TWICE:
-First: {"old": "195", "new": "193", "change_type": "numerical", ..., "position_hint": "first instance"}
-Second: {"old": "195", "new": "193", "change_type": "numerical", ..., "position_hint": "second instance"}
-
-## CRITICAL FOR TEXT CHANGES
-- ✅ Capture COMPLETE sentences/paragraphs, not fragments
-- ✅ For added text: Include the ENTIRE new text block
-- ✅ For deleted text: Include the ENTIRE removed text block
-- ✅ For modified text: Include FULL old and new versions
-- ❌ Do NOT capture just individual words - capture complete text blocks
-- **CRITICAL: Text changes must contain ONLY words/text - NO numbers. If text contains numbers, extract numbers separately as numerical changes.**"""
-
-    # Use string concatenation to avoid f-string format errors with curly braces in markdown
-    user_prompt = """Compare these two versions of PAGE """ + str(page_num) + """ and identify ALL changes.
-
-=== OLD VERSION (PAGE """ + str(page_num) + """) ===
-""" + old_page_markdown + """
-
-=== NEW VERSION (PAGE """ + str(page_num) + """) ===
-""" + new_page_markdown + """
-
-## PROCESSING INSTRUCTIONS
-
-### FOR NUMERICAL CHANGES (tables, financial data):
-1. Extract ONE numerical value per change (numbers, amounts, percentages, dates)
-2. **CRITICAL: Numerical changes contain ONLY numbers - NO text, NO words, NO labels**
-3. If a line has multiple values, create separate entries for EACH changed value
-4. Provide context: surrounding_text_before/after (2-5 words), section, row_label
-5. **If a line has both text and numbers that changed, create SEPARATE entries (text and numerical must NEVER be mixed):**
-   - Example: "Debtors 5 2,840,839" → "Debtors 6 2,841,188"
-   - Create: Entry 1 for "Debtors" (text label)
-   - Create: Entry 2 for "5" → "6" (note number - numerical)
-   - Create: Entry 3 for "2,840,839" → "2,841,188" (value - numerical)
-   - NOT: One entry mixing text and numbers
-
-### FOR TEXTUAL CHANGES (paragraphs, sentences):
-1. **TEXT ADDED**: If text appears ONLY in NEW:
-   - Set change_type: "text_added"
-   - old: "" (empty)
-   - new: COMPLETE added text (entire sentence/paragraph)
-   - Capture the FULL text block for highlighting
-
-2. **TEXT DELETED**: If text appears ONLY in OLD:
-   - Set change_type: "text_deleted"
-   - old: COMPLETE deleted text (entire sentence/paragraph)
-   - new: "" (empty)
-   - Capture the FULL removed text block
-
-3. **TEXT MODIFIED**: If text was changed:
-   - Set change_type: "text_modified"
-   - old: COMPLETE original text (sentence/paragraph)
-   - new: COMPLETE new text (sentence/paragraph)
-   - **CRITICAL: Text changes contain ONLY words/text - NO numbers, NO amounts**
-   - If text contains numbers that changed, extract ONLY the text part, create separate numerical entry for numbers
-   - Capture FULL text blocks, not fragments
-
-### CRITICAL SEPARATION RULE:
-- **Text changes (text_added, text_deleted, text_modified) = ONLY words/text, NO numbers**
-- **Numerical changes = ONLY numbers/amounts, NO text, NO words, NO labels**
-- **If a line has both text and numerical changes, create SEPARATE entries for each**
-- **Example**: "Tangible assets 4" → "Tangible assets 5" should be:
-  - {"old": "4", "new": "5", "change_type": "numerical", ...} (just the number)
-  - NOT: {"old": "Tangible assets 4", "new": "Tangible assets 5", "change_type": "text_modified"} (mixed)
-
-### GENERAL:
-- Return changes in ORDER from TOP to BOTTOM
-- Only include actual changes (old ≠ new)
-- Provide maximum context for unique identification
-- For repeated values, use position_hint to distinguish
-
-### CRITICAL: IGNORE THESE (DO NOT REPORT):
-- **Watermarks**: Standalone letters T, F, A, R, D - remove from values, ignore as changes
-- **Page numbers**: "Page 1", "## Page 1", "-1-", etc. - completely ignore
-- **Headers/Footers**: Repeating text on every page - ignore if unchanged
-- **DRAFT stamps**: "DRAFT", "CONFIDENTIAL" - ignore
-- **Formatting**: Table separators, decorative lines, extra spaces - ignore
-- **Boilerplate**: Standard legal text, disclaimers that are identical in both - ignore
-
-**Focus ONLY on meaningful content changes (numbers, text, data), not formatting or document structure elements.**
-
-Return JSON with all changes."""
-
-    try:
-        response = llm_client.client.chat.completions.create(
-            model=llm_client.deployment,
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt}
-            ],
-            temperature=0,
-            response_format={"type": "json_object"}
-        )
-        
-        import json
-        result = json.loads(response.choices[0].message.content)
-        changes = result.get("changes", [])
-        # import pdb; pdb.set_trace()
-
-        
-        # Post-processing: Filter out entries where old == new (no actual change)
-        # This catches any LLM mistakes where it returns unchanged values
-        filtered_changes = []
-        for change in changes:
-            old_val = str(change.get("old", "")).strip()
-            new_val = str(change.get("new", "")).strip()
-            change_type = change.get("change_type", "numerical")
-            
-            # Normalize for comparison
-            # For text changes: remove ALL whitespace (spaces, newlines, tabs) and ignore case
-            # For numerical: remove spaces and ignore case (but preserve number format)
-            if change_type in ["text_added", "text_deleted", "text_modified"]:
-                # Text normalization: remove all whitespace (spaces, newlines, tabs) and lowercase
-                old_normalized = re.sub(r'\s+', '', old_val).lower()
-                new_normalized = re.sub(r'\s+', '', new_val).lower()
-            else:
-                # Numerical normalization: remove spaces and lowercase (preserves number structure)
-                old_normalized = old_val.replace(' ', '').lower()
-                new_normalized = new_val.replace(' ', '').lower()
-            
-            # Only include if values are actually different
-            if old_normalized != new_normalized:
-                filtered_changes.append(change)
-            else:
-                # Log filtered entries for debugging
-                print(f"[FILTERED] Removed unchanged value (type: {change_type}): old='{old_val[:50]}...', new='{new_val[:50]}...', context='{change.get('context', '')}'")
-        
-        return filtered_changes
-        
-    except Exception as e:
-        raise Exception(f"LLM comparison failed: {str(e)}")
-
-
-def locate_changes_in_markdown(new_page_markdown: str, changes: list, page_num: int) -> list:
-    """
-    Use LLM to intelligently locate where each change appears in the new page markdown.
-    Returns list with location information for each change.
+def pages_equivalent(old_page_markdown: str, new_page_markdown: str) -> bool:
     """
-    llm_client = LLMClient()
-    
-    if not changes:
-        return []
+    Check whether two pages can only differ in ways the comparison ignores.
     
-    # Format changes for the prompt with all context information
-    # Escape curly braces in values to avoid f-string format errors
-    def escape_braces(text):
-        if not text:
-            return ""
-        return str(text).replace('{', '{{').replace('}', '}}')
-    
-    changes_text = "\n".join([
-        f"{i+1}. Type: {c.get('change_type', 'numerical')}\n"
-        f"   old='{escape_braces(c.get('old', ''))[:100]}{'...' if len(c.get('old', '')) > 100 else ''}' → new='{escape_braces(c.get('new', ''))[:100]}{'...' if len(c.get('new', '')) > 100 else ''}'\n"
-        f"   Context: {escape_braces(c.get('context', ''))}\n"
-        f"   Section: {escape_braces(c.get('section', ''))}\n"
-        f"   Row Label: {escape_braces(c.get('row_label', ''))}\n"
-        f"   Before: '{escape_braces(c.get('surrounding_text_before', ''))}'\n"
-        f"   After: '{escape_braces(c.get('surrounding_text_after', ''))}'\n"
-        f"   Position: {escape_braces(c.get('position_hint', 'N/A'))}"
-        for i, c in enumerate(changes)
-    ])
-    
-    system_prompt = """You are an intelligent document analysis tool. Your task is to evaluate changes and locate meaningful ones within a document's markdown content.
-
-## YOUR TASK
-Given a list of changes (old → new values) and the NEW version's markdown content:
-1. **EVALUATE** each change to determine if it's meaningful
-2. **SKIP** meaningless changes (spacing, formatting, special characters, minor differences)
-3. **LOCATE** only meaningful changes in the markdown
-
-## MEANINGFUL vs MEANINGLESS CHANGES
-
-### MEANINGFUL CHANGES (DO LOCATE):
-- **Numerical changes**: Different numbers, amounts, percentages, dates
-  - Example: "195" → "193", "(111,125)" → "259,183", "31.59%" → "17.37%"
-- **Text content changes**: Different words, phrases, sentences, paragraphs
-  - Example: "Net loss" → "Net profit", "Creditors" → "Debtors"
-  - Example: Added/deleted entire sentences or paragraphs
-- **Structural changes**: New sections, deleted rows, moved content
-- **Semantic changes**: Changes that affect meaning or understanding
-
-### MEANINGLESS CHANGES (SKIP - DO NOT LOCATE):
-- **Spacing differences**: Only whitespace changed (spaces, tabs, newlines)
-  - Example: "Net profit" → "Net  profit" (extra space)
-  - Example: "Value: 100" → "Value:100" (missing space)
-- **Character encoding**: Different representations of same character
-  - Example: "–" (en dash) vs "-" (hyphen) if meaning is identical
-  - Example: Smart quotes vs straight quotes if meaning is identical
-- **Special character variations**: Different punctuation if meaning unchanged
-  - Example: "Item A" vs "Item A." (trailing period)
-  - Example: "(100)" vs "( 100 )" (spacing in parentheses)
-- **Formatting artifacts**: Markdown formatting differences that don't change content
-  - Example: "**Bold**" vs "Bold" (formatting only)
-  - Example: Different line breaks in same paragraph
-- **Case-only changes**: Only capitalization differs (unless it's a proper noun change)
-  - Example: "profit" → "Profit" (unless it's a title/heading change)
-- **Trivial differences**: Changes so minor they don't affect understanding
-  - Example: "and" → "&" (unless it's a significant abbreviation)
-  - Example: "1st" → "first" (unless it's a formatting preference)
-- **PDF Extraction/OCR Errors**: Single character insertions, deletions, or substitutions that are clearly extraction artifacts
-  - Example: "EngDland" → "England" (OCR inserted 'D' in "England")
-  - Example: "undear" → "under" (OCR misread 'r' as 'ea')
-  - Example: "teaar" → "tear" (OCR duplicated 'a')
-  - Example: "comapny" → "company" (OCR swapped 'a' and 'p')
-  - **Rule**: If the change is a single character difference in a word and the corrected version is a common English word, treat as extraction error
-  - **Exception**: If the change affects meaning (e.g., "form" → "from"), it's meaningful
-
-## EVALUATION CRITERIA
-Before locating a change, ask yourself:
-1. **Does this change affect the meaning or understanding of the document?**
-2. **Is this a real content change or just formatting/spacing?**
-3. **Would a human reader consider this a significant change?**
-4. **Is the difference only in presentation, not in substance?**
-
-**If the answer is NO to questions 1-3 or YES to question 4, SKIP the change (do not include it in locations).**
-
-## OUTPUT FORMAT (strict JSON)
-{
-  "locations": [
-    {
-      "change_index": 0,
-      "search_text": "exact text to search for in PDF",
-      "context_before": "text that appears before the value",
-      "context_after": "text that appears after the value"
-    }
-  ]
-}
-
-**IMPORTANT**: Only include locations for MEANINGFUL changes. If a change is meaningless, simply omit it from the locations array (but keep the change_index sequential for meaningful ones).
-
-## RULES FOR LOCATING MEANINGFUL CHANGES
-
-### FOR NUMERICAL CHANGES:
-- Extract the EXACT numerical value as it appears
-- Use context to find the unique instance
-- search_text should be the exact number/amount
-- **Only locate if the numbers are actually different (not just formatting)**
-
-### FOR TEXT CHANGES (text_added, text_modified):
-- For text_added: search_text should be the COMPLETE added text (or first sentence if very long)
-- For text_modified: search_text should be the COMPLETE new text (or first sentence if very long)
-- For long text blocks, use the first sentence or first 150 characters for search
-- The full text will be used for highlighting, but search_text should be a unique snippet
-- **Only locate if the text content is actually different (not just spacing/formatting)**
-
-### GENERAL:
-- Use ALL provided context to find the EXACT instance
-- Use `surrounding_text_before` and `surrounding_text_after` to locate unique position
-- Use `section` to narrow down search area
-- Use `row_label` for table rows
-- Use `position_hint` to distinguish multiple instances
-- **Remove watermark artifacts (T, F, A, R, D standalone letters) from search_text**
-- **Ignore page numbers, headers, footers when searching - focus on actual content**
-- Process changes in order (change_index 0, 1, 2, etc.)
-- **CRITICAL: Find the EXACT instance using context, not just any occurrence**
-- **CRITICAL: Do NOT search in watermarks, footers, headers, or page numbers - only search in actual document content**
-
-## EXAMPLES
-
-### NUMERICAL CHANGE:
-Change: old='(111,125)' → new='259,183'
-Markdown contains: "...Net result for the year 259,183 (57,131)..."
-Return:
-{
-  "change_index": 0,
-  "search_text": "259,183",
-  "context_before": "Net result for the year",
-  "context_after": "(57,131)"
-}
-
-### NUMERICAL CHANGE (added):
-Change: old='-' → new='370,308'
-Markdown contains: "...Stocks 370,308 380,026..."
-Return:
-{
-  "change_index": 0,
-  "search_text": "370,308",
-  "context_before": "Stocks",
-  "context_after": "380,026"
-}
-
-### TEXT CHANGE (with corrupted/incomplete "new" value):
-Change: old='Key performance indicators\nTBC' → new='Key perforbe Turnover and Earnings Before...' (NOTE: "new" value is corrupted/incomplete)
-Markdown contains: "...Development and performance\n...\nKey performance indicators\nThe Directors consider the key performance indicators of the Company to be Turnover and Earnings Before\nInterest, Tax, Depreciation and Amortisation (EBITDA).\nTurnover for the year was £25.6m...\nOn behalf of the board..."
-Context: surrounding_text_before='Development and performance', surrounding_text_after='On behalf of the board', section='Key performance indicators'
-
-**IMPORTANT**: The "new" value is corrupted ("Key perforbe" instead of "Key performance indicators\nThe Directors consider..."). Use the context to find the correct text.
-
-Return:
-{
-  "change_index": 0,
-  "search_text": "The Directors consider the key performance indicators of the Company to be Turnover and Earnings Before\nInterest, Tax, Depreciation and Amortisation (EBITDA).\nTurnover for the year was £25.6m (2023: £22.4m) an increase of £3.2m (14.3%) as the business expanded its\ncapacity to meet increasing demand.\nEBITDA for the year was £15.0m (2023: £13.4m) an increase of £1.6m (11.9%).",
-  "context_before": "Key performance indicators",
-  "context_after": "On behalf of the board"
-}
-
-**Note**: Extract the COMPLETE text from the markdown that appears between the context markers, not the corrupted "new" value."""
-
-    # Use string concatenation to avoid f-string format errors with curly braces in markdown
-    user_prompt = """Evaluate and locate MEANINGFUL changes in the NEW page markdown content.
+    Byte-identical pages are caught by a plain string comparison (cheaper than
+    hashing both); otherwise the pages are compared after normalize_markdown
+    with whitespace runs collapsed, since spacing-only differences are never
+    reported as changes.
+    """
+    if old_page_markdown == new_page_markdown:
+        return True
+    old_normalized = " ".join(normalize_markdown(old_page_markdown).split())
+    new_normalized = " ".join(normalize_markdown(new_page_markdown).split())
+    return old_normalized == new_normalized
 
-=== CHANGES TO EVALUATE (in order, top to bottom) ===
-""" + changes_text + """
 
-=== NEW PAGE MARKDOWN (PAGE """ + str(page_num) + """) ===
-""" + new_page_markdown + """
+# LLM prompts. Module-level constants keep them byte-identical across calls, and each
+# user prompt puts its static instructions before the page data: Azure OpenAI caches
+# repeated prompt prefixes of 1024+ tokens, so after the first page only the per-page
+# part is billed at the full rate.
 
-## STEP 1: EVALUATE EACH CHANGE
-For each change, determine if it's MEANINGFUL or MEANINGLESS:
+_COMPARE_PAGE_SYSTEM_PROMPT = """You compare two versions of ONE document page and list every meaningful change.
 
-**MEANINGFUL**: Different numbers, different words, added/deleted content, semantic changes
-**MEANINGLESS**: Only spacing changed, only formatting changed, only special characters differ, trivial differences
+CHANGE TYPES
+- numerical: one number/amount/percentage/date per entry, exactly as written ("370,308", "(111,125)", "31.59%", "31 March 2025")
+- text_added: complete sentence/paragraph only in NEW; old=""
+- text_deleted: complete sentence/paragraph only in OLD; new=""
+- text_modified: complete old and new sentence/phrase, not single words
 
-**SKIP meaningless changes** - do not include them in the locations array.
+RULES
+- Never mix text and numbers in one entry: numerical holds only numbers, text_* only words.
+  "Debtors 5 2,840,839" -> "Debtors 6 2,841,188" = {"Debtors"->"Debtors", text_modified}, {"5"->"6", numerical}, {"2,840,839"->"2,841,188", numerical}
+  "Tangible assets 4" -> "Tangible assets 5" = {"4"->"5", numerical}
+- One entry per changed value; a value repeated N times gives N entries told apart by position_hint ("first instance", "second instance")
+- Only real changes (old != new), in order top to bottom
+- surrounding_text_before/after: 2-5 words for numbers, the neighbouring sentence for text
+- IGNORE: watermark letters T F A R D standalone (strip them from values), page numbers ("Page N", "## Page N", "-N-"), repeated headers/footers, DRAFT/CONFIDENTIAL stamps, table separators "|---|", spacing/line breaks, unchanged boilerplate
 
-## STEP 2: LOCATE MEANINGFUL CHANGES
-For each MEANINGFUL change:
-1. **FIRST**: Use the context information to locate the text in the markdown:
-   - Use the surrounding_text_before and surrounding_text_after to find the unique position
-   - Use the section name to narrow down the search area
-   - Use the row_label to find the correct table row
-   - Use the position_hint to distinguish between multiple instances
+OUTPUT (JSON)
+{"changes": [{"old": "", "new": "", "change_type": "numerical|text_added|text_deleted|text_modified", "context": "brief description", "surrounding_text_before": "", "surrounding_text_after": "", "section": "section/table name", "row_label": "table row label or empty", "position_hint": "tells repeated values apart or empty"}]}
 
-2. **THEN**: Find the actual text in the markdown that matches this context:
-   - The "new" value provided might be incomplete, corrupted, or slightly different from what's in the markdown
-   - **DO NOT rely solely on matching the exact "new" value** - use context to find the correct location
-   - Look for text that appears between the surrounding_text_before and surrounding_text_after
-   - Extract the COMPLETE text as it actually appears in the markdown (not the potentially corrupted "new" value)
+EXAMPLE
+OLD "D (995,244) (786,436)" -> NEW "D (624,936) (786,436)":
+{"old": "(995,244)", "new": "(624,936)", "change_type": "numerical", "context": "Cost of sales 2025", "surrounding_text_before": "Closing valuation", "surrounding_text_after": "(786,436)", "section": "Profit and Loss Account", "row_label": "Cost of sales", "position_hint": ""}"""
 
-3. **EXTRACT**: Get the exact text from the markdown:
-   - Extract the EXACT text as it appears in the markdown (this will be used to search the PDF)
-   - For text changes, extract the COMPLETE sentence/paragraph, not just a snippet
-   - If the "new" value is corrupted or incomplete, use the context to find and extract the correct complete text
-   - Remove any watermark artifacts (T, F, A, R, D standalone letters) from the search_text
+_COMPARE_PAGE_INSTRUCTIONS = """Follow the CHANGE TYPES and RULES exactly: split text from numbers, capture complete text blocks, skip the IGNORE list.
+"... (N unchanged lines) ..." stands for lines identical in both versions - never report it.
 
-4. **RETURN**: Provide the location information:
-   - search_text: The COMPLETE text as it appears in the markdown (use this, not the potentially corrupted "new" value)
-   - context_before: Text that appears before this text in the markdown
-   - context_after: Text that appears after this text in the markdown
+Return JSON with all changes."""
 
-**CRITICAL: The "new" value from the first LLM call might be incomplete or corrupted. Use the context (surrounding_text_before, surrounding_text_after, section) to locate the ACTUAL text in the markdown, then extract the COMPLETE text as it appears. Do not just try to match the "new" value if it's clearly wrong or incomplete.**
+_LOCATE_SYSTEM_PROMPT = """You evaluate a list of page changes and locate the meaningful ones in the NEW page markdown.
 
-**CRITICAL: Use the context information to find the EXACT instance specified, not just any occurrence of the value.**
-For example, if position_hint says "first instance" or "main row", find that specific instance, not a different one with the same value.
+SKIP (meaningless - omit from output)
+- whitespace-only ("Net  profit", "Value:100"), en dash vs hyphen, smart vs straight quotes
+- punctuation/markdown-only ("Item A." vs "Item A", "( 100 )" vs "(100)", "**Bold**" vs "Bold")
+- case-only (unless a heading), trivial rewording ("and" -> "&", "1st" -> "first")
+- OCR/extraction errors: one-character slips in a word ("EngDland", "undear", "comapny"), unless the meaning changes ("form" -> "from")
 
-**CRITICAL: IGNORE when searching:**
-- Page numbers ("Page 1", "## Page 1", "-1-")
-- Headers/Footers (repeating text on every page)
-- Watermarks (standalone T, F, A, R, D letters)
-- DRAFT stamps
-- Table separators and formatting
+LOCATE (meaningful)
+- different numbers, dates, percentages; different, added or deleted words, sentences, sections
+- numerical: search_text = the exact number as written
+- text_added/text_modified: search_text = the complete new text as it appears in the markdown (first sentence or ~150 chars if very long)
+- "new" may be corrupted or truncated: find the instance via surrounding_text_before/after, section, row_label and position_hint, then copy the actual markdown text between them
+- pick the exact instance the context describes, not any occurrence
+- strip standalone watermark letters T F A R D; never match in page numbers, headers, footers, DRAFT stamps or table separators
 
-**Only search in actual document content (tables, paragraphs, sections), NOT in headers, footers, or watermarks.**
+OUTPUT (JSON)
+{"locations": [{"change_index": 0, "search_text": "exact markdown text", "context_before": "text just before", "context_after": "text just after"}]}
+change_index is the change's index in the input list; skipped changes are simply left out.
 
-**IMPORTANT**: Only return locations for MEANINGFUL changes. Skip meaningless ones entirely.
+EXAMPLE
+Change 0: old='(111,125)' -> new='259,183'; markdown "...Net result for the year 259,183 (57,131)...":
+{"change_index": 0, "search_text": "259,183", "context_before": "Net result for the year", "context_after": "(57,131)"}"""
 
-Process changes sequentially from top to bottom. Each change_index in the output should correspond to a meaningful change (you may skip some indices if those changes were meaningless).
+_LOCATE_INSTRUCTIONS = """Evaluate each change in order, skip the meaningless ones, and locate the rest using their context rather than trusting the "new" value verbatim.
 
 Return JSON with locations for all MEANINGFUL changes only."""
 
-    try:
-        response = llm_client.client.chat.completions.create(
-            model=llm_client.deployment,
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt}
-            ],
-            temperature=0,
-            response_format={"type": "json_object"}
-        )
-        
-        import json
-        result = json.loads(response.choices[0].message.content)
-        # import pdb; pdb.set_trace()
-        return result.get("locations", [])
-        
-    except Exception as e:
-        raise Exception(f"LLM location matching failed: {str(e)}")
-
-
-def compare_markdown_with_llm(old_markdown: str, new_markdown: str) -> dict:
-    """Use LLM to compare two markdown documents."""
-    llm_client = LLMClient()
-    
-    # Truncate if too long
-    max_chars = 500000
-    if len(old_markdown) > max_chars:
-        old_markdown = old_markdown[:max_chars] + "\n\n... [Document truncated] ..."
-    if len(new_markdown) > max_chars:
-        new_markdown = new_markdown[:max_chars] + "\n\n... [Document truncated] ..."
-    
-    system_prompt = """You are a document comparison tool. Compare two document versions WORD-BY-WORD and identify ALL differences.
+_COMPARE_DOCUMENT_SYSTEM_PROMPT = """You are a document comparison tool. Compare two document versions WORD-BY-WORD and identify ALL differences.
 
 ## YOUR TASK - WORD-BY-WORD COMPARISON
 1. Go through each section, table row, and paragraph systematically
@@ -859,15 +510,617 @@ Words or phrases that exist in OLD but were completely deleted in NEW:
 - Include enough context in "field" to understand what changed
 - Even single word changes should be caught and reported"""
 
-    user_prompt = f"""Compare these two document versions WORD-BY-WORD and identify ALL differences.
 
-=== OLD VERSION ===
-{old_markdown}
+def _is_real_change(change: dict) -> bool:
+    """Check whether a change's old and new values still differ once normalized."""
+    old_val = str(change.get("old", "")).strip()
+    new_val = str(change.get("new", "")).strip()
+    change_type = change.get("change_type", "numerical")
+    
+    # Normalize for comparison
+    # For text changes: remove ALL whitespace (spaces, newlines, tabs) and ignore case
+    # For numerical: remove spaces and ignore case (but preserve number format)
+    if change_type in ["text_added", "text_deleted", "text_modified"]:
+        # Text normalization: remove all whitespace (spaces, newlines, tabs) and lowercase
+        # (str.split() drops exactly the characters \s matches, without the regex engine)
+        old_normalized = "".join(old_val.split()).lower()
+        new_normalized = "".join(new_val.split()).lower()
+    else:
+        # Numerical normalization: remove spaces and lowercase (preserves number structure)
+        old_normalized = old_val.replace(' ', '').lower()
+        new_normalized = new_val.replace(' ', '').lower()
+    
+    if old_normalized != new_normalized:
+        return True
+    
+    # Log filtered entries for debugging (built only when DEBUG is on)
+    if Config.DEBUG:
+        print(f"[FILTERED] Removed unchanged value (type: {change_type}): old='{old_val[:50]}...', new='{new_val[:50]}...', context='{change.get('context', '')}'")
+    return False
 
-=== NEW VERSION ===
-{new_markdown}
 
-Instructions:
+def _filter_unchanged_changes(changes: list) -> list:
+    """
+    Drop changes whose old and new values are equal once normalized.
+    
+    Args:
+        changes: Changes returned by the page comparison LLM
+    
+    Returns:
+        The changes that actually differ
+    """
+    # Post-processing: Filter out entries where old == new (no actual change)
+    # This catches any LLM mistakes where it returns unchanged values
+    return [change for change in changes if _is_real_change(change)]
+
+
+# Unchanged runs longer than this are elided from compare prompts, keeping their edge lines
+COMPACT_MIN_UNCHANGED_LINES = 3
+
+
+def _prepare_compact(old_page_markdown: str, new_page_markdown: str) -> tuple[str, str]:
+    """
+    Shrink a page pair to its changed lines plus anchors for the compare prompt.
+    
+    Inside runs of lines identical in both versions, everything but the first
+    and last line is replaced by a "... (N unchanged lines) ..." marker, so each
+    change keeps an anchor line on both sides. Changed lines are kept verbatim.
+    """
+    old_lines = old_page_markdown.split("\n")
+    new_lines = new_page_markdown.split("\n")
+    old_out = []
+    new_out = []
+    for tag, i1, i2, j1, j2 in difflib.SequenceMatcher(None, old_lines, new_lines, autojunk=False).get_opcodes():
+        if tag == "equal" and i2 - i1 > COMPACT_MIN_UNCHANGED_LINES:
+            marker = f"... ({i2 - i1 - 2} unchanged lines) ..."
+            old_out += [old_lines[i1], marker, old_lines[i2 - 1]]
+            new_out += [new_lines[j1], marker, new_lines[j2 - 1]]
+        else:
+            old_out += old_lines[i1:i2]
+            new_out += new_lines[j1:j2]
+    return "\n".join(old_out), "\n".join(new_out)
+
+
+def _compare_page_messages(old_page_markdown: str, new_page_markdown: str, page_num: int) -> list:
+    """Build the chat messages comparing one page's OLD and NEW markdown (compacted)."""
+    old_page_markdown, new_page_markdown = _prepare_compact(old_page_markdown, new_page_markdown)
+    # Static instructions first, page data last, so the shared prefix stays cacheable.
+    # Use string concatenation to avoid f-string format errors with curly braces in markdown
+    user_prompt = _COMPARE_PAGE_INSTRUCTIONS + """
+
+Compare these two versions of PAGE """ + str(page_num) + """ and identify ALL changes.
+
+=== OLD VERSION (PAGE """ + str(page_num) + """) ===
+""" + old_page_markdown + """
+
+=== NEW VERSION (PAGE """ + str(page_num) + """) ===
+""" + new_page_markdown
+    
+    return [
+        {"role": "system", "content": _COMPARE_PAGE_SYSTEM_PROMPT},
+        {"role": "user", "content": user_prompt}
+    ]
+
+
+def compare_markdown_page_with_llm(old_page_markdown: str, new_page_markdown: str, page_num: int,
+                                   llm_client: LLMClient = None) -> dict:
+    """
+    Compare a single page's markdown content and get old/new value pairs.
+    
+    Pages that are equivalent (identical once watermarks, page numbers and
+    spacing are ignored) return no changes without an LLM call, and repeated
+    page pairs are answered from LLMClient's result cache.
+    """
+    if pages_equivalent(old_page_markdown, new_page_markdown):
+        return []
+    
+    llm_client = llm_client or _get_llm_client()
+    
+    try:
+        result = llm_client.complete_json(
+            _compare_page_messages(old_page_markdown, new_page_markdown, page_num),
+            max_tokens=_response_budget(COMPARE_MAX_TOKENS_PER_PAGE)
+        )
+        changes = result.get("changes", [])
+        
+        return _filter_unchanged_changes(changes)
+        
+    except Exception as e:
+        raise Exception(f"LLM comparison failed: {str(e)}")
+
+
+# Pages packed into one comparison request are capped by count and prompt tokens
+MAX_PAGES_PER_REQUEST = 5
+PAGES_PER_REQUEST_TOKENS = 6000
+
+# Response budgets per page, so a rambling response cannot stall its batch
+COMPARE_MAX_TOKENS_PER_PAGE = 4096
+LOCATE_MAX_TOKENS_PER_PAGE = 2048
+MAX_RESPONSE_TOKENS = 16384
+
+
+def _response_budget(tokens_per_page: int, pages: int = 1) -> int:
+    """Cap on response tokens for a request covering the given number of pages."""
+    return min(tokens_per_page * pages, MAX_RESPONSE_TOKENS)
+
+_COMPARE_PAGES_BATCH_INSTRUCTIONS = """## MULTIPLE PAGES
+The input below contains several pages, each given as an OLD and a NEW version.
+Compare each page's OLD and NEW versions independently - never match content across pages.
+Return JSON grouped by page, with one entry for every page in the input:
+{
+  "pages": [
+    {"page": 1, "changes": [ ...changes for this page, in the format described above... ]}
+  ]
+}
+Use an empty "changes" array for a page with no changes."""
+
+
+def _pack_pages(items: list, max_pages: int, token_budget: int) -> list:
+    """
+    Group per-page tuples (page_num first) into batches for one request each.
+    
+    A page costs the tokens of the strings in its tuple. A batch closes once it
+    holds max_pages pages or the next page would push it past token_budget; a
+    page larger than the budget gets a batch of its own.
+    """
+    batches = []
+    batch = []
+    batch_tokens = 0
+    for item in items:
+        cost = sum(count_tokens(part) for part in item[1:] if isinstance(part, str))
+        if batch and (len(batch) >= max_pages or batch_tokens + cost > token_budget):
+            batches.append(batch)
+            batch = []
+            batch_tokens = 0
+        batch.append(item)
+        batch_tokens += cost
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+def _compare_batch_messages(batch: list) -> list:
+    """Build the chat messages comparing a packed batch of (page_num, old, new) pairs."""
+    if len(batch) == 1:
+        page_num, old_page_markdown, new_page_markdown = batch[0]
+        return _compare_page_messages(old_page_markdown, new_page_markdown, page_num)
+    
+    sections = []
+    for page_num, old_page_markdown, new_page_markdown in batch:
+        old_page_markdown, new_page_markdown = _prepare_compact(old_page_markdown, new_page_markdown)
+        sections.append("=== PAGE " + str(page_num) + " OLD ===\n" + old_page_markdown)
+        sections.append("=== PAGE " + str(page_num) + " NEW ===\n" + new_page_markdown)
+    user_prompt = _COMPARE_PAGE_INSTRUCTIONS + "\n\n" + _COMPARE_PAGES_BATCH_INSTRUCTIONS + """
+
+Compare the OLD and NEW versions of each of these pages and identify ALL changes.
+
+""" + "\n\n".join(sections)
+    
+    return [
+        {"role": "system", "content": _COMPARE_PAGE_SYSTEM_PROMPT},
+        {"role": "user", "content": user_prompt}
+    ]
+
+
+def _split_batch_result(result: dict, batch: list, key: str) -> dict:
+    """
+    Split a batch response into {page_num: result[key]} for every page in the batch.
+    
+    Single-page batches use the single-page response format; pages the model
+    left out of a multi-page response get an empty list.
+    """
+    if len(batch) == 1:
+        return {batch[0][0]: result.get(key, [])}
+    
+    page_results = {}
+    for entry in result.get("pages", []):
+        try:
+            page_results[int(entry.get("page"))] = entry.get(key, [])
+        except (TypeError, ValueError):
+            continue
+    return {item[0]: page_results.get(item[0], []) for item in batch}
+
+
+def _compare_page_batch_with_llm(batch: list, llm_client: LLMClient) -> dict:
+    """Compare a packed batch of page pairs in one LLM call and return {page_num: changes}."""
+    try:
+        result = llm_client.complete_json(
+            _compare_batch_messages(batch),
+            max_tokens=_response_budget(COMPARE_MAX_TOKENS_PER_PAGE, len(batch))
+        )
+    except Exception as e:
+        raise Exception(f"LLM comparison failed: {str(e)}")
+    
+    page_changes = _split_batch_result(result, batch, "changes")
+    return {page_num: _filter_unchanged_changes(changes) for page_num, changes in page_changes.items()}
+
+
+def compare_markdown_pages_batched(pairs: list, llm_client: LLMClient = None,
+                                   max_pages: int = MAX_PAGES_PER_REQUEST,
+                                   token_budget: int = PAGES_PER_REQUEST_TOKENS,
+                                   max_workers: int = 16) -> dict:
+    """
+    Compare many pages with several small pages packed into each LLM request.
+    
+    Each request repeats the page-comparison instructions once for the whole
+    batch instead of once per page. Pages identical once normalized are skipped
+    without an LLM call.
+    
+    Args:
+        pairs: (page_num, old_page_markdown, new_page_markdown) tuples
+        llm_client: Client to use (the module's shared client if not given)
+        max_pages: Maximum number of pages per request
+        token_budget: Maximum page tokens per request
+        max_workers: Maximum number of requests sent at once
+    
+    Returns:
+        {page_num: changes} for every page whose batch succeeded
+    """
+    results = {}
+    pending = []
+    for page_num, old_page_markdown, new_page_markdown in pairs:
+        if pages_equivalent(old_page_markdown, new_page_markdown):
+            results[page_num] = []
+        else:
+            pending.append((page_num, old_page_markdown, new_page_markdown))
+    if not pending:
+        return results
+    
+    llm_client = llm_client or _get_llm_client()
+    batches = _pack_pages(pending, max_pages, token_budget)
+    
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(batches))) as executor:
+        futures = {executor.submit(_compare_page_batch_with_llm, batch, llm_client): batch for batch in batches}
+        for future in as_completed(futures):
+            try:
+                results.update(future.result())
+            except Exception as e:
+                page_nums = ", ".join(str(pair[0]) for pair in futures[future])
+                print(f"    Error comparing pages {page_nums}: {e}")
+    
+    return results
+
+
+def _format_changes_for_prompt(changes: list) -> str:
+    """Format changes, numbered from 1, with all their context for the locate prompt."""
+    # Values are interpolated once by the f-strings below and never passed through
+    # str.format, so braces in them need no escaping.
+    def format_change(i, c):
+        old = str(c.get('old') or '')
+        new = str(c.get('new') or '')
+        return (
+            f"{i+1}. Type: {c.get('change_type', 'numerical')}\n"
+            f"   old='{old[:100]}{'...' if len(old) > 100 else ''}' → new='{new[:100]}{'...' if len(new) > 100 else ''}'\n"
+            f"   Context: {c.get('context') or ''}\n"
+            f"   Section: {c.get('section') or ''}\n"
+            f"   Row Label: {c.get('row_label') or ''}\n"
+            f"   Before: '{c.get('surrounding_text_before') or ''}'\n"
+            f"   After: '{c.get('surrounding_text_after') or ''}'\n"
+            f"   Position: {c.get('position_hint', 'N/A') or ''}"
+        )
+    
+    return "\n".join(format_change(i, c) for i, c in enumerate(changes))
+
+
+# Characters of page text kept on each side of a located change
+LOCATE_CONTEXT_CHARS = 80
+# Minimum rapidfuzz score for a fuzzy (inexact) text match
+FUZZY_LOCATE_CUTOFF = 80
+
+
+def _hint_distance(a: str, b: str) -> float:
+    """Distance between a context hint and the page text next to a candidate match."""
+    if RAPIDFUZZ_AVAILABLE:
+        return Levenshtein.distance(a, b)
+    return 1.0 - difflib.SequenceMatcher(None, a, b).ratio()
+
+
+def _locate_exact(haystack: str, needle: str, before_hint: str = "", after_hint: str = "",
+                  fuzzy: bool = True, whole_value: bool = False):
+    """
+    Find needle in the page markdown without an LLM.
+    
+    Exact hits come from str.find; when there are several, the one whose
+    surrounding text best matches the hints wins. With whole_value, hits that
+    are only part of a longer number or word ("5" inside "2,841,185") are
+    skipped. Without an exact hit, fuzzy searches fall back to a rapidfuzz
+    alignment (when installed).
+    
+    Returns:
+        (start, end) of the match in haystack, or None if it was not found
+    """
+    if not needle:
+        return None
+    
+    hits = []
+    if whole_value:
+        pattern = r'(?<![\w,.])' + re.escape(needle) + r'(?![\w]|[,.]\d)'
+        hits = [m.start() for m in re.finditer(pattern, haystack)]
+    else:
+        idx = haystack.find(needle)
+        while idx != -1:
+            hits.append(idx)
+            idx = haystack.find(needle, idx + 1)
+    
+    if len(hits) == 1 or (hits and not (before_hint or after_hint)):
+        return hits[0], hits[0] + len(needle)
+    if hits:
+        before = before_hint.strip()[-40:]
+        after = after_hint.strip()[:40]
+        
+        def score(start):
+            end = start + len(needle)
+            distance = 0
+            # Compare each hint with a window of its own length next to the hit
+            if before:
+                distance += _hint_distance(before, haystack[max(0, start - len(before)):start].strip())
+            if after:
+                distance += _hint_distance(after, haystack[end:end + len(after)].strip())
+            return distance
+        start = min(hits, key=score)
+        return start, start + len(needle)
+    
+    if fuzzy and RAPIDFUZZ_AVAILABLE:
+        alignment = fuzz.partial_ratio_alignment(needle, haystack, score_cutoff=FUZZY_LOCATE_CUTOFF)
+        if alignment is not None:
+            return alignment.dest_start, alignment.dest_end
+    return None
+
+
+# Punctuation, markdown symbols and whitespace, which alone never make a change meaningful
+_PUNCT_WS_RE = re.compile(r'[\W_]+')
+
+
+def _differs_beyond_punctuation(change: dict) -> bool:
+    """Check whether a change's old and new values still differ without punctuation, whitespace and case."""
+    old_val = _PUNCT_WS_RE.sub("", str(change.get("old") or "")).lower()
+    new_val = _PUNCT_WS_RE.sub("", str(change.get("new") or "")).lower()
+    return old_val != new_val
+
+
+def _locate_change_exact(new_page_markdown: str, change: dict, change_index: int):
+    """
+    Locate one change by string search, returning its location or None.
+    
+    Only changes that still differ without punctuation and whitespace are located
+    here; the rest go to the locate LLM, which decides whether they are meaningful.
+    """
+    change_type = change.get("change_type", "numerical")
+    if change_type == "text_deleted" or not _differs_beyond_punctuation(change):
+        return None
+    span = _locate_exact(
+        new_page_markdown,
+        str(change.get("new") or "").strip(),
+        str(change.get("surrounding_text_before") or ""),
+        str(change.get("surrounding_text_after") or ""),
+        fuzzy=change_type in ["text_added", "text_modified"],
+        whole_value=change_type == "numerical"
+    )
+    if span is None:
+        return None
+    start, end = span
+    return {
+        "change_index": change_index,
+        "search_text": new_page_markdown[start:end],
+        "context_before": new_page_markdown[max(0, start - LOCATE_CONTEXT_CHARS):start],
+        "context_after": new_page_markdown[end:end + LOCATE_CONTEXT_CHARS]
+    }
+
+
+def _locate_changes_exact(new_page_markdown: str, changes: list) -> tuple:
+    """
+    Locate changes by string search, leaving the rest for the LLM.
+    
+    Numerical values must match exactly; only text changes may match fuzzily.
+    Deleted text has no location in the new page and always goes to the LLM, as
+    do punctuation/whitespace-only changes so the LLM can skip the meaningless ones.
+    
+    Returns:
+        (locations for the changes found, [(change_index, change)] still to locate)
+    """
+    locations = []
+    remaining = []
+    for i, change in enumerate(changes):
+        location = _locate_change_exact(new_page_markdown, change, i)
+        if location is None:
+            remaining.append((i, change))
+        else:
+            locations.append(location)
+    return locations, remaining
+
+
+def _remap_locations(locations: list, remaining: list) -> list:
+    """Map change_index values from an LLM locate over remaining back to the full change list."""
+    remapped = []
+    for location in locations:
+        index = location.get("change_index")
+        if isinstance(index, int) and 0 <= index < len(remaining):
+            remapped.append({**location, "change_index": remaining[index][0]})
+    return remapped
+
+
+def _locate_messages(new_page_markdown: str, changes_text: str, page_num: int) -> list:
+    """Build the chat messages locating one page's formatted changes in its new markdown."""
+    # Static instructions first, per-page data last, so the shared prefix stays cacheable.
+    # Use string concatenation to avoid f-string format errors with curly braces in markdown
+    user_prompt = _LOCATE_INSTRUCTIONS + """
+
+Evaluate and locate MEANINGFUL changes in the NEW page markdown content.
+
+=== CHANGES TO EVALUATE (in order, top to bottom) ===
+""" + changes_text + """
+
+=== NEW PAGE MARKDOWN (PAGE """ + str(page_num) + """) ===
+""" + new_page_markdown
+    
+    return [
+        {"role": "system", "content": _LOCATE_SYSTEM_PROMPT},
+        {"role": "user", "content": user_prompt}
+    ]
+
+
+def locate_changes_in_markdown(new_page_markdown: str, changes: list, page_num: int,
+                               llm_client: LLMClient = None) -> list:
+    """
+    Use LLM to intelligently locate where each change appears in the new page markdown.
+    Returns list with location information for each change.
+    """
+    llm_client = llm_client or _get_llm_client()
+    
+    if not changes:
+        return []
+    
+    try:
+        result = llm_client.complete_json(
+            _locate_messages(new_page_markdown, _format_changes_for_prompt(changes), page_num),
+            max_tokens=_response_budget(LOCATE_MAX_TOKENS_PER_PAGE)
+        )
+        return result.get("locations", [])
+        
+    except Exception as e:
+        raise Exception(f"LLM location matching failed: {str(e)}")
+
+
+_LOCATE_PAGES_BATCH_INSTRUCTIONS = """## MULTIPLE PAGES
+The input below contains several pages, each given as its CHANGES and its NEW page markdown.
+Evaluate and locate each page's changes in that page's markdown only; change_index counts
+from 0 within each page.
+Return JSON grouped by page, with one entry for every page in the input:
+{
+  "pages": [
+    {"page": 1, "locations": [ ...locations for this page, in the format described above... ]}
+  ]
+}
+Use an empty "locations" array for a page with no meaningful changes."""
+
+
+def _locate_batch_messages(batch: list) -> list:
+    """Build the chat messages locating a packed batch of (page_num, new, changes_text, changes) items."""
+    if len(batch) == 1:
+        page_num, new_page_markdown, changes_text, _ = batch[0]
+        return _locate_messages(new_page_markdown, changes_text, page_num)
+    
+    sections = []
+    for page_num, new_page_markdown, changes_text, _ in batch:
+        sections.append("=== PAGE " + str(page_num) + " CHANGES (in order, top to bottom) ===\n" + changes_text)
+        sections.append("=== PAGE " + str(page_num) + " NEW MARKDOWN ===\n" + new_page_markdown)
+    user_prompt = _LOCATE_INSTRUCTIONS + "\n\n" + _LOCATE_PAGES_BATCH_INSTRUCTIONS + """
+
+Evaluate and locate MEANINGFUL changes in each page's NEW markdown content.
+
+""" + "\n\n".join(sections)
+    
+    return [
+        {"role": "system", "content": _LOCATE_SYSTEM_PROMPT},
+        {"role": "user", "content": user_prompt}
+    ]
+
+
+def _locate_page_batch_with_llm(batch: list, llm_client: LLMClient) -> dict:
+    """Locate a packed batch of pages' changes in one LLM call and return {page_num: locations}."""
+    try:
+        result = llm_client.complete_json(
+            _locate_batch_messages(batch),
+            max_tokens=_response_budget(LOCATE_MAX_TOKENS_PER_PAGE, len(batch))
+        )
+    except Exception as e:
+        raise Exception(f"LLM location matching failed: {str(e)}")
+    
+    return _split_batch_result(result, batch, "locations")
+
+
+async def _alocate_page_batch_with_llm(batch: list, llm_client: LLMClient) -> dict:
+    """Async variant of _locate_page_batch_with_llm."""
+    try:
+        result = await llm_client.acomplete_json(
+            _locate_batch_messages(batch),
+            bulk=True,
+            max_tokens=_response_budget(LOCATE_MAX_TOKENS_PER_PAGE, len(batch))
+        )
+    except Exception as e:
+        raise Exception(f"LLM location matching failed: {str(e)}")
+    
+    return _split_batch_result(result, batch, "locations")
+
+
+def _prepare_locate_items(page_changes: dict, new_pages: dict) -> tuple:
+    """
+    Locate each page's changes by string search and queue the rest for the LLM.
+    
+    Returns:
+        ({page_num: locations found so far}, packable locate items,
+         {page_num: [(change_index, change)] left for the LLM})
+    """
+    found = {}
+    remaining_by_page = {}
+    for page_num, changes in page_changes.items():
+        if not changes:
+            continue
+        found[page_num], remaining = _locate_changes_exact(new_pages.get(page_num, ""), changes)
+        if remaining:
+            remaining_by_page[page_num] = remaining
+    return found, _locate_items(remaining_by_page, new_pages), remaining_by_page
+
+
+def _locate_items(remaining_by_page: dict, new_pages: dict) -> list:
+    """Build packable (page_num, new, changes_text, changes) locate items for the changes left to the LLM."""
+    items = []
+    for page_num, remaining in remaining_by_page.items():
+        remaining_changes = [change for _, change in remaining]
+        items.append((page_num, new_pages.get(page_num, ""), _format_changes_for_prompt(remaining_changes), remaining_changes))
+    return items
+
+
+def locate_changes_in_pages_batched(page_changes: dict, new_pages: dict, llm_client: LLMClient = None,
+                                    max_pages: int = MAX_PAGES_PER_REQUEST,
+                                    token_budget: int = PAGES_PER_REQUEST_TOKENS,
+                                    max_workers: int = 16) -> dict:
+    """
+    Locate many pages' changes with several pages packed into each LLM request.
+    
+    Changes found by string search in their page are located directly; only the
+    rest (including every punctuation/whitespace-only change) are sent to the LLM.
+    
+    Args:
+        page_changes: {page_num: changes} from the comparison step
+        new_pages: {page_num: markdown} of the new document
+        llm_client: Client to use (the module's shared client if not given)
+        max_pages: Maximum number of pages per request
+        token_budget: Maximum page tokens per request
+        max_workers: Maximum number of requests sent at once
+    
+    Returns:
+        {page_num: locations} for every page with changes whose batch succeeded
+    """
+    results, items, remaining_by_page = _prepare_locate_items(page_changes, new_pages)
+    if not items:
+        return results
+    
+    llm_client = llm_client or _get_llm_client()
+    batches = _pack_pages(items, max_pages, token_budget)
+    
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(batches))) as executor:
+        futures = {executor.submit(_locate_page_batch_with_llm, batch, llm_client): batch for batch in batches}
+        for future in as_completed(futures):
+            try:
+                for page_num, locations in future.result().items():
+                    results[page_num] += _remap_locations(locations, remaining_by_page[page_num])
+            except Exception as e:
+                page_nums = ", ".join(str(item[0]) for item in futures[future])
+                print(f"    Error locating changes on pages {page_nums}: {e}")
+                for item in futures[future]:
+                    del results[item[0]]
+    
+    return results
+
+
+# Token budget for each full-document window (old + new side each)
+FULL_DOC_WINDOW_TOKENS = 6000
+
+
+def _compare_document_messages(old_markdown: str, new_markdown: str) -> list:
+    """Build the chat messages comparing one window of the OLD and NEW documents."""
+    user_prompt = f"""Instructions:
 1. Go through each section, table row, and paragraph systematically
 2. Compare each WORD positionally between OLD and NEW
 3. For each corresponding position, check if words match
@@ -877,39 +1130,583 @@ Instructions:
 
 Be thorough - compare word-by-word, not just line-by-line. Catch every single change.
 
-Return JSON with all changes."""
+Return JSON with all changes.
+
+Compare these two document versions WORD-BY-WORD and identify ALL differences.
+
+=== OLD VERSION ===
+{old_markdown}
+
+=== NEW VERSION ===
+{new_markdown}"""
+    return [
+        {"role": "system", "content": _COMPARE_DOCUMENT_SYSTEM_PROMPT},
+        {"role": "user", "content": user_prompt}
+    ]
+
 
+def compare_markdown_with_llm(old_markdown: str, new_markdown: str,
+                              window_tokens: int = FULL_DOC_WINDOW_TOKENS,
+                              max_workers: int = 8) -> dict:
+    """
+    Use LLM to compare two markdown documents.
+    
+    Documents over window_tokens are split into aligned windows (cut only inside
+    unchanged lines, so no change straddles two windows and no overlap is needed)
+    that are compared concurrently and merged in document order.
+    
+    Deprecated: compare_pdfs_with_marker compares page by page and only calls
+    this for mode="full".
+    """
+    warnings.warn(
+        "compare_markdown_with_llm is deprecated; use the page-by-page comparison",
+        DeprecationWarning,
+        stacklevel=2
+    )
+    llm_client = _get_llm_client()
+    
+    windows = _split_aligned(old_markdown, new_markdown, window_tokens, line_size=count_tokens)
+    print(f"  [Full document] ~{count_tokens(old_markdown) + count_tokens(new_markdown)} tokens "
+          f"in {len(windows)} window(s)")
+    
     try:
-        response = llm_client.client.chat.completions.create(
-            model=llm_client.deployment,
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt}
-            ],
-            temperature=0,
-            response_format={"type": "json_object"}
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(windows))) as executor:
+            results = list(executor.map(
+                lambda window: llm_client.complete_json(_compare_document_messages(*window)),
+                windows
+            ))
+    except Exception as e:
+        raise Exception(f"LLM comparison failed: {str(e)}")
+    
+    return {
+        change_type: [item for result in results for item in result.get(change_type, [])]
+        for change_type in ("removed", "added", "modified")
+    }
+
+
+def _merge_change_locations(changes: list, locations: list, page_num: int) -> list:
+    """Attach location info to each change the locate step kept, dropping the rest."""
+    # Merge location info with changes
+    # Only include changes that have locations (meaningful changes)
+    # Changes located by string search differ beyond punctuation/whitespace; the second LLM
+    # saw every other change and filtered out the meaningless ones (spacing, formatting, etc.)
+    # The second LLM also corrects corrupted/incomplete "new" values by extracting the actual text from markdown
+    # Index locations once (the first one wins if the LLM repeats a change_index)
+    loc_by_idx = {
+        loc.get("change_index"): loc for loc in reversed(locations) if loc.get("change_index") is not None
+    }
+    changes_with_locations = []
+    for i, change in enumerate(changes):
+        # Find location for this change
+        location = loc_by_idx.get(i)
+        if location:
+            # This is a meaningful change - include it
+            search_text = location.get("search_text", "")
+            
+            # If the 2nd LLM provided a search_text, use it (it's the corrected text from markdown)
+            # For text changes, prefer the search_text from location as it's the actual text from markdown
+            if search_text and change.get("change_type") in ["text_added", "text_modified"]:
+                # Use the corrected search_text from the 2nd LLM (actual text from markdown)
+                change["search_text"] = search_text
+                # Optionally update "new" with the corrected text if it's more complete
+                if len(search_text) > len(str(change.get("new", ""))):
+                    change["new"] = search_text
+            else:
+                # For numerical or if no search_text provided, use original
+                change["search_text"] = search_text or change.get("new", "")
+            
+            change["context_before"] = location.get("context_before", change.get("context_before", ""))
+            change["context_after"] = location.get("context_after", change.get("context_after", ""))
+            changes_with_locations.append(change)
+        # If no location found, the second LLM skipped this change as meaningless
+        # (spacing, formatting, special characters, etc.) or could not locate it - skip it
+    
+    dropped_count = len(changes) - len(changes_with_locations)
+    if dropped_count > 0:
+        print(f"    Page {page_num}: found {len(changes)} changes, kept {len(changes_with_locations)} "
+              f"(dropped {dropped_count} skipped or not located by the LLM)")
+    else:
+        print(f"    Page {page_num}: found {len(changes)} changes, all located")
+    
+    return changes_with_locations
+
+
+def compare_page_with_llm(old_page_content: str, new_page_content: str, page_num: int,
+                          llm_client: LLMClient = None, changes: list = None) -> list:
+    """
+    Compare one page and locate its meaningful changes in the new page markdown.
+    
+    Args:
+        changes: The page's changes if already compared (e.g. by compare_markdown_pages_batched)
+    
+    Returns:
+        The page's changes with location info, or None if the LLM found no changes
+    """
+    # Step 4a: Compare and get changes
+    if changes is None:
+        print(f"  Comparing page {page_num}...")
+        changes = compare_markdown_page_with_llm(
+            old_page_content, 
+            new_page_content, 
+            page_num,
+            llm_client
         )
-        
-        import json
-        result = json.loads(response.choices[0].message.content)
-        return {
-            "removed": result.get("removed", []),
-            "added": result.get("added", []),
-            "modified": result.get("modified", [])
+    
+    if not changes:
+        return None
+    
+    # Step 4b: Locate changes by string search first; the LLM only sees the ones not found
+    # and the punctuation/whitespace-only ones, filtering out the meaningless changes among them
+    locations, remaining = _locate_changes_exact(new_page_content, changes)
+    if remaining:
+        print(f"    Page {page_num}: {len(locations)} changes located by string search, "
+              f"evaluating and locating {len(remaining)} with the LLM (filtering meaningless ones)...")
+        locations += _remap_locations(locate_changes_in_markdown(
+            new_page_content,
+            [change for _, change in remaining],
+            page_num,
+            llm_client
+        ), remaining)
+    
+    return _merge_change_locations(changes, locations, page_num)
+
+
+def compare_all_pages(old_pages: dict, new_pages: dict, max_workers: int = 16,
+                      llm_client: LLMClient = None, pages_per_request: int = 1) -> dict:
+    """
+    Compare all pages concurrently, since each page waits on network-bound LLM calls.
+    
+    Args:
+        old_pages: {page_num: markdown} of the old document
+        new_pages: {page_num: markdown} of the new document
+        max_workers: Maximum number of pages compared at once
+        llm_client: Client shared by all pages (the module's shared client if not given)
+        pages_per_request: Pages packed into each compare and locate request (1 = one request per page)
+    
+    Returns:
+        {page_num: changes} in page order, for pages where changes were found
+    """
+    # Get all page numbers (union of old and new) that have content on either side
+    page_nums = [
+        page_num for page_num in sorted(set(old_pages.keys()) | set(new_pages.keys()))
+        if old_pages.get(page_num) or new_pages.get(page_num)
+    ]
+    if not page_nums:
+        return {}
+    
+    llm_client = llm_client or _get_llm_client()
+    results = {}
+    
+    if pages_per_request > 1:
+        # Both LLM steps go out in packed multi-page requests
+        print(f"  Comparing {len(page_nums)} pages, up to {pages_per_request} per request...")
+        page_changes = compare_markdown_pages_batched(
+            [(page_num, old_pages.get(page_num, ""), new_pages.get(page_num, "")) for page_num in page_nums],
+            llm_client,
+            max_pages=pages_per_request,
+            max_workers=max_workers
+        )
+        page_locations = locate_changes_in_pages_batched(
+            page_changes,
+            new_pages,
+            llm_client,
+            max_pages=pages_per_request,
+            max_workers=max_workers
+        )
+        # Pages whose batch failed in either step are dropped like failed single pages
+        for page_num, changes in page_changes.items():
+            if changes and page_num in page_locations:
+                results[page_num] = _merge_change_locations(changes, page_locations[page_num], page_num)
+        return {page_num: results[page_num] for page_num in page_nums if results.get(page_num) is not None}
+    
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(page_nums))) as executor:
+        futures = {
+            executor.submit(
+                compare_page_with_llm,
+                old_pages.get(page_num, ""),
+                new_pages.get(page_num, ""),
+                page_num,
+                llm_client
+            ): page_num
+            for page_num in page_nums
         }
-        
+        for future in as_completed(futures):
+            page_num = futures[future]
+            try:
+                results[page_num] = future.result()
+            except Exception as e:
+                print(f"    Error comparing page {page_num}: {e}")
+                results[page_num] = None
+    
+    return {page_num: results[page_num] for page_num in page_nums if results.get(page_num) is not None}
+
+
+async def _astream_compare_page_batch(batch: list, new_pages: dict, llm_client: LLMClient,
+                                      max_tokens: int = None) -> tuple:
+    """
+    Compare a packed batch with a streamed response, locating each change by
+    string search as soon as the model has finished writing it.
+    
+    Single-page batches stream change by change; multi-page batches stream
+    page by page. If the response is cut off at its token budget, the changes
+    parsed before the cut-off are kept and the pages not finished are returned.
+    
+    Returns:
+        ({page_num: changes}, {page_num: locations found so far},
+         {page_num: [(change_index, change)] left for the LLM},
+         [page_num of pages the truncated response did not finish])
+    """
+    page_changes = {item[0]: [] for item in batch}
+    locations = {item[0]: [] for item in batch}
+    remaining_by_page = {}
+    finished = set()
+    truncated = False
+    
+    def _add_changes(page_num, changes):
+        new_page_markdown = new_pages.get(page_num, "")
+        for change in _filter_unchanged_changes(changes):
+            change_index = len(page_changes[page_num])
+            page_changes[page_num].append(change)
+            location = _locate_change_exact(new_page_markdown, change, change_index)
+            if location is None:
+                remaining_by_page.setdefault(page_num, []).append((change_index, change))
+            else:
+                locations[page_num].append(location)
+    
+    try:
+        async for key, item in llm_client.astream_json_items(
+            _compare_batch_messages(batch),
+            max_tokens=max_tokens or _response_budget(COMPARE_MAX_TOKENS_PER_PAGE, len(batch))
+        ):
+            if len(batch) == 1:
+                if key == "changes" and isinstance(item, dict):
+                    _add_changes(batch[0][0], [item])
+            elif key == "pages" and isinstance(item, dict):
+                try:
+                    page_num = int(item.get("page"))
+                except (TypeError, ValueError):
+                    continue
+                if page_num in page_changes:
+                    _add_changes(page_num, item.get("changes", []))
+                    finished.add(page_num)
+    except LLMTruncatedError:
+        truncated = True
     except Exception as e:
         raise Exception(f"LLM comparison failed: {str(e)}")
+    
+    # A single page streams change by change, so it only finishes with the response
+    unfinished = [item[0] for item in batch if item[0] not in finished] if truncated else []
+    return page_changes, locations, remaining_by_page, unfinished
+
+
+# Characters of surrounding text kept with each diff hunk
+DIFF_CONTEXT_CHARS = 50
+_NUMERIC_RE = re.compile(r'^[\d\s,.%()$£€+\-]*\d[\d\s,.%()$£€+\-]*$')
+_TOKEN_RE = re.compile(r'\S+|\s+')
+
+
+def _is_numeric_value(value: str) -> bool:
+    """Whether a value is a number/amount (or a dash standing in for one)."""
+    value = value.strip()
+    return value in ("-", "–", "—") or bool(_NUMERIC_RE.match(value))
+
 
+def _diff_hunks(old_page_markdown: str, new_page_markdown: str) -> list:
+    """
+    Diff two pages into (old_span, new_span, new_position) hunks.
+    
+    Uses diff-match-patch with semantic cleanup when installed, otherwise a
+    difflib word diff whose hunks separated only by whitespace are merged.
+    """
+    hunks = []
+    if DMP_AVAILABLE:
+        dmp = diff_match_patch()
+        diffs = dmp.diff_main(old_page_markdown, new_page_markdown)
+        dmp.diff_cleanupSemantic(diffs)
+        old_span, new_span, start, position = [], [], None, 0
+        for op, text in diffs + [(0, "")]:
+            if op == 0:
+                if old_span or new_span:
+                    hunks.append(("".join(old_span), "".join(new_span), start))
+                    old_span, new_span, start = [], [], None
+                position += len(text)
+                continue
+            if start is None:
+                start = position
+            if op < 0:
+                old_span.append(text)
+            else:
+                new_span.append(text)
+                position += len(text)
+        return hunks
+    
+    old_tokens = _TOKEN_RE.findall(old_page_markdown)
+    new_tokens = _TOKEN_RE.findall(new_page_markdown)
+    new_offsets = list(itertools.accumulate((len(token) for token in new_tokens), initial=0))
+    groups = []
+    for tag, i1, i2, j1, j2 in difflib.SequenceMatcher(None, old_tokens, new_tokens, autojunk=False).get_opcodes():
+        if tag == "equal":
+            continue
+        # Text hunks one space apart on the same line join into one; numbers stay separate
+        if (groups and i1 - groups[-1][1] == 1 and old_tokens[i1 - 1].isspace() and "\n" not in old_tokens[i1 - 1]
+                and not (_is_numeric_value("".join(new_tokens[j1:j2]))
+                         and _is_numeric_value("".join(new_tokens[groups[-1][2]:groups[-1][3]])))):
+            groups[-1][1], groups[-1][3] = i2, j2
+        else:
+            groups.append([i1, i2, j1, j2])
+    return [
+        ("".join(old_tokens[i1:i2]), "".join(new_tokens[j1:j2]), new_offsets[j1])
+        for i1, i2, j1, j2 in groups
+    ]
+
+
+def _diff_changes(old_page_markdown: str, new_page_markdown: str) -> list:
+    """
+    Turn a classical page diff into changes in the compare step's format.
+    
+    Each hunk keeps DIFF_CONTEXT_CHARS of surrounding new-page text so the
+    locate step can judge whether it is meaningful.
+    """
+    changes = []
+    for old_span, new_span, start in _diff_hunks(old_page_markdown, new_page_markdown):
+        old_val, new_val = old_span.strip(), new_span.strip()
+        if not old_val and not new_val:
+            continue
+        if not old_val:
+            change_type = "text_added"
+        elif not new_val:
+            change_type = "text_deleted"
+        elif _is_numeric_value(old_val) and _is_numeric_value(new_val):
+            change_type = "numerical"
+        else:
+            change_type = "text_modified"
+        end = start + len(new_span)
+        # The new-page line holding the change serves as its context (row label, sentence)
+        line_start = new_page_markdown.rfind("\n", 0, start) + 1
+        line_end = new_page_markdown.find("\n", start)
+        line = new_page_markdown[line_start:line_end if line_end != -1 else len(new_page_markdown)]
+        changes.append({
+            "old": old_val,
+            "new": new_val,
+            "change_type": change_type,
+            "context": line.strip()[:100],
+            "surrounding_text_before": new_page_markdown[max(0, start - DIFF_CONTEXT_CHARS):start].strip(),
+            "surrounding_text_after": new_page_markdown[end:end + DIFF_CONTEXT_CHARS].strip()
+        })
+    return _filter_unchanged_changes(changes)
 
-def compare_pdfs_with_marker(old_pdf_bytes: bytes, new_pdf_bytes: bytes, library: str = None) -> dict:
+
+# Pages longer than this are compared in aligned chunks (one request each)
+PAGE_CHUNK_CHARS = 8000
+
+
+def _split_aligned(old_page_markdown: str, new_page_markdown: str,
+                   max_chars: int = PAGE_CHUNK_CHARS, line_size=len) -> list:
+    """
+    Split an oversize page pair into aligned (old_chunk, new_chunk) pairs.
+    
+    Cuts are only made inside runs of lines identical in both versions, so each
+    change falls entirely within one chunk and the chunks line up across versions.
+    A page with no unchanged lines to cut at stays in one piece. Sizes are
+    measured with line_size (characters by default; pass count_tokens to budget
+    in tokens instead).
+    """
+    if line_size(old_page_markdown) <= max_chars and line_size(new_page_markdown) <= max_chars:
+        return [(old_page_markdown, new_page_markdown)]
+    
+    old_lines = old_page_markdown.split("\n")
+    new_lines = new_page_markdown.split("\n")
+    chunks = []
+    old_start = new_start = 0
+    old_size = new_size = 0
+    for tag, i1, i2, j1, j2 in difflib.SequenceMatcher(None, old_lines, new_lines, autojunk=False).get_opcodes():
+        if tag != "equal":
+            old_size += sum(line_size(line) + 1 for line in old_lines[i1:i2])
+            new_size += sum(line_size(line) + 1 for line in new_lines[j1:j2])
+            continue
+        for k in range(i2 - i1):
+            if max(old_size, new_size) >= max_chars:
+                chunks.append(("\n".join(old_lines[old_start:i1 + k]), "\n".join(new_lines[new_start:j1 + k])))
+                old_start, new_start = i1 + k, j1 + k
+                old_size = new_size = 0
+            old_size += line_size(old_lines[i1 + k]) + 1
+            new_size += line_size(new_lines[j1 + k]) + 1
+    chunks.append(("\n".join(old_lines[old_start:]), "\n".join(new_lines[new_start:])))
+    return chunks
+
+
+async def acompare_all_pages_with_failures(old_pages: dict, new_pages: dict, max_concurrent: int = 8,
+                             llm_client: LLMClient = None,
+                             pages_per_request: int = MAX_PAGES_PER_REQUEST,
+                             diff_prefilter: bool = None) -> tuple:
+    """
+    Async variant of compare_all_pages, with batches fanned out on the event loop.
+    
+    Each batch locates its changes as soon as its own comparison returns, without
+    waiting for the other batches. Oversize pages are split into aligned chunks
+    compared in parallel, and their changes merged back in chunk order. Pages
+    whose response ran out of tokens are compared again one per request with
+    the largest budget, keeping the changes already found if that fails too.
+    
+    Args:
+        old_pages: {page_num: markdown} of the old document
+        new_pages: {page_num: markdown} of the new document
+        max_concurrent: Maximum number of LLM requests in flight
+        llm_client: Client shared by all pages (the module's shared client if not given)
+        pages_per_request: Pages packed into each compare and locate request
+        diff_prefilter: Find changes with a classical diff instead of the compare LLM,
+                        leaving the LLM only to judge and locate them
+                        (Config.PDF_DIFF_PREFILTER if not given)
+    
+    Returns:
+        ({page_num: changes} in page order for pages where changes were found,
+         sorted page numbers that could not be compared completely)
+    """
+    if diff_prefilter is None:
+        diff_prefilter = Config.PDF_DIFF_PREFILTER
+    page_nums = [
+        page_num for page_num in sorted(set(old_pages.keys()) | set(new_pages.keys()))
+        if old_pages.get(page_num) or new_pages.get(page_num)
+    ]
+    # Pages (and chunks) identical once normalized have no changes; skip their LLM calls
+    pending = []
+    chunk_batches = []
+    for page_num in page_nums:
+        old_page_markdown = old_pages.get(page_num, "")
+        new_page_markdown = new_pages.get(page_num, "")
+        if pages_equivalent(old_page_markdown, new_page_markdown):
+            continue
+        chunks = _split_aligned(old_page_markdown, new_page_markdown)
+        if len(chunks) == 1:
+            pending.append((page_num, old_page_markdown, new_page_markdown))
+        else:
+            # Chunks of one page never share a request, so each reply maps to one chunk
+            chunk_batches += [
+                [(page_num, old_chunk, new_chunk)] for old_chunk, new_chunk in chunks
+                if not pages_equivalent(old_chunk, new_chunk)
+            ]
+    if not pending and not chunk_batches:
+        return {}, []
+    
+    llm_client = llm_client or _get_llm_client()
+    batches = _pack_pages(pending, pages_per_request, PAGES_PER_REQUEST_TOKENS) + chunk_batches
+    print(f"  Comparing {len(pending)} changed pages and {len(chunk_batches)} page chunks in {len(batches)} requests...")
+    
+    # Bound the requests in flight to stay within the deployment's rate limits
+    semaphore = asyncio.Semaphore(max_concurrent)
+    
+    async def _recompare(item):
+        async with semaphore:
+            return await _astream_compare_page_batch(
+                [item], new_pages, llm_client, max_tokens=MAX_RESPONSE_TOKENS
+            )
+    
+    async def _compare_and_locate(batch):
+        incomplete = []
+        if diff_prefilter:
+            # Every diff hunk goes to the locate LLM, which drops the meaningless ones
+            page_changes = {page_num: _diff_changes(old, new) for page_num, old, new in batch}
+            page_locations = {page_num: [] for page_num in page_changes}
+            remaining_by_page = {
+                page_num: list(enumerate(changes)) for page_num, changes in page_changes.items() if changes
+            }
+        else:
+            # Changes are located by string search while the response is still streaming
+            async with semaphore:
+                page_changes, page_locations, remaining_by_page, unfinished = await _astream_compare_page_batch(
+                    batch, new_pages, llm_client
+                )
+            # Pages the response ran out of tokens on go again one per request with the
+            # largest budget; until a retry succeeds they keep the changes parsed so far
+            retry_items = [item for item in batch if item[0] in unfinished]
+            if retry_items:
+                print(f"    Pages {', '.join(str(item[0]) for item in retry_items)}: response truncated, comparing again...")
+            retries = await asyncio.gather(*[_recompare(item) for item in retry_items], return_exceptions=True)
+            for item, retry in zip(retry_items, retries):
+                page_num = item[0]
+                if isinstance(retry, Exception):
+                    print(f"    Error re-comparing page {page_num}: {retry}")
+                    incomplete.append(page_num)
+                    continue
+                retry_changes, retry_locations, retry_remaining, retry_unfinished = retry
+                page_changes[page_num] = retry_changes[page_num]
+                page_locations[page_num] = retry_locations[page_num]
+                remaining_by_page.pop(page_num, None)
+                if page_num in retry_remaining:
+                    remaining_by_page[page_num] = retry_remaining[page_num]
+                if retry_unfinished:
+                    incomplete.append(page_num)
+        items = _locate_items(remaining_by_page, new_pages)
+        
+        async def _locate(locate_batch):
+            async with semaphore:
+                return await _alocate_page_batch_with_llm(locate_batch, llm_client)
+        
+        if items:
+            locate_batches = _pack_pages(items, pages_per_request, PAGES_PER_REQUEST_TOKENS)
+            for located in await asyncio.gather(*[_locate(locate_batch) for locate_batch in locate_batches]):
+                for page_num, locations in located.items():
+                    page_locations[page_num] += _remap_locations(locations, remaining_by_page[page_num])
+        return {
+            page_num: _merge_change_locations(page_changes[page_num], locations, page_num)
+            for page_num, locations in page_locations.items() if page_changes[page_num]
+        }, incomplete
+    
+    results = {}
+    failed_pages = set()
+    try:
+        outcomes = await asyncio.gather(*[_compare_and_locate(batch) for batch in batches], return_exceptions=True)
+    finally:
+        # The async connection pool belongs to this event loop (one asyncio.run per
+        # comparison), so it is closed here rather than left to leak its sockets
+        await llm_client.aclose()
+    for batch, outcome in zip(batches, outcomes):
+        if isinstance(outcome, Exception):
+            page_list = ", ".join(str(item[0]) for item in batch)
+            print(f"    Error comparing pages {page_list}: {outcome}")
+            failed_pages.update(item[0] for item in batch)
+            continue
+        batch_changes, incomplete = outcome
+        failed_pages.update(incomplete)
+        # Chunks of one page arrive in order; their changes are appended
+        for page_num, changes in batch_changes.items():
+            results.setdefault(page_num, []).extend(changes)
+    
+    return {page_num: results[page_num] for page_num in page_nums if page_num in results}, sorted(failed_pages)
+
+
+async def acompare_all_pages(old_pages: dict, new_pages: dict, max_concurrent: int = 8,
+                             llm_client: LLMClient = None,
+                             pages_per_request: int = MAX_PAGES_PER_REQUEST,
+                             diff_prefilter: bool = None) -> dict:
+    """
+    Async variant of compare_all_pages; see acompare_all_pages_with_failures.
+    
+    Returns:
+        {page_num: changes} in page order, for pages where changes were found
+    """
+    page_changes, _ = await acompare_all_pages_with_failures(
+        old_pages, new_pages, max_concurrent, llm_client, pages_per_request, diff_prefilter
+    )
+    return page_changes
+
+
+def compare_pdfs_with_marker(old_pdf_bytes: bytes, new_pdf_bytes: bytes, library: str = None,
+                             mode: str = "page") -> dict:
     """
     Main comparison pipeline - PAGE BY PAGE:
     1. Convert both PDFs to Markdown
     2. Extract pages from markdown
-    3. Compare each page with LLM
-    4. Return page-by-page changes
+    3. Compare pages with LLM (several small pages per request)
+    4. Return page-by-page changes, with the pages that could not be compared
+       completely in failed_pages
+    
+    mode="full" instead compares the whole documents in one LLM pass
+    (deprecated; returns no page_changes, so nothing is highlighted).
     """
+    if mode not in ("page", "full"):
+        raise ValueError(f"Unknown comparison mode: {mode}. Use 'page' or 'full'.")
+    
     lib = library or ACTIVE_LIBRARY
     
     print("=" * 60)
@@ -928,6 +1725,16 @@ def compare_pdfs_with_marker(old_pdf_bytes: bytes, new_pdf_bytes: bytes, library
     old_markdown = normalize_markdown(old_markdown)
     new_markdown = normalize_markdown(new_markdown)
     
+    if mode == "full":
+        print("\n[Step 3] Comparing full documents with LLM...")
+        return {
+            "old_markdown": old_markdown,
+            "new_markdown": new_markdown,
+            "changes": compare_markdown_with_llm(old_markdown, new_markdown),
+            "page_changes": {},
+            "method": lib
+        }
+    
     # Step 3: Extract pages
     print("\n[Step 3] Extracting pages...")
     old_pages = extract_pages_from_markdown(old_markdown)
@@ -938,78 +1745,10 @@ def compare_pdfs_with_marker(old_pdf_bytes: bytes, new_pdf_bytes: bytes, library
     
     # Step 4: Compare each page with LLM
     print("\n[Step 4] Comparing pages with LLM...")
-    page_changes = {}  # {page_num: [{"old": "...", "new": "...", "context": "..."}, ...]}
-    all_changes = []
-    
-    # Get all page numbers (union of old and new)
-    all_page_nums = set(old_pages.keys()) | set(new_pages.keys())
-    
-    for page_num in sorted(all_page_nums):
-        old_page_content = old_pages.get(page_num, "")
-        new_page_content = new_pages.get(page_num, "")
-        
-        if not old_page_content and not new_page_content:
-            continue
-        
-        print(f"  Comparing page {page_num}...")
-        
-        try:
-            # Step 4a: Compare and get changes
-            changes = compare_markdown_page_with_llm(
-                old_page_content, 
-                new_page_content, 
-                page_num
-            )
-            
-            if changes:
-                # Step 4b: Use LLM to locate each change in the markdown
-                # The second LLM will filter out meaningless changes (spacing, formatting, etc.)
-                print(f"    Evaluating and locating {len(changes)} changes in markdown (filtering meaningless ones)...")
-                locations = locate_changes_in_markdown(
-                    new_page_content,
-                    changes,
-                    page_num
-                )
-                
-                # Merge location info with changes
-                # Only include changes that have locations (meaningful changes)
-                # The second LLM filters out meaningless changes (spacing, formatting, etc.)
-                # The second LLM also corrects corrupted/incomplete "new" values by extracting the actual text from markdown
-                changes_with_locations = []
-                for i, change in enumerate(changes):
-                    # Find location for this change
-                    location = next((loc for loc in locations if loc.get("change_index") == i), None)
-                    if location:
-                        # This is a meaningful change - include it
-                        search_text = location.get("search_text", "")
-                        
-                        # If the 2nd LLM provided a search_text, use it (it's the corrected text from markdown)
-                        # For text changes, prefer the search_text from location as it's the actual text from markdown
-                        if search_text and change.get("change_type") in ["text_added", "text_modified"]:
-                            # Use the corrected search_text from the 2nd LLM (actual text from markdown)
-                            change["search_text"] = search_text
-                            # Optionally update "new" with the corrected text if it's more complete
-                            if len(search_text) > len(str(change.get("new", ""))):
-                                change["new"] = search_text
-                        else:
-                            # For numerical or if no search_text provided, use original
-                            change["search_text"] = search_text or change.get("new", "")
-                        
-                        change["context_before"] = location.get("context_before", change.get("context_before", ""))
-                        change["context_after"] = location.get("context_after", change.get("context_after", ""))
-                        changes_with_locations.append(change)
-                    # If no location found, the second LLM determined this change is meaningless
-                    # (spacing, formatting, special characters, etc.) - skip it
-                
-                page_changes[page_num] = changes_with_locations
-                all_changes.extend(changes_with_locations)
-                filtered_count = len(changes) - len(changes_with_locations)
-                if filtered_count > 0:
-                    print(f"    Found {len(changes)} changes, {len(changes_with_locations)} meaningful (filtered {filtered_count} meaningless)")
-                else:
-                    print(f"    Found {len(changes)} changes, all meaningful")
-        except Exception as e:
-            print(f"    Error comparing page {page_num}: {e}")
+    # {page_num: [{"old": "...", "new": "...", "context": "..."}, ...]}, plus the pages whose
+    # comparison failed or stayed truncated, so their changes may be missing
+    page_changes, failed_pages = asyncio.run(acompare_all_pages_with_failures(old_pages, new_pages))
+    all_changes = [change for changes in page_changes.values() for change in changes]
     
     # Convert to old format for compatibility
     modified = []
@@ -1021,6 +1760,8 @@ def compare_pdfs_with_marker(old_pdf_bytes: bytes, new_pdf_bytes: bytes, library
         })
     
     print(f"\n  Results: {len(all_changes)} total changes across {len(page_changes)} pages")
+    if failed_pages:
+        print(f"  Pages not compared completely: {', '.join(map(str, failed_pages))}")
     
     return {
         "old_markdown": old_markdown,
@@ -1031,6 +1772,7 @@ def compare_pdfs_with_marker(old_pdf_bytes: bytes, new_pdf_bytes: bytes, library
             "removed": []
         },
         "page_changes": page_changes,  # New: page-by-page changes
+        "failed_pages": failed_pages,
         "method": lib
     }
 
@@ -3,11 +3,54 @@ PDF comparison module for the Version Comparison Agent.
 Robust text/table extraction and LLM-powered comparison with highlighting.
 """
 import fitz  # PyMuPDF
-import io
+import functools
+import hashlib
+import itertools
+import math
+import os
 import re
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
 from dataclasses import dataclass
+from config import Config
 from llm_client import LLMClient
 
+# Text cleanup patterns, compiled once at import
+_HYPHEN_BREAK_RE = re.compile(r'(\w)-\s*\n\s*(\w)')
+_SPACES_RE = re.compile(r'[ \t]+')
+_BLANK_LINES_RE = re.compile(r'\n\s*\n')
+
+# Sequences any of the _normalize_text passes would change in stripped ASCII text
+_UNCLEAN_SEQUENCES = ('  ', '\t', ' \n', '\n ', '\n\n', '-\n', '\r', '\x0b', '\x0c')
+
+# A number with optional sign, currency symbol, thousands separators/spaces and
+# accounting parentheses, e.g. "1,000", "(111,125)", "£ 1,234.56", "-5"
+_NUMERIC_RE = re.compile(r'[-+(]?\s*[£$€¥]?\s*[-(]?\s*(?:\d[\d,\s]*(?:\.[\d\s]*)?|\.[\d\s]*\d[\d\s]*)\s*\)?')
+
+
+@functools.lru_cache(maxsize=4096)
+def _is_numeric(text: str) -> bool:
+    """
+    Check whether a cell holds a single number, in one regex match.
+    
+    Cached, since header detection and row labelling check the same labels
+    and values table after table.
+    """
+    return bool(text) and _NUMERIC_RE.fullmatch(text.strip()) is not None
+
+
+# Page count from which extraction is spread across worker processes. Starting a
+# pool costs ~15 ms with fork but ~0.3 s per worker with spawn before the worker
+# imports PyMuPDF and the OpenAI SDK, so smaller PDFs are faster in-process
+PARALLEL_EXTRACT_MIN_PAGES = 32
+
+# Recent extractions, keyed by a hash of the PDF bytes (FIFO, bounded)
+_CONTENT_CACHE_SIZE = 8
+_content_cache: "OrderedDict[bytes, dict]" = OrderedDict()
+# Streamlit sessions run in separate threads and share the cache
+_CONTENT_CACHE_LOCK = threading.Lock()
+
 
 @dataclass
 class ComparisonColors:
@@ -20,7 +63,6 @@ class PDFComparator:
     """Handles PDF version comparison and highlighted output generation."""
     
     def __init__(self):
-        self.llm_client = LLMClient()
         self.colors = ComparisonColors()
         
         # Patterns to ignore (watermarks, etc.)
@@ -28,22 +70,36 @@ class PDFComparator:
             r'^draft$', r'^confidential$', r'^page\s*\d*$',
             r'^\d+$',  # Standalone page numbers
         ]
+        # One alternation compiled once, so each check is a single match call
+        self._ignore_re = re.compile(
+            '|'.join(f'(?:{pattern})' for pattern in self.ignore_patterns), re.IGNORECASE
+        )
+    
+    @functools.cached_property
+    def llm_client(self) -> LLMClient:
+        """Azure OpenAI client, created on first use so extraction-only instances never build one."""
+        return LLMClient()
     
     def _normalize_text(self, text: str) -> str:
         """Clean and normalize extracted text."""
         if not text:
             return ""
         
-        # Fix hyphenation at line breaks
-        text = re.sub(r'(\w)-\s*\n\s*(\w)', r'\1\2', text)
+        # Already-clean text (the common case) is unchanged by every pass below
+        text = text.strip()
+        if text.isascii() and not any(seq in text for seq in _UNCLEAN_SEQUENCES):
+            return text
+        
+        # Fix hyphenation at line breaks (mostly done by PyMuPDF already)
+        if '-' in text:
+            text = _HYPHEN_BREAK_RE.sub(r'\1\2', text)
         
         # Normalize whitespace
-        text = re.sub(r'[ \t]+', ' ', text)  # Multiple spaces to single
-        text = re.sub(r'\n\s*\n', '\n\n', text)  # Multiple newlines to double
+        text = _SPACES_RE.sub(' ', text)  # Multiple spaces to single
+        text = _BLANK_LINES_RE.sub('\n\n', text)  # Multiple newlines to double
         
         # Clean each line
-        lines = [line.strip() for line in text.split('\n')]
-        text = '\n'.join(line for line in lines if line)
+        text = '\n'.join(line for line in (raw.strip() for raw in text.split('\n')) if line)
         
         return text.strip()
     
@@ -52,13 +108,12 @@ class PDFComparator:
         if not text:
             return True
         
-        text_lower = text.lower().strip()
-        
-        for pattern in self.ignore_patterns:
-            if re.match(pattern, text_lower, re.IGNORECASE):
-                return True
+        text = text.strip()
+        # Beyond "confidential" the ignore patterns only match text ending in a digit
+        if len(text) > 12 and not text[-1].isdigit():
+            return False
         
-        return False
+        return self._ignore_re.match(text) is not None
     
     def _is_inside_any_bbox(self, inner: tuple, boxes: list, margin: float = 2) -> bool:
         """Check if inner bbox is inside any of the given bboxes."""
@@ -74,35 +129,15 @@ class PDFComparator:
         if cell is None:
             return ""
         
-        text = str(cell).strip()
-        
-        # Normalize whitespace
-        text = re.sub(r'\s+', ' ', text)
-        
-        # Remove common artifacts
-        text = text.replace('\n', ' ').replace('\r', '')
-        
-        return text.strip()
+        # Collapse whitespace runs (including \n and \r artifacts) to single spaces and
+        # trim; str.split uses the same whitespace definition as the regex \s
+        return ' '.join(str(cell).split())
     
-    def _parse_numeric(self, text: str) -> tuple[bool, str]:
-        """
-        Try to parse text as a number and format it consistently.
-        Returns: (is_numeric, formatted_value)
-        """
-        if not text:
-            return False, text
-        
-        # Remove currency symbols and common formatting
-        clean = re.sub(r'[£$€¥,\s]', '', text)
-        clean = clean.replace('(', '-').replace(')', '')  # Handle accounting negatives
-        
-        try:
-            # Try to parse as number
-            num = float(clean)
-            # Keep original formatting but mark as numeric
-            return True, text
-        except ValueError:
-            return False, text
+    def _clean_rows(self, raw_data: list) -> list:
+        """Clean every cell of an extracted table, keeping only rows with any content."""
+        clean = self._clean_cell_value
+        cleaned = [[clean(cell) for cell in row] for row in raw_data]
+        return [row for row in cleaned if any(row)]
     
     def _detect_header_row(self, rows: list) -> int:
         """
@@ -119,12 +154,8 @@ class PDFComparator:
         # 1. First row has no numbers, second row has numbers
         # 2. First row cells are shorter (labels vs data)
         
-        first_has_numbers = any(
-            self._parse_numeric(cell)[0] for cell in first_row if cell
-        )
-        second_has_numbers = any(
-            self._parse_numeric(cell)[0] for cell in second_row if cell
-        )
+        first_has_numbers = any(_is_numeric(cell) for cell in first_row)
+        second_has_numbers = any(_is_numeric(cell) for cell in second_row)
         
         if not first_has_numbers and second_has_numbers:
             return 0
@@ -157,7 +188,7 @@ class PDFComparator:
         
         try:
             # Use PyMuPDF's table finder with different strategies
-            tables = page.find_tables(
+            table_settings = dict(
                 snap_tolerance=3,      # Tolerance for snapping to lines
                 snap_x_tolerance=3,
                 snap_y_tolerance=3,
@@ -166,6 +197,13 @@ class PDFComparator:
                 min_words_vertical=1,  # Minimum words to detect vertical lines
                 min_words_horizontal=1
             )
+            # The configured strategy (drawn borders only, by default) is tried first. The
+            # default strategy also reads filled rectangles as cell borders, so it is only
+            # worth a second pass on pages with fills where the first found nothing
+            tables = page.find_tables(strategy=Config.PDF_TABLE_STRATEGY, **table_settings).tables
+            if (not tables and Config.PDF_TABLE_STRATEGY != "lines"
+                    and any(path["type"] != "s" for path in page.get_cdrawings())):
+                tables = page.find_tables(**table_settings).tables
             
             for table in tables:
                 raw_data = table.extract()
@@ -174,12 +212,7 @@ class PDFComparator:
                     continue
                 
                 # Clean all cells
-                cleaned_rows = []
-                for row in raw_data:
-                    cleaned_row = [self._clean_cell_value(cell) for cell in row]
-                    # Keep row if it has any content
-                    if any(cleaned_row):
-                        cleaned_rows.append(cleaned_row)
+                cleaned_rows = self._clean_rows(raw_data)
                 
                 if not cleaned_rows:
                     continue
@@ -193,6 +226,7 @@ class PDFComparator:
                         "headers": cleaned_rows[header_idx],
                         "rows": cleaned_rows[header_idx + 1:],
                         "has_header": True,
+                        "header_row_index": header_idx,
                         "all_rows": cleaned_rows  # Keep all rows for formatting
                     }
                 else:
@@ -214,12 +248,8 @@ class PDFComparator:
                 tables = page.find_tables()
                 for table in tables:
                     raw_data = table.extract()
-                    if raw_data and any(any(cell for cell in row) for row in raw_data):
-                        cleaned_rows = []
-                        for row in raw_data:
-                            cleaned_row = [self._clean_cell_value(cell) for cell in row]
-                            if any(cleaned_row):
-                                cleaned_rows.append(cleaned_row)
+                    if raw_data and any(itertools.chain.from_iterable(raw_data)):
+                        cleaned_rows = self._clean_rows(raw_data)
                         
                         if cleaned_rows:
                             tables_data.append({
@@ -241,31 +271,31 @@ class PDFComparator:
         """
         text_blocks = []
         
-        # Get detailed text extraction
-        blocks = page.get_text("dict", flags=fitz.TEXT_PRESERVE_WHITESPACE)["blocks"]
+        # Flat (x0, y0, x1, y1, text, block_no, block_type) tuples: no per-span dicts,
+        # and PyMuPDF joins words hyphenated across lines itself
+        blocks = page.get_text("blocks", flags=fitz.TEXT_PRESERVE_WHITESPACE | fitz.TEXT_DEHYPHENATE)
+        
+        # A block inside any table is inside the union of all tables, so a block
+        # outside that one box needs no per-table checks
+        union_bbox = None
+        if exclude_bboxes:
+            union_bbox = (
+                min(bbox[0] for bbox in exclude_bboxes), min(bbox[1] for bbox in exclude_bboxes),
+                max(bbox[2] for bbox in exclude_bboxes), max(bbox[3] for bbox in exclude_bboxes)
+            )
         
-        for block in blocks:
-            if "lines" not in block:
+        for x0, y0, x1, y1, block_text, _, block_type in blocks:
+            # Skip image blocks
+            if block_type != 0:
                 continue
             
-            block_bbox = block["bbox"]
+            block_bbox = (x0, y0, x1, y1)
             
             # Skip if inside a table
-            if self._is_inside_any_bbox(block_bbox, exclude_bboxes):
+            if (union_bbox is not None and self._is_inside_any_bbox(block_bbox, [union_bbox])
+                    and self._is_inside_any_bbox(block_bbox, exclude_bboxes)):
                 continue
             
-            # Extract text from all lines in block
-            block_text = ""
-            for line in block["lines"]:
-                line_text = ""
-                for span in line["spans"]:
-                    span_text = span.get("text", "")
-                    line_text += span_text
-                
-                line_text = line_text.strip()
-                if line_text:
-                    block_text += line_text + "\n"
-            
             block_text = self._normalize_text(block_text)
             
             # Skip empty or ignorable text
@@ -283,7 +313,8 @@ class PDFComparator:
         
         return text_blocks
     
-    def extract_content_structured(self, pdf_bytes: bytes) -> dict:
+    def extract_content_structured(self, pdf_bytes: bytes, use_cache: bool = True,
+                                   parallel: bool = True) -> dict:
         """
         Extract all content from PDF with robust structure preservation.
         
@@ -291,37 +322,90 @@ class PDFComparator:
         - Preserves reading order
         - Normalizes all text
         - Filters out watermarks and noise
+        
+        Results are cached by content hash, so comparing one version against
+        several others extracts it once; pass use_cache=False to re-extract.
+        PDFs of PARALLEL_EXTRACT_MIN_PAGES or more pages are extracted across
+        worker processes unless parallel is False.
+        """
+        if not use_cache:
+            return self._extract_content(pdf_bytes, parallel)
+        
+        key = hashlib.blake2b(pdf_bytes, digest_size=16).digest()
+        with _CONTENT_CACHE_LOCK:
+            content = _content_cache.get(key)
+        if content is None:
+            # Extracted outside the lock so other sessions are not held up
+            content = self._extract_content(pdf_bytes, parallel)
+            with _CONTENT_CACHE_LOCK:
+                _content_cache[key] = content
+                if len(_content_cache) > _CONTENT_CACHE_SIZE:
+                    _content_cache.popitem(last=False)
+        # Callers get their own top-level containers so the cached result is never modified
+        return {**content, "pages": list(content["pages"]), "all_tables": list(content["all_tables"])}
+    
+    def _extract_pages(self, doc, start: int, end: int) -> list:
         """
-        doc = fitz.open(stream=pdf_bytes, filetype="pdf")
+        Extract pages start..end-1 (0-based) of an open document as page_content dicts.
         
-        result = {
-            "pages": [],
-            "full_text": "",
-            "all_tables": []
-        }
+        Returns: [{"page_num": int, "text_blocks": [...], "tables": [...]}, ...]
+        """
+        pages = []
         
-        for page_num, page in enumerate(doc):
+        for page_num in range(start, end):
+            page = doc[page_num]
+            
             # Extract tables first (and get their bboxes to exclude from text)
             tables_data, table_bboxes = self._extract_tables(page)
             
             # Extract text blocks (excluding table areas)
             text_blocks = self._extract_text_blocks(page, table_bboxes)
             
-            page_content = {
+            pages.append({
                 "page_num": page_num,
                 "text_blocks": text_blocks,
                 "tables": tables_data
-            }
-            
-            result["pages"].append(page_content)
-            result["all_tables"].extend(tables_data)
+            })
+        
+        return pages
+    
+    def _extract_content(self, pdf_bytes: bytes, parallel: bool = True) -> dict:
+        """
+        Extract tables and text blocks page by page (uncached extract_content_structured).
+        
+        PyMuPDF is not thread-safe and holds the GIL, so larger PDFs are extracted
+        in contiguous page blocks across worker processes and reassembled in order.
+        """
+        workers = max(1, (os.cpu_count() or 1) - 1)
+        with fitz.open(stream=pdf_bytes, filetype="pdf") as doc:
+            total_pages = len(doc)
+            in_process = not parallel or total_pages < PARALLEL_EXTRACT_MIN_PAGES or workers == 1
+            if in_process:
+                pages = self._extract_pages(doc, 0, total_pages)
+        
+        if not in_process:
+            # About two blocks per worker balances uneven pages; each worker receives
+            # the PDF once through the initializer and keeps it open for all its blocks
+            block_size = math.ceil(total_pages / (workers * 2))
+            starts = list(range(0, total_pages, block_size))
+            ends = [min(start + block_size, total_pages) for start in starts]
             
-            # Build full text for this page
-            page_text = "\n".join(block["text"] for block in text_blocks)
-            result["full_text"] += f"\n{page_text}\n"
+            with ProcessPoolExecutor(max_workers=min(workers, len(starts)),
+                                     initializer=_init_extract_worker, initargs=(pdf_bytes,)) as executor:
+                blocks = executor.map(_extract_page_block, starts, ends)
+                pages = [page for block in blocks for page in block]
+        
+        # Full text is joined once from per-page pieces rather than grown page by page
+        page_texts = [
+            "\n".join(block["text"] for block in page_content["text_blocks"])
+            for page_content in pages
+        ]
         
-        doc.close()
-        return result
+        return {
+            "pages": pages,
+            "full_text": "".join(f"\n{page_text}\n" for page_text in page_texts),
+            "all_tables": [table for page_content in pages for table in page_content["tables"]]
+        }
     
     def format_content_for_comparison(self, content: dict) -> str:
         """
@@ -357,12 +441,12 @@ class PDFComparator:
                     has_header = table_info.get("has_header", False)
                     
                     # Format header row if present
-                    if has_header and headers:
+                    if has_header:
                         header_str = " │ ".join(h if h else "—" for h in headers)
                         formatted_parts.append(f"  [HEADER]: {header_str}")
                         formatted_parts.append("  " + "─" * 50)
-                        # Skip header in data rows
-                        data_rows = rows[1:] if rows and rows[0] == headers else rows
+                        # Skip header in data rows (all_rows still starts with it)
+                        data_rows = rows[table_info.get("header_row_index", 0) + 1:]
                     else:
                         data_rows = rows
                     
@@ -372,8 +456,8 @@ class PDFComparator:
                             continue
                         
                         # Use first column as row label if it looks like a label
-                        first_col = row[0] if row else ""
-                        is_label = first_col and not self._parse_numeric(first_col)[0]
+                        first_col = row[0]
+                        is_label = bool(first_col) and not _is_numeric(first_col)
                         
                         if is_label and len(row) > 1:
                             # First column is label, rest is data
@@ -395,55 +479,66 @@ class PDFComparator:
         
         return "\n".join(formatted_parts)
     
-    def highlight_text_in_pdf(self, doc: fitz.Document, text: str, color: tuple) -> bool:
-        """Highlight specific text in the PDF. Returns True if successful."""
-        if not text or len(text.strip()) < 2:
-            return False
-        
-        text = text.strip()
-        
-        # Skip watermarks and common noise
-        if self._should_ignore(text):
+    def _add_highlight(self, page, quad, color: tuple) -> bool:
+        """Add one highlight annotation. Returns True if successful."""
+        try:
+            annot = page.add_highlight_annot(quad)
+            annot.set_colors(stroke=color)
+            annot.update()
+            return True
+        except Exception:
             return False
-        
-        for page in doc:
-            instances = page.search_for(text, quads=True)
-            
-            if instances:
-                try:
-                    annot = page.add_highlight_annot(instances[0])
-                    annot.set_colors(stroke=color)
-                    annot.update()
-                    return True
-                except Exception:
-                    pass
-        
-        return False
     
-    def highlight_value_with_context(self, doc: fitz.Document, value: str, 
-                                      context: str, color: tuple) -> bool:
+    def _place_on_page(self, page, text_items: list, value_items: list) -> tuple[int, list, list]:
         """
-        Highlight a value using context to find the correct instance.
-        Context is typically the field name or nearby text.
-        """
-        if not value or len(str(value).strip()) < 1:
-            return False
+        Highlight whichever items are found on one page.
         
-        value = str(value).strip()
+        Each distinct needle or context is searched once on the page.
         
-        if self._should_ignore(value):
-            return False
-        
-        for page in doc:
-            value_instances = page.search_for(value, quads=True)
-            
+        Returns: (number highlighted, text items not placed, value items not placed)
+        """
+        highlighted = 0
+        
+        # Search results on this page, by needle. search_for builds a fresh TextPage
+        # per call unless given one, so all searches share one built on first use
+        quads = {}
+        rects = {}
+        textpage = None
+        
+        def search(needle, as_quads):
+            nonlocal textpage
+            if textpage is None:
+                textpage = page.get_textpage(flags=fitz.TEXTFLAGS_SEARCH)
+            return page.search_for(needle, quads=as_quads, textpage=textpage)
+        
+        def find_quads(needle):
+            if needle not in quads:
+                quads[needle] = search(needle, True)
+            return quads[needle]
+        
+        remaining_text = []
+        for item in text_items:
+            text, color = item[:2]
+            instances = find_quads(text)
+            if instances and self._add_highlight(page, instances[0], color):
+                highlighted += 1
+            else:
+                remaining_text.append(item)
+        
+        remaining_values = []
+        for item in value_items:
+            value, context, color = item[:3]
+            value_instances = find_quads(value)
             if not value_instances:
+                remaining_values.append(item)
                 continue
             
             # If we have context, find the value closest to it
             if context:
-                context = str(context).strip()
-                context_instances = page.search_for(context)
+                # Only the first context hit is used, and plain rects are cheaper than quads
+                if context not in rects:
+                    rects[context] = search(context, False)
+                context_instances = rects[context]
                 
                 if context_instances:
                     context_rect = context_instances[0]
@@ -467,26 +562,93 @@ class PDFComparator:
                             best_instance = inst
                     
                     if best_instance and best_score < 500:
-                        try:
-                            annot = page.add_highlight_annot(best_instance)
-                            annot.set_colors(stroke=color)
-                            annot.update()
-                            return True
-                        except Exception:
-                            pass
+                        if self._add_highlight(page, best_instance, color):
+                            highlighted += 1
+                            continue
             
             # Fallback: highlight first instance
-            try:
-                annot = page.add_highlight_annot(value_instances[0])
-                annot.set_colors(stroke=color)
-                annot.update()
-                return True
-            except Exception:
-                pass
+            if self._add_highlight(page, value_instances[0], color):
+                highlighted += 1
+            else:
+                remaining_values.append(item)
         
-        return False
+        return highlighted, remaining_text, remaining_values
     
-    def compare_pdfs(self, old_pdf_bytes: bytes, new_pdf_bytes: bytes) -> dict:
+    def _highlight_all(self, doc: fitz.Document, text_items: list, value_items: list) -> int:
+        """
+        Highlight many items with as few page searches as possible.
+        
+        Each item is highlighted once, as by highlight_text_in_pdf and
+        highlight_value_with_context. Items with a page hint are looked for on
+        that page first; the rest, and hinted items not found there, are placed
+        on the first page where they are found in one pass over the document,
+        which stops once every item has been placed.
+        
+        Args:
+            text_items: (text, color, page_hint) triples, highlighted at their first instance
+            value_items: (value, context, color, page_hint) tuples, highlighted at the
+                instance closest to the context when it is on the same page
+            page_hint is a 1-based page number, or None/0 when unknown.
+        
+        Returns: number of items highlighted
+        """
+        pending_text = []
+        for text, color, page_hint in text_items:
+            text = str(text).strip() if text else ""
+            if len(text) >= 2 and not self._should_ignore(text):
+                pending_text.append((text, color, page_hint))
+        
+        pending_values = []
+        for value, context, color, page_hint in value_items:
+            value = str(value).strip() if value else ""
+            if value and not self._should_ignore(value):
+                pending_values.append((value, str(context).strip() if context else "", color, page_hint))
+        
+        highlighted = 0
+        
+        # Hinted items: only their own page is searched
+        hinted_pages = sorted({
+            item[-1] for item in pending_text + pending_values
+            if isinstance(item[-1], int) and 1 <= item[-1] <= len(doc)
+        })
+        for page_hint in hinted_pages:
+            count, text_left, values_left = self._place_on_page(
+                doc[page_hint - 1],
+                [item for item in pending_text if item[-1] == page_hint],
+                [item for item in pending_values if item[-1] == page_hint]
+            )
+            highlighted += count
+            pending_text = [item for item in pending_text if item[-1] != page_hint] + text_left
+            pending_values = [item for item in pending_values if item[-1] != page_hint] + values_left
+        
+        # Everything else: one pass over the pages
+        for page in doc:
+            if not pending_text and not pending_values:
+                break
+            count, pending_text, pending_values = self._place_on_page(page, pending_text, pending_values)
+            highlighted += count
+        
+        return highlighted
+    
+    def highlight_text_in_pdf(self, doc: fitz.Document, text: str, color: tuple,
+                              page_hint: int = None) -> bool:
+        """
+        Highlight specific text in the PDF. Returns True if successful.
+        
+        page_hint (1-based) is searched first; other pages only if it is missing there.
+        """
+        return self._highlight_all(doc, [(text, color, page_hint)], []) > 0
+    
+    def highlight_value_with_context(self, doc: fitz.Document, value: str, 
+                                      context: str, color: tuple, page_hint: int = None) -> bool:
+        """
+        Highlight a value using context to find the correct instance.
+        Context is typically the field name or nearby text.
+        page_hint (1-based) is searched first; other pages only if it is missing there.
+        """
+        return self._highlight_all(doc, [], [(value, context, color, page_hint)]) > 0
+    
+    def compare_pdfs(self, old_pdf_bytes: bytes, new_pdf_bytes: bytes, use_llm_cache: bool = True) -> dict:
         """
         Compare two PDF files and generate highlighted output.
         
@@ -496,6 +658,9 @@ class PDFComparator:
         
         Removed content is listed in changes but not highlighted 
         (since it doesn't exist in the new PDF).
+        
+        Re-comparing the same content reuses the cached LLM result; pass
+        use_llm_cache=False to force a fresh comparison.
         """
         # Extract content from both PDFs
         old_content = self.extract_content_structured(old_pdf_bytes)
@@ -506,38 +671,46 @@ class PDFComparator:
         new_formatted = self.format_content_for_comparison(new_content)
         
         # Get changes from LLM
-        changes = self.llm_client.compare_pdf_content(old_formatted, new_formatted)
+        changes = self.llm_client.compare_pdf_content(old_formatted, new_formatted, use_cache=use_llm_cache)
         
         # Open new PDF for highlighting
         doc = fitz.open(stream=new_pdf_bytes, filetype="pdf")
         
         # Highlight ADDED content (green)
+        added_items = []
         for item in changes.get("added", []):
             if isinstance(item, dict):
                 text = item.get("text", "")
                 if text:
-                    self.highlight_text_in_pdf(doc, text, self.colors.ADDED)
+                    added_items.append((text, self.colors.ADDED, item.get("page")))
             elif item:
-                self.highlight_text_in_pdf(doc, str(item), self.colors.ADDED)
+                added_items.append((str(item), self.colors.ADDED, None))
         
         # Highlight MODIFIED values (yellow) - only the new value
+        modified_items = []
         for item in changes.get("modified", []):
             if isinstance(item, dict):
                 new_val = item.get("new", "")
                 field = item.get("field", item.get("context", ""))
                 
                 if new_val:
-                    self.highlight_value_with_context(
-                        doc, str(new_val), str(field), self.colors.MODIFIED
-                    )
+                    modified_items.append((str(new_val), str(field), self.colors.MODIFIED, item.get("page")))
+        
+        # Repeated items (same text, or same value and field, on the same page) would
+        # only search again and stack a second annotation on the same spot
+        added_items = list(dict.fromkeys(added_items))
+        modified_items = list(dict.fromkeys(modified_items))
+        
+        # One pass over the pages places every highlight
+        self._highlight_all(doc, added_items, modified_items)
         
-        # Save result
-        output = io.BytesIO()
-        doc.save(output)
+        # Save result: straight to bytes, dropping unused and duplicate objects and
+        # compressing uncompressed streams
+        highlighted_pdf = doc.tobytes(garbage=4, deflate=True, deflate_images=True, deflate_fonts=True)
         doc.close()
         
         return {
-            "highlighted_pdf": output.getvalue(),
+            "highlighted_pdf": highlighted_pdf,
             "changes": changes
         }
     
@@ -556,3 +729,20 @@ class PDFComparator:
             parts.append(f"🟡 {modified} modified")
         
         return " | ".join(parts) if parts else "No changes detected"
+
+
+# Per-worker-process extraction state, set up once by _init_extract_worker
+_worker_doc = None
+_worker_comparator = None
+
+
+def _init_extract_worker(pdf_bytes: bytes):
+    """Worker-process initializer: open the PDF once for every block the worker extracts."""
+    global _worker_doc, _worker_comparator
+    _worker_doc = fitz.open(stream=pdf_bytes, filetype="pdf")
+    _worker_comparator = PDFComparator()  # No LLM client is built for extraction
+
+
+def _extract_page_block(start: int, end: int) -> list:
+    """Worker-process task: extract pages start..end-1 of the worker's PDF."""
+    return _worker_comparator._extract_pages(_worker_doc, start, end)